@@ -2,11 +2,12 @@
 import base64
 import pathlib
 import sys
+from typing import Optional
 from urllib.parse import quote
 
 import httpx
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import Response
+from fastapi.responses import FileResponse, Response
 import logging
 
 try:
@@ -17,16 +18,15 @@ except ModuleNotFoundError:
     if project_root_str not in sys.path:
         sys.path.insert(0, project_root_str)
     from app.config import settings
+from app.services.avatar_store import avatar_store
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-uvicorn_error_logger = logging.getLogger("uvicorn.error")
+_avatar_client: httpx.AsyncClient | None = None
 
 
 def emit_avatar_debug(message: str) -> None:
-    logger.warning(message)
-    uvicorn_error_logger.warning(message)
-    print(message, flush=True)
+    logger.debug(message)
 
 
 def build_fallback_avatar_svg(user_id: str) -> bytes:
@@ -53,10 +53,39 @@ def build_avatar_headers(cache_control: str, avatar_url: str) -> dict[str, str]:
         "Access-Control-Expose-Headers": "X-Avatar-Upstream-Url",
     }
 
-@router.get("/avatar")
-async def get_user_avatar(request: Request):
-    """Fetch avatar from SAP server-side and return image bytes directly."""
-    employee_id = request.query_params.get("EmployeeId") or "CNHUSUN"
+def build_avatar_request_headers() -> dict[str, str]:
+    request_headers = {"Accept": "*/*"}
+    if settings.BASIC_USERNAME and settings.BASIC_PASSWORD:
+        token = base64.b64encode(f"{settings.BASIC_USERNAME}:{settings.BASIC_PASSWORD}".encode("utf-8")).decode("ascii")
+        request_headers["Authorization"] = f"Basic {token}"
+    return request_headers
+
+
+def get_avatar_client() -> httpx.AsyncClient:
+    """Shared client for the SAP OData service, so repeated avatar loads reuse the connection."""
+    global _avatar_client
+    if _avatar_client is None or _avatar_client.is_closed:
+        _avatar_client = httpx.AsyncClient(timeout=settings.REQUEST_TIMEOUT, verify=settings.VERIFY_SSL)
+    return _avatar_client
+
+
+async def close_avatar_client() -> None:
+    global _avatar_client
+    if _avatar_client is not None:
+        await _avatar_client.aclose()
+        _avatar_client = None
+
+
+async def fetch_sap_avatar(employee_id: str) -> Optional[tuple[bytes, str]]:
+    """
+    Fetch a user's picture from SAP.
+
+    Args:
+        employee_id: SAP user ID
+
+    Returns:
+        Tuple of (content, media type), or None when SAP has no usable image
+    """
     encoded_employee_id = quote(employee_id, safe="")
     avatar_url = build_avatar_url(encoded_employee_id)
     debug_url_msg = (
@@ -65,34 +94,20 @@ async def get_user_avatar(request: Request):
     )
     emit_avatar_debug(debug_url_msg)
 
-    request_headers = {"Accept": "*/*"}
-    if settings.BASIC_USERNAME and settings.BASIC_PASSWORD:
-        token = base64.b64encode(f"{settings.BASIC_USERNAME}:{settings.BASIC_PASSWORD}".encode("utf-8")).decode("ascii")
-        request_headers["Authorization"] = f"Basic {token}"
-
     try:
-        async with httpx.AsyncClient(timeout=settings.REQUEST_TIMEOUT, verify=settings.VERIFY_SSL) as client:
-            response = await client.get(avatar_url, headers=request_headers)
-            debug_resp_msg = (
-                f"[AVATAR_DEBUG] upstream response: status={response.status_code}, "
-                f"content_type={response.headers.get('content-type', '')}, url={avatar_url}"
-            )
-            emit_avatar_debug(debug_resp_msg)
+        response = await get_avatar_client().get(avatar_url, headers=build_avatar_request_headers())
+        debug_resp_msg = (
+            f"[AVATAR_DEBUG] upstream response: status={response.status_code}, "
+            f"content_type={response.headers.get('content-type', '')}, url={avatar_url}"
+        )
+        emit_avatar_debug(debug_resp_msg)
     except httpx.RequestError as exc:
         logger.warning("Avatar request failed for %s: %s", employee_id, exc)
-        return Response(
-            content=build_fallback_avatar_svg(employee_id),
-            media_type="image/svg+xml",
-            headers=build_avatar_headers("public, max-age=300", avatar_url),
-        )
+        return None
 
     if response.status_code != 200:
         logger.warning("Avatar service returned status %s for %s", response.status_code, employee_id)
-        return Response(
-            content=build_fallback_avatar_svg(employee_id),
-            media_type="image/svg+xml",
-            headers=build_avatar_headers("public, max-age=300", avatar_url),
-        )
+        return None
 
     content_type = response.headers.get("content-type", "")
     if not content_type.lower().startswith("image/"):
@@ -101,20 +116,65 @@ async def get_user_avatar(request: Request):
             employee_id,
             content_type,
         )
+        return None
+
+    return response.content, content_type
+
+
+def choose_avatar_format(requested: Optional[str], accept: str) -> str:
+    """Explicit ``format`` wins; otherwise WebP when the Accept header lists it."""
+    if requested in ("webp", "jpeg"):
+        return requested
+    return "webp" if "image/webp" in accept.lower() else "jpeg"
+
+
+async def get_avatar_thumbnail(employee_id: str, size: Optional[int], fmt: str) -> Optional[dict]:
+    """Cached thumbnail for a user (see AvatarStore.get), or None to use the fallback SVG."""
+    return await avatar_store.get(employee_id, size, fmt, fetch_sap_avatar)
+
+
+@router.get("/avatar")
+async def get_user_avatar(request: Request, size: Optional[int] = None, format: Optional[str] = None):
+    """
+    Serve a user's avatar as a cached thumbnail.
+
+    Args:
+        size: Displayed edge length in device pixels; snapped to AVATAR_SIZES
+        format: "webp" or "jpeg"; negotiated from Accept when omitted
+    """
+    employee_id = request.query_params.get("EmployeeId") or "CNHUSUN"
+    avatar_url = build_avatar_url(quote(employee_id, safe=""))
+    fmt = choose_avatar_format(format, request.headers.get("accept", ""))
+
+    thumbnail = await get_avatar_thumbnail(employee_id, size, fmt)
+    if thumbnail is None:
         return Response(
             content=build_fallback_avatar_svg(employee_id),
             media_type="image/svg+xml",
             headers=build_avatar_headers("public, max-age=300", avatar_url),
         )
 
-    cache_control = response.headers.get("cache-control", "public, max-age=300")
-    return Response(
-        content=response.content,
-        media_type=content_type,
-        headers=build_avatar_headers(cache_control, avatar_url),
-    )
+    etag = thumbnail["etag"]
+    # URLs keyed by content (from /api/v1/bootstrap) never change meaning.
+    if request.query_params.get("avatarKey") == etag.strip('"'):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=300"
+    headers = build_avatar_headers(cache_control, avatar_url)
+    headers["ETag"] = etag
+    headers["Vary"] = "Accept"
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(thumbnail["path"], media_type=thumbnail["media_type"], headers=headers)
+
 
 @router.delete("/avatar")
-async def refresh_avatar():
-    """Kept for compatibility; no local cache in redirect mode."""
-    return {"message": "Avatar uses redirect mode; no local cache."}
\ No newline at end of file
+async def refresh_avatar(request: Request):
+    """Drop a user's cached thumbnails so the next request refetches them from SAP."""
+    employee_id = request.query_params.get("EmployeeId")
+    if not employee_id:
+        return {"message": "Pass EmployeeId to refresh a cached avatar."}
+    await avatar_store.invalidate(employee_id)
+    return {"message": f"Avatar cache cleared for {employee_id}."}
@@ -0,0 +1,117 @@
+"""Startup payload for the chat UI."""
+import asyncio
+import base64
+import logging
+import time
+from typing import Optional
+from urllib.parse import urlencode
+
+import orjson
+from fastapi import APIRouter
+
+from app.api.avatar import build_fallback_avatar_svg, choose_avatar_format, get_avatar_thumbnail
+from app.config import settings
+from app.responses import ORJSONResponse, content_etag
+from app.services.app_shell import app_shell
+from app.services.avatar_store import avatar_store
+from app.services.dify_client import dify_client
+from app.services.history_store import history_store
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+async def build_avatar_part(user: str, size: Optional[int], fmt: str) -> dict:
+    """Inline small thumbnails as a data URI; larger ones get a content-keyed URL the browser can cache."""
+    thumbnail = await get_avatar_thumbnail(user, size, fmt)
+    if thumbnail is None:
+        content, media_type = build_fallback_avatar_svg(user), "image/svg+xml"
+    elif thumbnail["bytes"] <= settings.BOOTSTRAP_AVATAR_INLINE_MAX_BYTES:
+        content, media_type = await asyncio.to_thread(thumbnail["path"].read_bytes), thumbnail["media_type"]
+    else:
+        params = urlencode({
+            "EmployeeId": user,
+            "size": avatar_store.snap_size(size),
+            "format": fmt,
+            "avatarKey": thumbnail["etag"].strip('"'),
+        })
+        return {"url": f"/api/v1/avatar?{params}", "inline": False}
+
+    encoded = base64.b64encode(content).decode("ascii")
+    return {"url": f"data:{media_type};base64,{encoded}", "inline": True}
+
+
+async def build_conversations_part(user: str, limit: int) -> dict:
+    """First conversation page plus the ETag the conversations endpoint would send for it."""
+    raw_conversations = await dify_client.get_conversations_raw(user=user, limit=limit)
+    conversations = orjson.loads(raw_conversations)
+    history_store.capture_conversations(user, conversations)
+    return {"page": conversations, "etag": content_etag(raw_conversations)}
+
+
+@router.get("/bootstrap")
+async def bootstrap(
+    user: str,
+    limit: int = 40,
+    avatar_size: Optional[int] = None,
+    avatar_format: Optional[str] = None
+):
+    """
+    Everything the UI needs on load, fetched concurrently.
+
+    Collapses the avatar, first conversation page and config requests into
+    one round trip, and pre-warms the Dify connection for the user's first
+    chat message. A failing part is reported under ``errors`` and set to
+    null; the UI falls back to its own request for it.
+
+    Args:
+        user: User identifier (SAP employee ID)
+        limit: Conversation page size
+        avatar_size: Displayed avatar edge length in device pixels
+        avatar_format: "webp" when the browser can decode it, otherwise "jpeg"
+
+    Returns:
+        avatar, conversations, config and errors
+    """
+    logger.info(f"=== API: BOOTSTRAP ===")
+    logger.info(f"User: {user}, Limit: {limit}")
+    started_at = time.monotonic()
+
+    avatar, conversations, warmed = await asyncio.gather(
+        build_avatar_part(user, avatar_size, choose_avatar_format(avatar_format, "")),
+        build_conversations_part(user, limit),
+        dify_client.warm_up(user),
+        return_exceptions=True
+    )
+
+    errors = {}
+    for name, result in (("avatar", avatar), ("conversations", conversations)):
+        if isinstance(result, Exception):
+            logger.error(f"Bootstrap {name} failed for {user}: {str(result)}")
+            metrics.incr(f"bootstrap_errors_total.{name}")
+            errors[name] = str(result)
+    if isinstance(warmed, Exception):
+        logger.warning(f"Bootstrap warm-up failed: {str(warmed)}")
+
+    elapsed = time.monotonic() - started_at
+    metrics.observe("bootstrap_seconds", elapsed)
+    logger.info(f"Bootstrap for {user} finished in {elapsed * 1000:.0f}ms (errors={list(errors)})")
+
+    return ORJSONResponse(
+        content={
+            "user": user,
+            "avatar": None if "avatar" in errors else avatar,
+            "conversations": None if "conversations" in errors else conversations,
+            "config": {
+                "conversation_page_size": limit,
+                "history_search_enabled": settings.HISTORY_STORE_ENABLED,
+                "suggest_enabled": settings.SUGGEST_ENABLED,
+                "service_worker_enabled": settings.SERVICE_WORKER_ENABLED,
+                "shell_version": app_shell.version if settings.SERVICE_WORKER_ENABLED else None,
+                "stream_heartbeat_interval_seconds": settings.STREAM_HEARTBEAT_INTERVAL_SECONDS,
+            },
+            "errors": errors,
+        },
+        headers={"Cache-Control": "private, no-store"}
+    )
@@ -1,16 +1,56 @@
 """Chat API endpoints."""
 import asyncio
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse
+import orjson
+from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
 from app.models.schemas import ChatRequest, ChatResponse, ErrorResponse, ConversationDeleteRequest, MessageFeedbackRequest
+from app.config import settings
 from app.services.dify_client import dify_client
+from app.services.feedback_queue import feedback_queue
+from app.services.history_store import history_store
+from app.services.inflight import InflightRegistry, inflight_streams
+from app.services.metrics import metrics
+from app.services.tracing import ensure_trace_id, tracer
+from app.services.diagnostics import stream_buffers
+from app.services.render_cache import render_cache
+from app.services.suggestions import suggestion_index
+from app.responses import ORJSONResponse, content_etag, dumps_json
 import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-STREAM_HEARTBEAT_INTERVAL_SECONDS = 15
+# WebSocket subprotocols for /chat/ws. Clients that offer none get the JSON envelope.
+WS_PROTOCOL_JSON = "easymes.json"
+# Binary frames: one tag byte followed by the UTF-8 payload. Chunk payloads are the
+# event JSON exactly as produced by the Dify client, so nothing is re-encoded per token.
+WS_PROTOCOL_FRAMES = "easymes.frames.v1"
+WS_SUBPROTOCOLS = (WS_PROTOCOL_FRAMES, WS_PROTOCOL_JSON)
+WS_FRAME_CHUNK = b"c"
+WS_FRAME_ERROR = b"e"
+WS_FRAME_DONE = b"d"
+
+
+def conditional_json_response(request: Request, payload: Union[dict, bytes]) -> Response:
+    """
+    Serialize payload with a content-derived ETag and honour If-None-Match.
+
+    The browser cache renders its stored copy first and revalidates with the
+    ETag, so an unchanged list or page costs a bodyless 304. Already-encoded
+    upstream bytes are hashed and sent as-is.
+    """
+    body = payload if isinstance(payload, bytes) else dumps_json(payload)
+    etag = content_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        metrics.incr("conditional_not_modified_total")
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(content=body, headers=headers)
 
 
 def build_stream_error_payload(error_msg: str) -> dict:
@@ -79,6 +119,29 @@ def build_stream_error_payload(error_msg: str) -> dict:
     }
 
 
+def choose_ws_subprotocol(offered: List[str]) -> Optional[str]:
+    """Pick the first supported subprotocol in the client's order of preference."""
+    for protocol in offered:
+        if protocol in WS_SUBPROTOCOLS:
+            return protocol
+    return None
+
+
+async def send_ws_chunk(websocket: WebSocket, protocol: Optional[str], chunk: str) -> None:
+    if protocol == WS_PROTOCOL_FRAMES:
+        await websocket.send_bytes(WS_FRAME_CHUNK + chunk.encode("utf-8"))
+    else:
+        # Splice the already-encoded event into the envelope instead of parsing and re-dumping it
+        await websocket.send_text('{"type":"chunk","data":' + chunk + '}')
+
+
+async def send_ws_error(websocket: WebSocket, protocol: Optional[str], message: str) -> None:
+    if protocol == WS_PROTOCOL_FRAMES:
+        await websocket.send_bytes(WS_FRAME_ERROR + message.encode("utf-8"))
+    else:
+        await websocket.send_json({"type": "error", "message": message})
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
@@ -90,6 +153,7 @@ async def chat(request: ChatRequest):
     Returns:
         Chat response with answer and conversation_id
     """
+    trace_id = ensure_trace_id(request.trace_id)
     try:
         logger.info(f"=== CHAT API REQUEST ===")
         logger.info(f"Query: '{request.query}'")
@@ -97,17 +161,21 @@ async def chat(request: ChatRequest):
         logger.info(f"Conversation ID: {request.conversation_id}")
         logger.info(f"Trace ID: {request.trace_id}")
         logger.info(f"Inputs: {request.inputs}")
+        tracer.record(trace_id, "request_received", mode="blocking", user=request.user)
+        if settings.SUGGEST_ENABLED:
+            suggestion_index.record(request.user, request.query)
         
         response = await dify_client.send_message(
             query=request.query,
             user=request.user,
             conversation_id=request.conversation_id,
             inputs=request.inputs,
-            trace_id=request.trace_id
+            trace_id=trace_id
         )
         
         logger.info(f"=== CHAT API RESPONSE ===")
         logger.info(f"Dify Response: {json.dumps(response, ensure_ascii=False, indent=2)}")
+        tracer.finish(trace_id, "response_sent")
         
         return ChatResponse(
             answer=response.get("answer", ""),
@@ -117,6 +185,7 @@ async def chat(request: ChatRequest):
         )
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
+        tracer.finish(trace_id, "error", error=str(e)[:200])
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -137,72 +206,87 @@ async def chat_stream(request: ChatRequest):
     logger.info(f"Conversation ID: {request.conversation_id}")
     logger.info(f"Trace ID: {request.trace_id}")
     logger.info(f"Inputs: {request.inputs}")
+    trace_id = ensure_trace_id(request.trace_id)
+    tracer.record(trace_id, "request_received", mode="stream", user=request.user)
     
-    async def event_generator():
-        chunk_count = 0
-        queue: asyncio.Queue = asyncio.Queue()
-        stream_done = asyncio.Event()
-
-        async def producer():
-            nonlocal chunk_count
-            try:
-                async for chunk in dify_client.stream_message(
-                    query=request.query,
-                    user=request.user,
-                    conversation_id=request.conversation_id,
-                    inputs=request.inputs,
-                    trace_id=request.trace_id
-                ):
-                    chunk_count += 1
-                    logger.info(f"=== STREAM CHUNK {chunk_count} ===")
-                    logger.info(f"Chunk: {chunk}")
-                    await queue.put(("chunk", chunk))
-            except Exception as e:
-                await queue.put(("error", e))
-            finally:
-                stream_done.set()
+    if settings.INFLIGHT_DEDUP_ENABLED:
+        dedup_key = InflightRegistry.make_key(
+            request.user, request.conversation_id, request.query, request.inputs, request.stream_format
+        )
+    else:
+        dedup_key = f"trace:{trace_id}"
 
-        producer_task = asyncio.create_task(producer())
+    async def event_generator():
+        forwarded_count = 0
+        # Identical requests (double clicks, a second iframe) share one upstream stream
+        queue, inflight, attached = inflight_streams.subscribe(
+            dedup_key,
+            trace_id,
+            lambda: dify_client.stream_message(
+                query=request.query,
+                user=request.user,
+                conversation_id=request.conversation_id,
+                inputs=request.inputs,
+                trace_id=trace_id,
+                stream_format=request.stream_format
+            )
+        )
+        if attached:
+            tracer.record(trace_id, "deduplicated", leader=inflight.trace_id)
+        elif settings.SUGGEST_ENABLED:
+            # A duplicate submission does not count as asking again
+            suggestion_index.record(request.user, request.query)
+        stream_buffers.register(trace_id, queue, request.user)
 
         try:
             while True:
-                if stream_done.is_set() and queue.empty():
-                    break
-
                 try:
                     kind, payload = await asyncio.wait_for(
                         queue.get(),
-                        timeout=STREAM_HEARTBEAT_INTERVAL_SECONDS
+                        timeout=settings.STREAM_HEARTBEAT_INTERVAL_SECONDS
                     )
                 except asyncio.TimeoutError:
+                    # Upstream deadlines are enforced by dify_client; the heartbeat
+                    # only keeps proxies and the browser from closing an idle stream.
+                    metrics.incr("chat_stream_heartbeat_total")
+                    tracer.record(trace_id, "heartbeat")
                     heartbeat_data = json.dumps({"event": "ping"})
                     yield f"data: {heartbeat_data}\n\n"
                     continue
 
+                if kind == "done":
+                    break
                 if kind == "chunk":
+                    forwarded_count += 1
+                    logger.info(f"=== STREAM CHUNK {forwarded_count} ===")
+                    logger.info(f"Chunk: {payload}")
                     yield f"data: {payload}\n\n"
+                    # The first chunk is our own trace_context; the second is the first upstream event.
+                    if forwarded_count == 2:
+                        tracer.record(trace_id, "first_event_forwarded")
                 elif kind == "error":
                     raise payload
+            tracer.finish(trace_id, "stream_end", events=forwarded_count)
         except Exception as e:
             error_msg = str(e).strip() or repr(e)
+            tracer.finish(trace_id, "stream_error", events=forwarded_count, error=error_msg[:200])
+            metrics.incr("chat_stream_error_total")
             logger.error(f"Stream error: {error_msg}")
             logger.error(f"Full error details: {repr(e)}")
             error_data = json.dumps(build_stream_error_payload(error_msg), ensure_ascii=False)
             yield f"data: {error_data}\n\n"
         finally:
-            if not producer_task.done():
-                producer_task.cancel()
-                try:
-                    await producer_task
-                except asyncio.CancelledError:
-                    pass
+            # No-op when the stream already ended; otherwise the client went away mid-stream.
+            tracer.finish(trace_id, "stream_cancelled", events=forwarded_count)
+            stream_buffers.unregister(trace_id)
+            inflight_streams.unsubscribe(inflight, queue)
     
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
+        # No Connection header: it is invalid over HTTP/2, and HTTP/1.1 keeps the connection open anyway
         headers={
             "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
         }
     )
 
@@ -212,11 +296,18 @@ async def chat_websocket(websocket: WebSocket):
     """
     WebSocket endpoint for real-time chat.
     
-    Client sends JSON: {"query": "message", "conversation_id": "optional", "user": "user-id"}
+    Client sends JSON: {"query": "message", "conversation_id": "optional", "user": "user-id",
+    "stream_format": "optional, compact"}
     Server sends JSON: {"type": "chunk", "data": {...}} or {"type": "error", "message": "..."}
+
+    With the ``easymes.frames.v1`` subprotocol the server sends binary frames
+    instead: ``c`` + event JSON per chunk, ``e`` + message on errors and a
+    bare ``d`` when a reply is complete (see static/chat-ws.js).
     """
-    await websocket.accept()
-    logger.info("WebSocket connection established")
+    protocol = choose_ws_subprotocol(websocket.scope.get("subprotocols") or [])
+    await websocket.accept(subprotocol=protocol)
+    metrics.incr(f"ws_sessions_total.{protocol or 'legacy'}")
+    logger.info(f"WebSocket connection established (subprotocol: {protocol or 'none'})")
     
     try:
         while True:
@@ -230,42 +321,38 @@ async def chat_websocket(websocket: WebSocket):
             inputs = request_data.get("inputs", {})
             
             if not query:
-                await websocket.send_json({
-                    "type": "error",
-                    "message": "Query is required"
-                })
+                await send_ws_error(websocket, protocol, "Query is required")
                 continue
 
             if not employee_id:
-                await websocket.send_json({
-                    "type": "error",
-                    "message": "User identifier is required"
-                })
+                await send_ws_error(websocket, protocol, "User identifier is required")
                 continue
             
             # Stream response back to client
+            trace_id = ensure_trace_id(request_data.get("trace_id"))
+            tracer.record(trace_id, "request_received", mode="websocket", user=employee_id)
+            if settings.SUGGEST_ENABLED:
+                suggestion_index.record(employee_id, query)
             try:
                 async for chunk in dify_client.stream_message(
                     query=query,
                     user=employee_id,
                     conversation_id=conversation_id,
-                    inputs=inputs
+                    inputs=inputs,
+                    trace_id=trace_id,
+                    stream_format=request_data.get("stream_format")
                 ):
-                    try:
-                        chunk_data = json.loads(chunk)
-                        await websocket.send_json({
-                            "type": "chunk",
-                            "data": chunk_data
-                        })
-                    except json.JSONDecodeError:
-                        logger.warning(f"Failed to parse chunk: {chunk}")
-                        
+                    await send_ws_chunk(websocket, protocol, chunk)
+                tracer.finish(trace_id, "stream_end")
+                if protocol == WS_PROTOCOL_FRAMES:
+                    await websocket.send_bytes(WS_FRAME_DONE)
+
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 logger.error(f"Error streaming message: {str(e)}")
-                await websocket.send_json({
-                    "type": "error",
-                    "message": str(e)
-                })
+                tracer.finish(trace_id, "stream_error", error=str(e)[:200])
+                await send_ws_error(websocket, protocol, str(e))
                 
     except WebSocketDisconnect:
         logger.info("WebSocket connection closed")
@@ -279,6 +366,7 @@ async def chat_websocket(websocket: WebSocket):
 
 @router.get("/conversations")
 async def get_conversations(
+    request: Request,
     user: str,
     last_id: str = None,
     limit: int = 20,
@@ -300,31 +388,42 @@ async def get_conversations(
         logger.info(f"=== API: GET CONVERSATIONS ===")
         logger.info(f"User: {user}, Limit: {limit}, Sort by: {sort_by}")
         
-        conversations = await dify_client.get_conversations(
+        raw_conversations = await dify_client.get_conversations_raw(
             user=user,
             last_id=last_id,
             limit=limit,
             sort_by=sort_by
         )
+        conversations = orjson.loads(raw_conversations)
         
         logger.info(f"=== API: RETURNING CONVERSATIONS ===")
         logger.info(f"Total conversations: {len(conversations.get('data', []))}")
         logger.info(f"Has more: {conversations.get('has_more', False)}")
+
+        history_store.capture_conversations(user, conversations)
         
-        return conversations
+        return conditional_json_response(request, raw_conversations)
     except Exception as e:
         logger.error(f"Error getting conversations: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/conversations/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: str, user: str):
+async def get_conversation_messages(
+    request: Request,
+    conversation_id: str,
+    user: str,
+    first_id: str = None,
+    limit: int = 20
+):
     """
     Get messages for a specific conversation.
     
     Args:
         conversation_id: Conversation ID
         user: User identifier
+        first_id: Optional oldest loaded message ID, returns the page before it
+        limit: Number of records to return (default 20, max 100)
         
     Returns:
         List of messages in the conversation
@@ -332,19 +431,35 @@ async def get_conversation_messages(conversation_id: str, user: str):
     try:
         logger.info(f"=== API: GET CONVERSATION MESSAGES ===")
         logger.info(f"Conversation ID: {conversation_id}")
-        logger.info(f"User: {user}")
+        logger.info(f"User: {user}, First ID: {first_id}, Limit: {limit}")
+
+        local_messages = await history_store.get_messages(
+            conversation_id=conversation_id,
+            user=user,
+            first_id=first_id,
+            limit=limit
+        )
+        if local_messages is not None:
+            logger.info(f"=== API: RETURNING LOCAL MESSAGES ({len(local_messages['data'])}) ===")
+            if settings.RENDER_HISTORY_ENABLED:
+                local_messages = await render_cache.annotate(local_messages)
+            return conditional_json_response(request, local_messages)
         
         messages = await dify_client.get_conversation_messages(
             conversation_id=conversation_id,
-            user=user
+            user=user,
+            first_id=first_id,
+            limit=limit
         )
+        history_store.capture_messages_page(conversation_id, user, messages, first_id=first_id)
         
         logger.info(f"=== API: RETURNING MESSAGES ===")
         logger.info(f"Total messages: {len(messages.get('data', []))}")
         logger.info(f"Has more: {messages.get('has_more', False)}")
-        logger.info(f"Full response: {json.dumps(messages, ensure_ascii=False, indent=2)}")
-        
-        return messages
+
+        if settings.RENDER_HISTORY_ENABLED:
+            messages = await render_cache.annotate(messages)
+        return conditional_json_response(request, messages)
     except Exception as e:
         logger.error(f"Error getting conversation messages: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -371,6 +486,7 @@ async def delete_conversation(conversation_id: str, request: ConversationDeleteR
             conversation_id=conversation_id,
             user=request.user
         )
+        history_store.delete_conversation(conversation_id)
 
         return {"result": "success"}
     except Exception as e:
@@ -378,32 +494,86 @@ async def delete_conversation(conversation_id: str, request: ConversationDeleteR
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/messages/{message_id}/feedbacks")
+@router.post("/messages/{message_id}/feedbacks", status_code=202)
 async def message_feedback(message_id: str, request: MessageFeedbackRequest):
     """
-    Submit feedback for a specific message.
+    Accept feedback for a specific message.
+
+    The feedback is queued and delivered to Dify in the background, so the
+    response never waits on Dify latency.
 
     Args:
         message_id: Message ID
         request: Feedback request body
 
     Returns:
-        Feedback result
+        Acceptance result
     """
-    try:
-        logger.info(f"=== API: MESSAGE FEEDBACK ===")
-        logger.info(f"Message ID: {message_id}")
-        logger.info(f"Rating: {request.rating}")
-        logger.info(f"User: {request.user}")
+    logger.info(f"=== API: MESSAGE FEEDBACK ===")
+    logger.info(f"Message ID: {message_id}")
+    logger.info(f"Rating: {request.rating}")
+    logger.info(f"User: {request.user}")
 
-        result = await dify_client.message_feedback(
-            message_id=message_id,
-            rating=request.rating,
-            user=request.user,
-            content=request.content
-        )
+    feedback_queue.submit(
+        message_id=message_id,
+        user=request.user,
+        rating=request.rating,
+        content=request.content
+    )
+    history_store.set_feedback(message_id, request.rating)
+
+    return {"result": "accepted"}
+
+
+@router.get("/search")
+async def search_messages(q: str, user: str, limit: int = 20):
+    """
+    Full-text search over the user's locally mirrored questions and answers.
+
+    Args:
+        q: Search text, whitespace-separated terms must all match
+        user: User identifier
+        limit: Max number of hits (default 20, max 100)
 
-        return result
+    Returns:
+        Matching messages, newest first
+    """
+    if not history_store.available:
+        raise HTTPException(status_code=503, detail="History store is disabled")
+
+    try:
+        logger.info(f"=== API: SEARCH ===")
+        logger.info(f"User: {user}, Query: '{q}', Limit: {limit}")
+
+        hits = await history_store.search(user=user, query=q, limit=min(max(limit, 1), 100))
+        return {"data": hits, "query": q}
     except Exception as e:
-        logger.error(f"Error submitting message feedback: {str(e)}")
+        logger.error(f"Error searching messages: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/suggest")
+async def suggest_queries(prefix: str, user: Optional[str] = None, limit: int = 8):
+    """
+    Suggest questions starting with the typed prefix (called on every keystroke).
+
+    Args:
+        prefix: Text typed so far
+        user: User identifier; their own past questions are listed first
+        limit: Max number of suggestions (default 8, max 20)
+
+    Returns:
+        Suggestions as {"text", "scope"} where scope is "user" or "global"
+    """
+    if not settings.SUGGEST_ENABLED:
+        raise HTTPException(status_code=503, detail="Query suggestions are disabled")
+
+    started_at = time.perf_counter()
+    suggestions = suggestion_index.suggest(user, prefix, limit=min(max(limit, 1), 20))
+    metrics.observe("suggest_seconds", time.perf_counter() - started_at)
+    logger.debug(f"Suggest for {user}: '{prefix}' -> {len(suggestions)}")
+
+    return ORJSONResponse(
+        content={"prefix": prefix, "suggestions": suggestions},
+        headers={"Cache-Control": "private, max-age=30"}
+    )
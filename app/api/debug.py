@@ -0,0 +1,132 @@
+"""Diagnostics endpoints."""
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.config import settings
+from app.services.diagnostics import memory_tracker, process_memory, profiler, stream_buffers
+from app.services.inflight import inflight_streams
+from app.services.tracing import tracer
+from app.services.workflow_stats import workflow_stats
+
+router = APIRouter()
+
+MAX_PROFILE_SECONDS = 60.0
+
+
+def require_debug_token(authorization: Optional[str] = Header(None)) -> None:
+    """Allow the request only with ``Authorization: Bearer <DEBUG_API_TOKEN>``."""
+    if not settings.DEBUG_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip(), settings.DEBUG_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid debug token")
+
+
+@router.get("/workflow-stats", dependencies=[Depends(require_debug_token)])
+async def get_workflow_stats():
+    """
+    Dify workflow node latency over the sliding window.
+
+    Returns:
+        p50/p95/p99/max (seconds) and failure counts per node title and per
+        node type, slowest p95 first
+    """
+    return workflow_stats.snapshot()
+
+
+@router.get("/workflow-stats/traces/{trace_id}", dependencies=[Depends(require_debug_token)])
+async def get_workflow_timeline(trace_id: str):
+    """
+    Node timeline of one recent trace.
+
+    Args:
+        trace_id: Trace ID sent to Dify with the chat request
+
+    Returns:
+        Finished nodes with start offset (relative to the first node) and duration
+    """
+    timeline = workflow_stats.get_timeline(trace_id)
+    if timeline is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return timeline
+
+
+@router.get("/traces/{trace_id}", dependencies=[Depends(require_debug_token)])
+async def get_trace(trace_id: str):
+    """
+    Span timeline of one recent request.
+
+    Args:
+        trace_id: Trace ID (returned to the browser in the trace_context event)
+
+    Returns:
+        Spans with offset from the first span and the gap before each one,
+        plus the Dify workflow node timeline when the app is a workflow
+    """
+    trace = tracer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    trace["workflow_nodes"] = (workflow_stats.get_timeline(trace_id) or {}).get("nodes", [])
+    return trace
+
+
+@router.get("/profile", dependencies=[Depends(require_debug_token)])
+async def profile(seconds: float = 10.0, mode: str = "sample", interval_ms: float = 5.0, include_idle: bool = False):
+    """
+    Profile the event loop for a few seconds.
+
+    Args:
+        seconds: Capture duration (max 60)
+        mode: "sample" for collapsed stacks (flamegraph.pl / speedscope input),
+            "cprofile" for a pstats report sorted by cumulative time
+        interval_ms: Sampling interval for mode=sample
+        include_idle: Keep samples where the loop is waiting for I/O
+
+    Returns:
+        Plain-text profile
+    """
+    if mode not in ("sample", "cprofile"):
+        raise HTTPException(status_code=400, detail="mode must be sample or cprofile")
+    if profiler.busy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    if mode == "cprofile":
+        return PlainTextResponse(await profiler.capture_cprofile(seconds))
+    interval = min(max(interval_ms, 1.0), 100.0) / 1000.0
+    return PlainTextResponse(await profiler.capture_collapsed(seconds, interval, include_idle))
+
+
+@router.get("/memory", dependencies=[Depends(require_debug_token)])
+async def memory(action: str = "report", limit: int = 25, group_by: str = "lineno", reset_baseline: bool = False):
+    """
+    Memory snapshot of the process.
+
+    Args:
+        action: "start" begins tracemalloc and takes the baseline, "report"
+            diffs a new snapshot against it, "stop" ends tracing
+        limit: Number of allocation sites in the diff
+        group_by: "lineno", "filename" or "traceback"
+        reset_baseline: Use this report's snapshot as the next baseline
+
+    Returns:
+        Process memory, live chat stream buffers, the replay buffers of
+        shared in-flight streams and the tracemalloc diff
+    """
+    if action not in ("start", "report", "stop"):
+        raise HTTPException(status_code=400, detail="action must be start, report or stop")
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+
+    if action == "start":
+        memory_tracker.start()
+    elif action == "stop":
+        memory_tracker.stop()
+
+    return {
+        "process": process_memory(),
+        "chat_streams": stream_buffers.snapshot(),
+        "inflight_streams": inflight_streams.snapshot(),
+        "tracemalloc": memory_tracker.report(limit=max(1, min(limit, 200)), group_by=group_by, reset_baseline=reset_baseline),
+    }
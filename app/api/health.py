@@ -2,6 +2,15 @@
 from fastapi import APIRouter
 from app.models.schemas import HealthResponse
 from app.config import settings
+from app.services.metrics import metrics
+from app.services.feedback_queue import feedback_queue
+from app.services.dify_client import dify_client
+from app.services.avatar_store import avatar_store
+from app.logging_config import log_pipeline
+from app.services.inflight import inflight_streams
+from app.services.render_cache import render_cache
+from app.services.suggestions import suggestion_index
+from app.services.traffic_capture import traffic_capture
 
 router = APIRouter()
 
@@ -13,3 +22,18 @@ async def health_check():
         status="healthy",
         dify_api_url=settings.DIFY_API_URL
     )
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Expose in-process counters and upstream timing percentiles."""
+    snapshot = metrics.snapshot()
+    snapshot["feedback_queue"] = feedback_queue.stats()
+    snapshot["dify_upstreams"] = dify_client.pool.stats()
+    snapshot["avatar_store"] = avatar_store.stats()
+    snapshot["render_cache"] = render_cache.stats()
+    snapshot["inflight_streams"] = inflight_streams.stats()
+    snapshot["logging"] = log_pipeline.stats()
+    snapshot["suggestions"] = suggestion_index.stats()
+    snapshot["traffic_capture"] = traffic_capture.stats()
+    return snapshot
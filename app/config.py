@@ -1,6 +1,7 @@
 """Application configuration management."""
+import json
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Any, Dict, List
 
 
 class Settings(BaseSettings):
@@ -10,12 +11,94 @@ class Settings(BaseSettings):
     DIFY_API_URL: str = "https://test.nas-save.abb.com/v1"
     DIFY_API_KEY: str
     VERIFY_SSL: bool = False  # Set to False to disable SSL verification for self-signed certificates
-    DIFY_TIMEOUT_SECONDS: float = 120.0
+    DIFY_TIMEOUT_SECONDS: float = 120.0  # Read timeout for blocking chat-messages calls
+    DIFY_REQUEST_TIMEOUT_SECONDS: float = 30.0  # Conversations / messages / feedback calls
+    DIFY_CONNECT_TIMEOUT_SECONDS: float = 10.0
+
+    # Streaming deadlines (seconds)
+    DIFY_FIRST_EVENT_TIMEOUT_SECONDS: float = 30.0  # Request sent -> first SSE event
+    DIFY_IDLE_TIMEOUT_SECONDS: float = 45.0  # Max gap between two SSE events (Dify pings every ~10s)
+    DIFY_STREAM_MAX_DURATION_SECONDS: float = 300.0  # Hard cap for one streamed answer
+    STREAM_HEARTBEAT_INTERVAL_SECONDS: float = 15.0  # Downstream keep-alive ping interval
+    INFLIGHT_DEDUP_ENABLED: bool = True  # Identical concurrent /chat/stream requests share one upstream stream
+    INFLIGHT_DEDUP_WINDOW_SECONDS: float = 0.0  # Opt-in: replay a completed stream to duplicates this long (1-2s); 0 = running streams only
+
+    # Shared Dify connection pool
+    DIFY_MAX_CONNECTIONS: int = 100
+    DIFY_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    DIFY_KEEPALIVE_EXPIRY_SECONDS: float = 30.0  # Idle pooled connections (incl. bootstrap pre-warm) live this long
+
+    # Multiple Dify upstreams as a JSON list; empty = single upstream from DIFY_API_URL/DIFY_API_KEY.
+    # Entries: {"name", "url", "api_key" (default DIFY_API_KEY), "group" (default name), "weight" (default 1)}.
+    # Upstreams sharing a group are replicas of one Dify deployment; each upstream gets its own pool.
+    DIFY_UPSTREAMS: str = ""
+    UPSTREAM_EJECT_AFTER_FAILURES: int = 3  # Consecutive connect/timeout/429/5xx failures before ejection
+    UPSTREAM_EJECT_SECONDS: float = 30.0
+    UPSTREAM_AFFINITY_MAX_ENTRIES: int = 100000  # Conversation/message ID -> owning group (LRU)
+
+    # Feedback queue
+    FEEDBACK_SPOOL_PATH: str = "data/feedback_spool.json"  # Undelivered feedback survives restarts here
+    FEEDBACK_CONCURRENCY: int = 4  # Max concurrent feedback calls to Dify
+    FEEDBACK_FLUSH_INTERVAL_SECONDS: float = 1.0
+    FEEDBACK_MAX_ATTEMPTS: int = 8  # Dropped (and logged) after this many failed deliveries
+
+    # Local history mirror (SQLite + FTS5)
+    HISTORY_STORE_ENABLED: bool = True
+    HISTORY_DB_PATH: str = "data/history.db"
+
+    # Workflow node timing (node_started / node_finished)
+    WORKFLOW_STATS_WINDOW_SECONDS: float = 3600.0  # Sliding window for per-node percentiles
+    WORKFLOW_STATS_MAX_TRACES: int = 500  # Recent traces whose node timelines are kept
+
+    # Server-side rendering of history answers (HTML + chart config, shipped with /messages)
+    RENDER_HISTORY_ENABLED: bool = True
+    RENDER_CACHE_MAX_CHARS: int = 8000000  # In-memory LRU bound (HTML characters)
+    RENDER_CACHE_SPILL_DIR: str = "data/render_cache"  # Evicted entries are kept here; empty = memory only
+    RENDER_CACHE_SPILL_MAX_FILES: int = 20000
+
+    # Query suggestions (GET /api/v1/suggest), learned from asked questions
+    SUGGEST_ENABLED: bool = True
+    SUGGEST_SNAPSHOT_PATH: str = "data/suggestions.json"  # Index survives restarts here; empty = memory only
+    SUGGEST_HALF_LIFE_DAYS: float = 14.0  # A query's weight halves after this long without being asked
+    SUGGEST_MAX_USER_ENTRIES: int = 500  # Per user; the lowest-ranked query is evicted beyond this
+    SUGGEST_MAX_GLOBAL_ENTRIES: int = 5000
+    SUGGEST_GLOBAL_MIN_USERS: int = 2  # Distinct users before a query is suggested to everyone
+    SUGGEST_SNAPSHOT_INTERVAL_SECONDS: float = 300.0
+
+    # Request tracing (GET /debug/traces/{trace_id})
+    TRACE_MAX_TRACES: int = 1000  # Recent traces kept in memory
+    TRACE_EXPORT_PATH: str = ""  # Append finished traces as JSON lines here; empty = off
+
+    # Upstream traffic capture for replay (scripts/replay_capture.py)
+    CAPTURE_DIR: str = ""  # Sampled Dify SSE sessions as gzip JSONL, one file per day; empty = off
+    CAPTURE_SAMPLE_RATE: float = 0.05  # Fraction of streams captured
+    CAPTURE_REDACT_SALT: str = ""  # Salt for hashed user IDs; required, capture stays off while it is empty
+    CAPTURE_MAX_SESSION_BYTES: int = 2000000  # Longer sessions are cut off and marked truncated
+    CAPTURE_MAX_PENDING: int = 200  # Sessions waiting for the writer; more are dropped and counted
+
+    # Response compression (gzip always; brotli when the optional package is installed)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # Smaller single-chunk responses are sent as-is
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 0-11; 4 is close to gzip speed with a better ratio
     
     # Application Configuration
     APP_HOST: str = "0.0.0.0"
     APP_PORT: int = 8010
     APP_DEBUG: bool = False
+    DEBUG_API_TOKEN: str = ""  # Bearer token for all /debug endpoints; empty disables them
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # "text" or "json" (one JSON object per line)
+    LOG_QUEUE_SIZE: int = 10000  # Records buffered for the writer thread; overflow is dropped and counted
+    WS_PER_MESSAGE_DEFLATE: bool = True  # Offer permessage-deflate on /chat/ws (python -m app.main only)
+
+    # Server used by python -m app.main: "uvicorn" (HTTP/1.1) or "hypercorn" (HTTP/2)
+    APP_SERVER: str = "uvicorn"
+    TLS_CERT_FILE: str = ""  # Hypercorn: with TLS_KEY_FILE, serve TLS with ALPN h2; empty = cleartext h2c
+    TLS_KEY_FILE: str = ""
+    H2_MAX_CONCURRENT_STREAMS: int = 256  # Per connection; each open chat keeps one SSE stream
+    H2_MAX_INBOUND_FRAME_SIZE: int = 65536
+    SERVER_KEEP_ALIVE_SECONDS: float = 75.0  # Idle connection timeout; keep above the proxy's
     
     # CORS Configuration
     ALLOWED_ORIGINS: str = "*"
@@ -25,6 +108,19 @@ class Settings(BaseSettings):
     BASIC_USERNAME: str = ""
     BASIC_PASSWORD: str = ""
     REQUEST_TIMEOUT: int = 600
+
+    # Avatar thumbnails (resized/transcoded when Pillow is installed, original bytes otherwise)
+    AVATAR_CACHE_DIR: str = "data/avatars"  # Content-addressed blobs + per-user index, kept across restarts
+    AVATAR_SIZES: str = "48,96,144"  # Edge lengths in pixels; requests snap up to the next size
+    AVATAR_REFRESH_SECONDS: float = 86400.0  # Older entries are served while SAP is re-read in the background
+    AVATAR_MISSING_TTL_SECONDS: float = 300.0  # Users without a SAP picture get the fallback without a SAP call; 0 disables
+    AVATAR_WEBP_QUALITY: int = 80
+    AVATAR_JPEG_QUALITY: int = 85
+    BOOTSTRAP_AVATAR_INLINE_MAX_BYTES: int = 32768  # /api/v1/bootstrap inlines smaller avatars as data URIs
+
+    # Service worker (/sw.js): cache-first app shell and browser-side avatar cache
+    SERVICE_WORKER_ENABLED: bool = True  # False makes open pages unregister an installed worker
+    SW_AVATAR_TTL_SECONDS: float = 86400.0
     
     class Config:
         env_file = ".env"
@@ -37,6 +133,21 @@ class Settings(BaseSettings):
             return ["*"]
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
 
+    @property
+    def avatar_sizes(self) -> List[int]:
+        """Parse AVATAR_SIZES from a comma-separated string."""
+        return [int(size) for size in self.AVATAR_SIZES.split(",") if size.strip()]
+
+    @property
+    def dify_upstreams(self) -> List[Dict[str, Any]]:
+        """Parse DIFY_UPSTREAMS into a list of upstream definitions."""
+        if not self.DIFY_UPSTREAMS.strip():
+            return []
+        upstreams = json.loads(self.DIFY_UPSTREAMS)
+        if not isinstance(upstreams, list) or not all(isinstance(u, dict) and u.get("url") for u in upstreams):
+            raise ValueError("DIFY_UPSTREAMS must be a JSON list of objects with a url")
+        return upstreams
+
 
 # Global settings instance
 settings = Settings()
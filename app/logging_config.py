@@ -0,0 +1,142 @@
+"""Non-blocking logging: records are queued and written by a background thread."""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Attributes every LogRecord has (plus uvicorn's ANSI copy of the message); anything else
+# was passed via ``extra=`` and goes into JSON output.
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "color_message"}
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per line, for container log collectors."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller.
+
+    When the bounded queue is full the record is dropped and counted; the
+    next record that fits is preceded by a warning with the number lost.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        with self._lock:
+            if self._unreported:
+                notice = logging.LogRecord(
+                    "app.logging", logging.WARNING, __file__, 0,
+                    f"Log queue full: dropped {self._unreported} record(s)", None, None
+                )
+                try:
+                    self.queue.put_nowait(notice)
+                    self._unreported = 0
+                except queue.Full:
+                    pass
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+                self._unreported += 1
+
+
+class LogPipeline:
+    """Root handler, queue and listener thread set up by setup_logging."""
+
+    def __init__(self):
+        self.handler: Optional[DroppingQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def stats(self) -> Dict[str, Any]:
+        if self.handler is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "queued": self.handler.queue.qsize(),
+            "capacity": self.handler.queue.maxsize,
+            "dropped": self.handler.dropped,
+        }
+
+    def stop(self) -> None:
+        """Drain the queue and stop the writer thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", queue_size: int = 10000) -> LogPipeline:
+    """
+    Route all logging through a bounded queue drained by a background thread.
+
+    The event loop only formats the message and enqueues it; the stderr
+    write happens in the listener thread, so a slow log pipe cannot stall
+    streams. Uvicorn's own loggers are routed through the same queue.
+
+    Args:
+        level: Root log level
+        fmt: "text" or "json" (one JSON object per line)
+        queue_size: Records buffered before new ones are dropped
+    """
+    if log_pipeline.listener is not None:
+        # Imported again by uvicorn.run() after it reconfigured its own loggers
+        _route_uvicorn_loggers()
+        return log_pipeline
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonLineFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+    handler = DroppingQueueHandler(log_queue)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _route_uvicorn_loggers()
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    log_pipeline.handler = handler
+    log_pipeline.listener = listener
+    atexit.register(log_pipeline.stop)
+    return log_pipeline
+
+
+def _route_uvicorn_loggers() -> None:
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+
+# Global pipeline instance
+log_pipeline = LogPipeline()
@@ -5,26 +5,28 @@ import logging
 import pathlib
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.api import chat, health, avatar
+from app.logging_config import setup_logging
+from app.api import chat, health, avatar, bootstrap, debug
+from app.middleware import CompressionMiddleware
+from app.services.app_shell import app_shell
+from app.services.avatar_store import avatar_store
+from app.services.dify_client import dify_client
+from app.services.feedback_queue import feedback_queue
+from app.services.history_store import history_store
+from app.services.render_cache import render_cache
+from app.services.suggestions import suggestion_index
+from app.services.tracing import tracer
+from app.services.traffic_capture import traffic_capture
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,  # Always use INFO level for detailed logging
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # Console output
-    ]
-)
-
-# Set specific loggers to INFO level for detailed API logging
-logging.getLogger('app.services.dify_client').setLevel(logging.INFO)
-logging.getLogger('app.api.chat').setLevel(logging.INFO)
+# Configure logging: records are queued and written to stderr by a background
+# thread, so a slow log pipe never blocks the event loop
+setup_logging(level=settings.LOG_LEVEL, fmt=settings.LOG_FORMAT, queue_size=settings.LOG_QUEUE_SIZE)
 logging.getLogger('httpx').setLevel(logging.WARNING)  # Reduce httpx noise
 
 logger = logging.getLogger(__name__)
@@ -54,6 +56,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated gzip/brotli for large JSON and static assets (event streams are left alone)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
+    )
+
 # Mount static files BEFORE API routes
 app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
@@ -61,6 +72,8 @@ app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 app.include_router(health.router, tags=["Health"])
 app.include_router(chat.router, prefix="/api/v1", tags=["Chat"])
 app.include_router(avatar.router, prefix="/api/v1", tags=["Avatar"])
+app.include_router(bootstrap.router, prefix="/api/v1", tags=["Bootstrap"])
+app.include_router(debug.router, prefix="/debug", tags=["Debug"])
 
 
 @app.get("/")
@@ -70,6 +83,33 @@ async def root():
     return FileResponse(str(static_dir / "index.html"))
 
 
+@app.get("/sw.js")
+async def service_worker():
+    """Serve the service worker with the current app shell manifest."""
+    if not settings.SERVICE_WORKER_ENABLED:
+        return Response(status_code=404)
+    return Response(
+        content=app_shell.script("sw.js"),
+        media_type="application/javascript",
+        headers={
+            # Browsers revalidate the worker on every navigation
+            "Cache-Control": "no-cache",
+            "Service-Worker-Allowed": "/",
+        }
+    )
+
+
+@app.get("/embed.js")
+async def embed_loader():
+    """Serve the embed loader that host pages include instead of the iframe."""
+    return Response(
+        content=app_shell.script("embed.js"),
+        media_type="application/javascript",
+        # Host pages keep it briefly; it carries the versioned shell asset list for prefetching
+        headers={"Cache-Control": "public, max-age=300"}
+    )
+
+
 @app.get("/test-static")
 async def test_static():
     """Test static file access."""
@@ -98,20 +138,50 @@ async def startup_event():
     """Application startup event."""
     logger.info("Starting Dify Chatbot API")
     logger.info(f"Dify API URL: {settings.DIFY_API_URL}")
+    for upstream in dify_client.pool.upstreams:
+        logger.info(f"Dify upstream {upstream.name}: {upstream.url} (group={upstream.group}, weight={upstream.weight})")
     logger.info(f"CORS Origins: {settings.cors_origins}")
+    logger.info(
+        f"Dify deadlines: connect={settings.DIFY_CONNECT_TIMEOUT_SECONDS}s, "
+        f"first_event={settings.DIFY_FIRST_EVENT_TIMEOUT_SECONDS}s, "
+        f"idle={settings.DIFY_IDLE_TIMEOUT_SECONDS}s, "
+        f"total={settings.DIFY_STREAM_MAX_DURATION_SECONDS}s, "
+        f"heartbeat={settings.STREAM_HEARTBEAT_INTERVAL_SECONDS}s"
+    )
+    if settings.STREAM_HEARTBEAT_INTERVAL_SECONDS >= settings.DIFY_IDLE_TIMEOUT_SECONDS:
+        logger.warning("STREAM_HEARTBEAT_INTERVAL_SECONDS should be shorter than DIFY_IDLE_TIMEOUT_SECONDS")
+    await history_store.open()
+    await feedback_queue.start()
+    await suggestion_index.start()
+    await avatar_store.start()
+    traffic_capture.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Application shutdown event."""
     logger.info("Shutting down Dify Chatbot API")
+    await feedback_queue.stop()
+    await suggestion_index.stop()
+    await dify_client.aclose()
+    await avatar_store.close()
+    await avatar.close_avatar_client()
+    await history_store.close()
+    await render_cache.close()
+    await tracer.close()
+    await traffic_capture.close()
 
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        "app.main:app",
-        host=settings.APP_HOST,
-        port=settings.APP_PORT,
-        reload=settings.APP_DEBUG
-    )
+    if settings.APP_SERVER == "hypercorn":
+        from app.server import run_hypercorn
+        run_hypercorn()
+    else:
+        import uvicorn
+        uvicorn.run(
+            "app.main:app",
+            host=settings.APP_HOST,
+            port=settings.APP_PORT,
+            reload=settings.APP_DEBUG,
+            ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE
+        )
@@ -0,0 +1,4 @@
+"""ASGI middleware."""
+from app.middleware.compression import CompressionMiddleware
+
+__all__ = ["CompressionMiddleware"]
@@ -0,0 +1,215 @@
+"""Negotiated gzip/brotli response compression."""
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Content types worth compressing. SSE is excluded explicitly: buffering or
+# block-compressing an event stream would delay tokens reaching the browser.
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: qvalue}."""
+    codings = {}
+    for part in value.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, raw = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(raw)
+                except ValueError:
+                    quality = 0.0
+        codings[name] = quality
+    return codings
+
+
+def choose_encoding(accept_encoding: str, allow_brotli: bool = True) -> Optional[str]:
+    """
+    Pick the response coding for a request.
+
+    Args:
+        accept_encoding: Raw Accept-Encoding header
+        allow_brotli: Whether brotli may be offered
+
+    Returns:
+        "br", "gzip" or None when the response should be sent as-is
+    """
+    codings = parse_accept_encoding(accept_encoding)
+    wildcard = codings.get("*", 0.0)
+    br_quality = codings.get("br", wildcard) if allow_brotli and brotli is not None else 0.0
+    gzip_quality = codings.get("gzip", wildcard)
+
+    if br_quality > 0 and br_quality >= gzip_quality:
+        return "br"
+    if gzip_quality > 0:
+        return "gzip"
+    return None
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    if content_type.startswith(EXCLUDED_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class _Compressor:
+    """Incremental compressor with a common interface for gzip and brotli."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """
+    Compress HTTP responses with the best coding the client accepts.
+
+    Single-chunk responses smaller than ``minimum_size`` are sent as-is.
+    Responses that already carry a Content-Encoding, non-text content and
+    ``text/event-stream`` are never touched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        enable_brotli: bool = True
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.enable_brotli = enable_brotli
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(
+            Headers(scope=scope).get("accept-encoding", ""),
+            allow_brotli=self.enable_brotli
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Hold the headers until the first body chunk shows whether to compress.
+            self.start_message = message
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            if self.start_message is not None:
+                # e.g. http.response.pathsend from FileResponse: the server sends the file itself.
+                self.passthrough = True
+                await self.downstream(self.start_message)
+                self.start_message = None
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            await self._start(body, more_body)
+            if self.passthrough:
+                await self.downstream(message)
+            return
+
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.finish()
+        await self.downstream({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _start(self, body: bytes, more_body: bool) -> None:
+        start_message = self.start_message
+        self.start_message = None
+        headers = MutableHeaders(raw=start_message["headers"])
+        status = start_message["status"]
+
+        if (
+            status < 200
+            or status in (204, 304)
+            or "content-encoding" in headers
+            or not is_compressible(headers.get("content-type", ""))
+        ):
+            self.passthrough = True
+            await self.downstream(start_message)
+            return
+
+        headers.add_vary_header("Accept-Encoding")
+        if not more_body and len(body) < self.middleware.minimum_size:
+            self.passthrough = True
+            await self.downstream(start_message)
+            return
+
+        self.compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+        headers["Content-Encoding"] = self.encoding
+        # The encoded representation differs byte-wise, so a strong validator must become weak.
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+        if more_body:
+            if "content-length" in headers:
+                del headers["content-length"]
+            await self.downstream(start_message)
+            data = self.compressor.compress(body)
+            await self.downstream({"type": "http.response.body", "body": data, "more_body": True})
+            return
+
+        data = self.compressor.compress(body) + self.compressor.finish()
+        headers["Content-Length"] = str(len(data))
+        await self.downstream(start_message)
+        await self.downstream({"type": "http.response.body", "body": data, "more_body": False})
@@ -11,6 +11,7 @@ class ChatRequest(BaseModel):
     user: str = Field(..., description="User identifier (employee_id)")
     trace_id: Optional[str] = Field(None, description="Optional trace ID for Dify distributed tracing")
     inputs: Dict[str, Any] = Field(default_factory=dict, description="Additional inputs")
+    stream_format: Optional[str] = Field(None, description="Streaming only: \"compact\" for delta-only events, Dify's events otherwise")
 
 
 class ChatResponse(BaseModel):
@@ -0,0 +1,32 @@
+"""Response classes shared by the API routers."""
+import hashlib
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+
+
+class ORJSONResponse(Response):
+    """
+    JSON response rendered with orjson.
+
+    Content that is already encoded (``bytes``) is sent as-is, so upstream
+    JSON can be proxied without a decode/encode round trip.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Serialize payload deterministically (sorted keys) for hashing and caching."""
+    return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+
+def content_etag(body: bytes) -> str:
+    """Weak ETag derived from the encoded body."""
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
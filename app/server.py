@@ -0,0 +1,64 @@
+"""HTTP/2 serving with Hypercorn (APP_SERVER=hypercorn)."""
+import asyncio
+import logging
+import signal
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def build_hypercorn_config():
+    """
+    Hypercorn settings for serving the app over HTTP/2.
+
+    With TLS_CERT_FILE and TLS_KEY_FILE set, h2 and HTTP/1.1 are offered
+    via ALPN. Without them the listener is cleartext and accepts HTTP/1.1,
+    h2c upgrades and prior-knowledge h2c, which is what a reverse proxy
+    speaking h2c to the app uses.
+
+    Returns:
+        hypercorn.config.Config
+    """
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"{settings.APP_HOST}:{settings.APP_PORT}"]
+    if settings.TLS_CERT_FILE and settings.TLS_KEY_FILE:
+        config.certfile = settings.TLS_CERT_FILE
+        config.keyfile = settings.TLS_KEY_FILE
+        config.alpn_protocols = ["h2", "http/1.1"]
+    # Every open chat iframe keeps one SSE stream; they all share a connection per origin.
+    config.h2_max_concurrent_streams = settings.H2_MAX_CONCURRENT_STREAMS
+    config.h2_max_inbound_frame_size = settings.H2_MAX_INBOUND_FRAME_SIZE
+    config.keep_alive_timeout = settings.SERVER_KEEP_ALIVE_SECONDS
+    # Route Hypercorn's logs through the queued root handler (see app.logging_config).
+    config.accesslog = logging.getLogger("hypercorn.access")
+    config.errorlog = logging.getLogger("hypercorn.error")
+    return config
+
+
+def run_hypercorn() -> None:
+    """Serve app.main:app with Hypercorn until SIGINT/SIGTERM."""
+    from hypercorn.asyncio import serve
+    from app.main import app
+
+    config = build_hypercorn_config()
+    logger.info(
+        f"Serving with Hypercorn on {config.bind[0]} "
+        f"({'TLS, ALPN h2/http1.1' if config.ssl_enabled else 'cleartext, h2c/http1.1'}, "
+        f"max_concurrent_streams={config.h2_max_concurrent_streams})"
+    )
+
+    async def main():
+        shutdown = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, shutdown.set)
+            except NotImplementedError:
+                # Windows: Ctrl+C raises KeyboardInterrupt instead
+                pass
+        await serve(app, config, shutdown_trigger=shutdown.wait)
+
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""App shell manifest for the chat UI and the scripts it is filled into (sw.js, embed.js)."""
+import hashlib
+import json
+import logging
+import pathlib
+import re
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Static assets referenced by the shell, with their ?v= cache-busting suffix when present.
+_ASSET_PATTERN = re.compile(r"/static-debug/[A-Za-z0-9_.\-]+(?:\?v=[A-Za-z0-9_.\-]+)?")
+# Files scanned for asset references; index.html is also the shell document itself.
+_SHELL_SOURCES = ("index.html", "chat.css", "chat.js")
+_MANIFEST_PLACEHOLDER = "__SHELL_MANIFEST__"
+
+
+class AppShell:
+    """
+    Shell manifest for the service worker (sw.js) and the embed loader (embed.js).
+
+    The manifest lists "/" plus every ``/static-debug/...`` URL referenced
+    by index.html, chat.css and chat.js. Its version is a hash of those
+    files' contents, so any deployed change to the shell yields a new
+    sw.js byte-for-byte, which makes browsers install the new worker in
+    the background. The manifest is built once per process; static files
+    only change with a deploy.
+    """
+
+    def __init__(self, static_dir: pathlib.Path, avatar_ttl_seconds: float = 86400.0):
+        self.static_dir = static_dir
+        self.avatar_ttl_seconds = avatar_ttl_seconds
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._scripts: Dict[str, str] = {}
+
+    @property
+    def version(self) -> str:
+        return self.manifest()["version"]
+
+    def manifest(self) -> Dict[str, Any]:
+        if self._manifest is None:
+            self._manifest = self._build_manifest()
+            logger.info(f"App shell version {self._manifest['version']} ({len(self._manifest['assets'])} assets)")
+        return self._manifest
+
+    def script(self, name: str) -> str:
+        """A static script (sw.js, embed.js) with the manifest filled in."""
+        script = self._scripts.get(name)
+        if script is None:
+            template = (self.static_dir / name).read_text(encoding="utf-8")
+            config = {**self.manifest(), "avatar_ttl_seconds": self.avatar_ttl_seconds}
+            script = self._scripts[name] = template.replace(_MANIFEST_PLACEHOLDER, json.dumps(config, ensure_ascii=False))
+        return script
+
+    def _build_manifest(self) -> Dict[str, Any]:
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update((self.static_dir / "sw.js").read_bytes())
+        assets: List[str] = ["/"]
+        for source in _SHELL_SOURCES:
+            path = self.static_dir / source
+            if not path.exists():
+                continue
+            digest.update(path.read_bytes())
+            for url in _ASSET_PATTERN.findall(path.read_text(encoding="utf-8")):
+                if url in assets:
+                    continue
+                asset_path = self.static_dir / url[len("/static-debug/"):].split("?", 1)[0]
+                if not asset_path.exists():
+                    logger.warning(f"App shell asset {url} not found, skipped")
+                    continue
+                assets.append(url)
+                digest.update(url.encode("utf-8"))
+                digest.update(asset_path.read_bytes())
+        return {"version": digest.hexdigest(), "assets": assets}
+
+
+# Global shell instance
+app_shell = AppShell(
+    static_dir=pathlib.Path(__file__).resolve().parent.parent / "static",
+    avatar_ttl_seconds=settings.SW_AVATAR_TTL_SECONDS
+)
@@ -0,0 +1,385 @@
+"""Disk-backed avatar thumbnails."""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.metrics import metrics
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional; without it the SAP image is cached unresized
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Fetches the source picture for a user: (bytes, media type), or None when unavailable.
+AvatarFetcher = Callable[[str], Awaitable[Optional[Tuple[bytes, str]]]]
+
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"image/webp": "webp", "image/jpeg": "jpg", "image/png": "png", "image/gif": "gif"}
+# After a failed background refresh the cached entry is retried this much later.
+REFRESH_RETRY_SECONDS = 300.0
+# Unreferenced blobs younger than this are kept: their index may not be written yet.
+BLOB_PRUNE_GRACE_SECONDS = 3600.0
+# Replacing an index entry starts a prune pass at most this often.
+BLOB_PRUNE_MIN_INTERVAL_SECONDS = 600.0
+
+
+class AvatarStore:
+    """
+    Content-addressed on-disk cache of avatar thumbnails.
+
+    Each SAP picture is decoded once and written as square WebP and JPEG
+    thumbnails at the configured sizes. Blobs live under ``blobs/`` named by
+    the SHA-256 of their bytes, and a small JSON index per user under
+    ``users/`` maps size and format to a blob, so both survive restarts.
+    Entries older than ``refresh_seconds`` are still served while a
+    background task refetches the source. Users without a SAP picture are
+    remembered for ``missing_ttl_seconds`` so the fallback is served without
+    asking SAP again. Blobs no longer referenced by any index are removed on
+    startup and after an entry is replaced. Without Pillow the source image is
+    stored as-is and served for every size.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        sizes: List[int],
+        refresh_seconds: float = 86400.0,
+        missing_ttl_seconds: float = 300.0,
+        webp_quality: int = 80,
+        jpeg_quality: int = 85,
+        max_entries: int = 10000
+    ):
+        self.root = pathlib.Path(root)
+        self.sizes = sorted(set(sizes)) or [96]
+        self.refresh_seconds = refresh_seconds
+        self.missing_ttl_seconds = missing_ttl_seconds
+        self.webp_quality = webp_quality
+        self.jpeg_quality = jpeg_quality
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # User -> time.monotonic() until which "no picture" is served from memory
+        self._missing: "OrderedDict[str, float]" = OrderedDict()
+        self._pruner: Optional[asyncio.Task] = None
+        self._last_prune_at = 0.0
+        self.pruned_blobs = 0
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def formats(self) -> List[str]:
+        if Image is None:
+            return []
+        return ["webp", "jpeg"] if features.check("webp") else ["jpeg"]
+
+    def snap_size(self, requested: Optional[int]) -> int:
+        """Smallest configured size that covers ``requested`` pixels (the largest if none does)."""
+        if not requested:
+            return self.sizes[len(self.sizes) // 2]
+        for size in self.sizes:
+            if size >= requested:
+                return size
+        return self.sizes[-1]
+
+    async def get(self, user: str, size: int, fmt: str, fetch: AvatarFetcher) -> Optional[Dict[str, Any]]:
+        """
+        Return the thumbnail for a user, fetching and encoding it on first use.
+
+        Args:
+            user: SAP user ID
+            size: Requested edge length in pixels (snapped to a configured size)
+            fmt: "webp" or "jpeg"; ignored when only the original is stored
+            fetch: Loads the source picture when the cache has none or it is stale
+
+        Returns:
+            Dict with path, media_type, etag and bytes, or None when no picture is available
+        """
+        entry = await self._load_entry(user)
+        if entry is None:
+            if self._is_missing(user):
+                metrics.incr("avatar_missing_hits_total")
+                return None
+            metrics.incr("avatar_cache_misses_total")
+            entry = await asyncio.shield(self._start_refresh(user, fetch))
+            if entry is None:
+                return None
+        else:
+            metrics.incr("avatar_cache_hits_total")
+            if time.time() - entry["fetched_at"] > self.refresh_seconds:
+                self._refresh_in_background(user, fetch)
+
+        variant = self._variant(entry, self.snap_size(size), fmt)
+        path = self._blob_path(variant["blob"], variant["media_type"])
+        if not path.exists():
+            # Blob removed behind our back: rebuild the entry once.
+            logger.warning(f"Avatar blob {path} missing, refetching avatar for {user}")
+            self._entries.pop(user, None)
+            entry = await asyncio.shield(self._start_refresh(user, fetch))
+            if entry is None:
+                return None
+            variant = self._variant(entry, self.snap_size(size), fmt)
+            path = self._blob_path(variant["blob"], variant["media_type"])
+
+        return {
+            "path": path,
+            "media_type": variant["media_type"],
+            "etag": f'"{variant["blob"][:32]}"',
+            "bytes": variant["bytes"],
+        }
+
+    async def invalidate(self, user: str) -> None:
+        """Forget a user's entry so the next request refetches the picture."""
+        self._entries.pop(user, None)
+        self._missing.pop(user, None)
+        await asyncio.to_thread(self._index_path(user).unlink, True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries_in_memory": len(self._entries),
+            "missing_in_memory": len(self._missing),
+            "refreshing": len(self._refreshing),
+            "pruned_blobs": self.pruned_blobs,
+            "thumbnails": bool(self.formats),
+        }
+
+    async def start(self) -> None:
+        """Remove blobs left unreferenced by a previous run."""
+        self._schedule_prune()
+
+    async def close(self) -> None:
+        """Wait for background refreshes and a running prune pass."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def prune_blobs(self) -> int:
+        """Delete blobs that no per-user index references; returns how many were removed."""
+        try:
+            removed = await asyncio.to_thread(self._prune_blob_files)
+        except Exception as e:
+            logger.error(f"Failed to prune avatar blobs in {self.root}: {str(e)}")
+            return 0
+        self.pruned_blobs += removed
+        if removed:
+            metrics.incr("avatar_blobs_pruned_total", removed)
+            logger.info(f"Pruned {removed} unreferenced avatar blob(s)")
+        return removed
+
+    async def _load_entry(self, user: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(user)
+        if entry is not None:
+            self._entries.move_to_end(user)
+            return entry
+        try:
+            entry = await asyncio.to_thread(self._read_index_file, user)
+        except Exception as e:
+            logger.error(f"Failed to read avatar index for {user}: {str(e)}")
+            return None
+        if entry is not None:
+            self._remember(user, entry)
+        return entry
+
+    def _remember(self, user: str, entry: Dict[str, Any]) -> None:
+        self._missing.pop(user, None)
+        self._entries[user] = entry
+        self._entries.move_to_end(user)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _is_missing(self, user: str) -> bool:
+        expires_at = self._missing.get(user)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self._missing[user]
+            return False
+        return True
+
+    def _remember_missing(self, user: str) -> None:
+        if self.missing_ttl_seconds <= 0:
+            return
+        self._missing[user] = time.monotonic() + self.missing_ttl_seconds
+        self._missing.move_to_end(user)
+        while len(self._missing) > self.max_entries:
+            self._missing.popitem(last=False)
+
+    def _schedule_prune(self) -> None:
+        if self._pruner is not None and not self._pruner.done():
+            return
+        if self._last_prune_at and time.monotonic() - self._last_prune_at < BLOB_PRUNE_MIN_INTERVAL_SECONDS:
+            return
+        self._last_prune_at = time.monotonic()
+        self._pruner = asyncio.create_task(self.prune_blobs())
+        self._tasks.add(self._pruner)
+        self._pruner.add_done_callback(self._tasks.discard)
+
+    def _start_refresh(self, user: str, fetch: AvatarFetcher) -> asyncio.Task:
+        """Fetch and store a user's picture; concurrent callers share one task."""
+        task = self._refreshing.get(user)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(user, fetch))
+            self._refreshing[user] = task
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: self._refreshing.pop(user, None))
+        return task
+
+    def _refresh_in_background(self, user: str, fetch: AvatarFetcher) -> None:
+        if user not in self._refreshing:
+            metrics.incr("avatar_background_refresh_total")
+            self._start_refresh(user, fetch)
+
+    async def _fetch_and_store(self, user: str, fetch: AvatarFetcher) -> Optional[Dict[str, Any]]:
+        previous = self._entries.get(user)
+        try:
+            source = await fetch(user)
+        except Exception as e:
+            logger.error(f"Avatar fetch for {user} failed: {str(e)}")
+            source = None
+        if source is None:
+            if previous is not None:
+                previous["fetched_at"] = time.time() - self.refresh_seconds + REFRESH_RETRY_SECONDS
+            else:
+                self._remember_missing(user)
+            return previous
+
+        content, media_type = source
+        source_hash = hashlib.sha256(content).hexdigest()
+        try:
+            if previous is not None and previous.get("source") == source_hash:
+                entry = dict(previous, fetched_at=time.time())
+            else:
+                variants = await asyncio.to_thread(self._build_variants, content, media_type)
+                entry = {"source": source_hash, "fetched_at": time.time(), "variants": variants}
+            await asyncio.to_thread(self._write_index_file, user, entry)
+        except Exception as e:
+            logger.error(f"Failed to store avatar for {user}: {str(e)}")
+            return previous
+
+        self._remember(user, entry)
+        if previous is not None and previous.get("source") != source_hash:
+            # The old thumbnails may now be unreferenced
+            self._schedule_prune()
+        return entry
+
+    def _build_variants(self, content: bytes, media_type: str) -> Dict[str, Any]:
+        """Encode thumbnails (runs in a worker thread). Falls back to the original bytes."""
+        started_at = time.monotonic()
+        variants: Dict[str, Any] = {}
+        if self.formats:
+            try:
+                with Image.open(io.BytesIO(content)) as image:
+                    image = ImageOps.exif_transpose(image).convert("RGB")
+                    for size in self.sizes:
+                        thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                        variants[str(size)] = {fmt: self._store_blob(self._encode(thumb, fmt), MEDIA_TYPES[fmt]) for fmt in self.formats}
+            except Exception as e:
+                logger.warning(f"Avatar could not be decoded ({media_type}, {len(content)} bytes), storing original: {str(e)}")
+                variants = {}
+        if not variants:
+            variants["original"] = self._store_blob(content, media_type)
+        metrics.observe("avatar_encode_seconds", time.monotonic() - started_at)
+        return variants
+
+    def _encode(self, image: "Image.Image", fmt: str) -> bytes:
+        buffer = io.BytesIO()
+        if fmt == "webp":
+            image.save(buffer, "WEBP", quality=self.webp_quality, method=4)
+        else:
+            image.save(buffer, "JPEG", quality=self.jpeg_quality, optimize=True, progressive=True)
+        return buffer.getvalue()
+
+    def _variant(self, entry: Dict[str, Any], size: int, fmt: str) -> Dict[str, Any]:
+        variants = entry["variants"]
+        if "original" in variants:
+            return variants["original"]
+        by_format = variants.get(str(size)) or variants[max(variants, key=int)]
+        return by_format.get(fmt) or next(iter(by_format.values()))
+
+    def _store_blob(self, data: bytes, media_type: str) -> Dict[str, Any]:
+        blob = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(blob, media_type)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return {"blob": blob, "media_type": media_type, "bytes": len(data)}
+
+    def _prune_blob_files(self) -> int:
+        """Delete unreferenced blobs older than the grace period (runs in a worker thread)."""
+        blobs_dir = self.root / "blobs"
+        if not blobs_dir.exists():
+            return 0
+        referenced: Set[str] = set()
+        users_dir = self.root / "users"
+        if users_dir.exists():
+            for path in users_dir.glob("*.json"):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        variants = json.load(f).get("variants") or {}
+                except Exception as e:
+                    # An unreadable index could reference anything, so nothing is deleted
+                    logger.warning(f"Skipping avatar blob prune, cannot read {path}: {str(e)}")
+                    return 0
+                for variant in variants.values():
+                    if "blob" in variant:
+                        referenced.add(variant["blob"])
+                    else:
+                        referenced.update(v["blob"] for v in variant.values())
+
+        cutoff = time.time() - BLOB_PRUNE_GRACE_SECONDS
+        removed = 0
+        for path in blobs_dir.glob("*/*"):
+            if path.name.split(".", 1)[0] in referenced:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def _blob_path(self, blob: str, media_type: str) -> pathlib.Path:
+        extension = EXTENSIONS.get(media_type.split(";")[0].strip().lower(), "bin")
+        return self.root / "blobs" / blob[:2] / f"{blob}.{extension}"
+
+    def _index_path(self, user: str) -> pathlib.Path:
+        return self.root / "users" / f"{hashlib.sha256(user.encode('utf-8')).hexdigest()[:32]}.json"
+
+    def _read_index_file(self, user: str) -> Optional[Dict[str, Any]]:
+        path = self._index_path(user)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        return entry if isinstance(entry, dict) and entry.get("variants") else None
+
+    def _write_index_file(self, user: str, entry: Dict[str, Any]) -> None:
+        path = self._index_path(user)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**entry, "user": user}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+# Global store instance
+avatar_store = AvatarStore(
+    root=settings.AVATAR_CACHE_DIR,
+    sizes=settings.avatar_sizes,
+    refresh_seconds=settings.AVATAR_REFRESH_SECONDS,
+    missing_ttl_seconds=settings.AVATAR_MISSING_TTL_SECONDS,
+    webp_quality=settings.AVATAR_WEBP_QUALITY,
+    jpeg_quality=settings.AVATAR_JPEG_QUALITY
+)
@@ -0,0 +1,222 @@
+"""On-demand CPU profiling and memory inspection for the running process."""
+import asyncio
+import cProfile
+import gc
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Innermost frames that mean the event loop is waiting for I/O rather than running
+# code: selector polling for the stdlib loop, the runner itself under uvloop.
+IDLE_FRAMES = {("selectors.py", "select"), ("selectors.py", "poll"), ("runners.py", "run")}
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the event-loop thread.
+
+    A helper thread samples the loop thread's stack with
+    ``sys._current_frames()`` at a fixed interval and aggregates the
+    samples as collapsed stacks (``frame;frame;frame count``), the input
+    format of flamegraph.pl and speedscope. Nothing runs while no capture
+    is in progress.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def capture_collapsed(self, seconds: float, interval: float = 0.005, include_idle: bool = False) -> str:
+        """
+        Sample the event-loop thread for ``seconds`` and return collapsed stacks.
+
+        Args:
+            seconds: Capture duration
+            interval: Seconds between samples
+            include_idle: Keep samples where the loop sits in select/epoll
+        """
+        async with self._lock:
+            target_thread_id = threading.get_ident()
+            stacks: Counter = Counter()
+            stop = threading.Event()
+
+            def sampler():
+                while not stop.wait(interval):
+                    frame = sys._current_frames().get(target_thread_id)
+                    if frame is None:
+                        continue
+                    stack = self._collapse(frame)
+                    if stack is not None or include_idle:
+                        stacks[stack or "idle"] += 1
+
+            thread = threading.Thread(target=sampler, name="debug-profiler", daemon=True)
+            thread.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(thread.join)
+
+            return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+    async def capture_cprofile(self, seconds: float, limit: int = 60) -> str:
+        """
+        Run cProfile on the event-loop thread for ``seconds``.
+
+        Everything the loop executes meanwhile (all requests and streams) is
+        included. Returns the pstats report sorted by cumulative time.
+        """
+        async with self._lock:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(limit)
+            return output.getvalue()
+
+    @staticmethod
+    def _collapse(frame) -> Optional[str]:
+        code = frame.f_code
+        if (code.co_filename.rsplit("/", 1)[-1], code.co_name) in IDLE_FRAMES:
+            return None
+
+        frames: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+
+class MemoryTracker:
+    """
+    tracemalloc snapshots diffed against a baseline.
+
+    Tracing is only active between ``start`` and ``stop``, so normal
+    operation pays nothing for it.
+    """
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_at: Optional[float] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = self._take()
+        self._baseline_at = time.time()
+
+    def stop(self) -> None:
+        self._baseline = None
+        self._baseline_at = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def report(self, limit: int = 25, group_by: str = "lineno", reset_baseline: bool = False) -> Dict[str, Any]:
+        """
+        Compare a fresh snapshot with the baseline.
+
+        Args:
+            limit: Number of allocation sites to return
+            group_by: "lineno", "filename" or "traceback"
+            reset_baseline: Make this snapshot the new baseline afterwards
+        """
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+
+        snapshot = self._take()
+        current, peak = tracemalloc.get_traced_memory()
+        diff = snapshot.compare_to(self._baseline, group_by) if self._baseline is not None else []
+        result = {
+            "tracing": True,
+            "baseline_at": self._baseline_at,
+            "traced_current_bytes": current,
+            "traced_peak_bytes": peak,
+            "top_growth": [
+                {
+                    "site": str(stat.traceback) if group_by != "traceback" else stat.traceback.format(),
+                    "size_diff_bytes": stat.size_diff,
+                    "size_bytes": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                }
+                for stat in diff[:limit]
+            ],
+        }
+        if reset_baseline:
+            self._baseline = snapshot
+            self._baseline_at = time.time()
+        return result
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+
+class StreamBufferRegistry:
+    """Live chat stream queues, registered by the stream endpoint for inspection."""
+
+    def __init__(self):
+        self._streams: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, trace_id: str, queue: asyncio.Queue, user: str) -> None:
+        self._streams[trace_id] = {"queue": queue, "user": user, "started_at": time.time()}
+
+    def unregister(self, trace_id: str) -> None:
+        self._streams.pop(trace_id, None)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        streams = []
+        for trace_id, entry in self._streams.items():
+            items = list(getattr(entry["queue"], "_queue", ()))
+            streams.append({
+                "trace_id": trace_id,
+                "user": entry["user"],
+                "age_seconds": round(time.time() - entry["started_at"], 1),
+                "queued_items": len(items),
+                "queued_bytes": sum(len(str(payload)) for _, payload in items),
+            })
+        return sorted(streams, key=lambda stream: stream["queued_bytes"], reverse=True)
+
+
+def process_memory() -> Dict[str, Any]:
+    """RSS from /proc (Linux) plus GC and asyncio task counts."""
+    info: Dict[str, Any] = {
+        "gc_counts": gc.get_count(),
+        "gc_objects": len(gc.get_objects()),
+        "asyncio_tasks": len(asyncio.all_tasks()),
+    }
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split(":", 1)
+                    info[key.lower() + "_kb"] = int(value.split()[0])
+    except OSError:
+        pass
+    return info
+
+
+# Global instances
+profiler = SamplingProfiler()
+memory_tracker = MemoryTracker()
+stream_buffers = StreamBufferRegistry()
@@ -1,15 +1,36 @@
 """Dify API client service."""
+import asyncio
 import httpx
 import json
+import orjson
 import logging
 import re
-from uuid import uuid4
-from typing import AsyncGenerator, Dict, Any, Optional
+import sys
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, AsyncIterator, Dict, Any, List, Optional, Tuple
 from app.config import settings
+from app.services.metrics import metrics
+from app.services.history_store import history_store
+from app.services.upstream_pool import Upstream, UpstreamPool
+from app.services.stream_format import STREAM_FORMAT_COMPACT, CompactStreamEncoder
+from app.services.stream_sanitizer import StreamEventSanitizer
+from app.services.workflow_stats import workflow_stats
+from app.services.tracing import ensure_trace_id, tracer
+from app.services.traffic_capture import traffic_capture
 
 logger = logging.getLogger(__name__)
 
 
+class DifyStreamTimeout(Exception):
+    """Raised when a Dify stream misses one of its deadlines."""
+
+    def __init__(self, kind: str, limit_seconds: float):
+        self.kind = kind
+        self.limit_seconds = limit_seconds
+        super().__init__(f"Dify stream {kind} timeout: no progress within {limit_seconds:.1f}s")
+
+
 def format_mes_result(raw_output: str) -> str:
     """
     格式化 MES 结果，从嵌套的 JSON 中提取并美化显示。
@@ -168,14 +189,81 @@ class DifyClient:
     """Client for interacting with Dify API."""
 
     _artifact_pattern = re.compile(r"\b\d{10,}\.text\b")
+    # Merged conversation-list cursors kept per (user, last_id) when several groups are configured.
+    _list_cursor_max_entries = 2000
     
-    def __init__(self):
-        self.api_url = settings.DIFY_API_URL
-        self.api_key = settings.DIFY_API_KEY
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    def __init__(self, pool: Optional[UpstreamPool] = None):
+        self.pool = pool or UpstreamPool.from_settings()
+        self.api_url = self.pool.primary.url
+        self._list_cursors: "OrderedDict[Tuple[str, str], Dict[str, Tuple[Optional[str], bool]]]" = OrderedDict()
+
+    async def aclose(self) -> None:
+        """Close every upstream's pooled client."""
+        await self.pool.aclose()
+
+    async def warm_up(self, user: str) -> bool:
+        """
+        Open a pooled connection to the upstream a new conversation would go to.
+
+        Issues a cheap ``GET /parameters`` so the first chat message skips the
+        TCP/TLS handshake. Skipped when that upstream already has a live
+        connection. Failures are logged and ignored.
+
+        Returns:
+            True if a warm-up request was sent
+        """
+        upstream = self.pool.choose()
+        if upstream.has_warm_connection(time.monotonic()):
+            return False
+        try:
+            response = await self._request(
+                upstream,
+                "GET",
+                "/parameters",
+                headers=upstream.headers,
+                params={"user": user},
+                timeout=self._build_timeout(settings.DIFY_REQUEST_TIMEOUT_SECONDS)
+            )
+        except httpx.TransportError as e:
+            logger.warning(f"Warm-up of Dify upstream {upstream.name} failed: {self._format_exception(e)}")
+            return False
+        logger.info(f"Warmed Dify upstream {upstream.name} (status={response.status_code})")
+        return True
+
+    async def _request(
+        self,
+        upstream: Upstream,
+        method: str,
+        path: str,
+        latency_sample: bool = True,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Send one request to an upstream and feed the outcome into its health state.
+
+        Every call passes its own timeout, so one pool per upstream serves
+        blocking, streaming and feedback requests alike.
+
+        Args:
+            upstream: Target upstream
+            method: HTTP method
+            path: Path below the upstream's API URL
+            latency_sample: False for calls whose duration is dominated by generation
+        """
+        started_at = upstream.begin()
+        try:
+            response = await upstream.client.request(method, f"{upstream.url}{path}", **kwargs)
+        except httpx.TransportError:
+            self.pool.record(upstream, None, ok=False)
+            raise
+        finally:
+            upstream.end()
+        self.pool.record(
+            upstream,
+            time.monotonic() - started_at if latency_sample else None,
+            ok=not self.pool.is_failure_status(response.status_code)
+        )
+        return response
 
     def _sanitize_text_artifacts(self, value: Any) -> Any:
         if not isinstance(value, str):
@@ -186,31 +274,6 @@ class DifyClient:
         cleaned = re.sub(r"\n{3,}", "\n\n", cleaned).strip()
         return cleaned
 
-    def _sanitize_stream_event(self, event_json: Dict[str, Any]) -> Dict[str, Any]:
-        sanitized = dict(event_json)
-
-        if "answer" in sanitized:
-            sanitized["answer"] = self._sanitize_text_artifacts(sanitized.get("answer"))
-
-        data = sanitized.get("data")
-        if isinstance(data, dict):
-            data = dict(data)
-            if "text" in data:
-                data["text"] = self._sanitize_text_artifacts(data.get("text"))
-            if "answer" in data:
-                data["answer"] = self._sanitize_text_artifacts(data.get("answer"))
-
-            outputs = data.get("outputs")
-            if isinstance(outputs, dict):
-                outputs = dict(outputs)
-                if "answer" in outputs:
-                    outputs["answer"] = self._sanitize_text_artifacts(outputs.get("answer"))
-                data["outputs"] = outputs
-
-            sanitized["data"] = data
-
-        return sanitized
-
     def _format_exception(self, error: Exception) -> str:
         """Format exception with fallback details when str(error) is empty."""
         message = str(error).strip()
@@ -226,13 +289,95 @@ class DifyClient:
 
         return message
 
+    def _build_timeout(self, read_seconds: float) -> httpx.Timeout:
+        """Build an httpx timeout with a short connect phase and the given read budget."""
+        connect_seconds = settings.DIFY_CONNECT_TIMEOUT_SECONDS
+        return httpx.Timeout(
+            connect=connect_seconds,
+            read=read_seconds,
+            write=connect_seconds,
+            pool=connect_seconds,
+        )
+
+    async def _iter_lines_with_deadlines(
+        self,
+        response: httpx.Response,
+        started_at: float,
+        trace_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Iterate SSE lines while enforcing first-event, idle and total deadlines.
+
+        Every non-empty line (Dify ping included) counts as upstream progress.
+        """
+        lines = response.aiter_lines()
+        deadline = started_at + settings.DIFY_STREAM_MAX_DURATION_SECONDS
+        received_event = False
+
+        while True:
+            if received_event:
+                kind, limit = "idle", settings.DIFY_IDLE_TIMEOUT_SECONDS
+            else:
+                kind, limit = "first_event", settings.DIFY_FIRST_EVENT_TIMEOUT_SECONDS
+
+            remaining = deadline - time.monotonic()
+            if remaining <= limit:
+                kind, limit = "total_duration", max(remaining, 0.0)
+
+            try:
+                line = await asyncio.wait_for(lines.__anext__(), timeout=limit)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                metrics.incr(f"dify_stream_timeout_total.{kind}")
+                tracer.record(trace_id, "upstream_timeout", kind=kind)
+                if kind == "total_duration":
+                    raise DifyStreamTimeout(kind, settings.DIFY_STREAM_MAX_DURATION_SECONDS)
+                raise DifyStreamTimeout(kind, limit)
+
+            if line.strip() and not received_event:
+                received_event = True
+                metrics.observe("dify_stream_first_event_seconds", time.monotonic() - started_at)
+                tracer.record(trace_id, "upstream_first_event")
+            yield line
+
     def _ensure_trace_id(self, trace_id: Optional[str] = None) -> str:
-        candidate = str(trace_id or "").strip()
-        return candidate or str(uuid4())
+        return ensure_trace_id(trace_id)
+
+    async def _route_conversation(self, conversation_id: Optional[str], user: str) -> Upstream:
+        """
+        Pick the upstream for a conversation, finding its owner group if it is not bound yet.
+
+        With several groups an unbound conversation (opened before a restart,
+        or past the first page of the merged list) is probed with a one-message
+        history read per group; the primary group is the fallback.
+        """
+        if not conversation_id or self.pool.group_of(conversation_id) or len(self.pool.groups()) == 1:
+            return self.pool.route(conversation_id)
+
+        for group in self.pool.groups():
+            upstream = self.pool.choose(group)
+            try:
+                response = await self._request(
+                    upstream,
+                    "GET",
+                    "/messages",
+                    headers=upstream.headers,
+                    params={"user": user, "limit": 1, "conversation_id": conversation_id},
+                    timeout=self._build_timeout(settings.DIFY_REQUEST_TIMEOUT_SECONDS)
+                )
+            except httpx.TransportError as e:
+                logger.warning(f"Owner lookup for conversation {conversation_id} on {upstream.name} failed: {str(e)}")
+                continue
+            if response.status_code == 200:
+                self.pool.bind(conversation_id, group)
+                logger.info(f"Conversation {conversation_id} belongs to upstream group {group}")
+                return upstream
+        return self.pool.route(conversation_id)
 
-    def _build_dify_request_headers(self, trace_id: str) -> Dict[str, str]:
+    def _build_dify_request_headers(self, upstream: Upstream, trace_id: str) -> Dict[str, str]:
         return {
-            **self.headers,
+            **upstream.headers,
             "X-Trace-Id": trace_id,
         }
     
@@ -265,32 +410,98 @@ class DifyClient:
             "user": user,
             "trace_id": resolved_trace_id
         }
-        request_headers = self._build_dify_request_headers(resolved_trace_id)
+        upstream = await self._route_conversation(conversation_id, user)
+        request_headers = self._build_dify_request_headers(upstream, resolved_trace_id)
         request_params = {"trace_id": resolved_trace_id}
         
-        async with httpx.AsyncClient(timeout=settings.DIFY_TIMEOUT_SECONDS, verify=settings.VERIFY_SSL) as client:
-            try:
-                logger.info(f"Sending chat message to Dify: {json.dumps(payload, ensure_ascii=False)}")
-                response = await client.post(
-                    f"{self.api_url}/chat-messages",
-                    headers=request_headers,
-                    params=request_params,
-                    json=payload
+        try:
+            logger.info(f"Sending chat message to Dify ({upstream.name}): {json.dumps(payload, ensure_ascii=False)}")
+            tracer.record(resolved_trace_id, "upstream_request", upstream=upstream.name)
+            response = await self._request(
+                upstream,
+                "POST",
+                "/chat-messages",
+                latency_sample=False,
+                headers=request_headers,
+                params=request_params,
+                json=payload,
+                timeout=self._build_timeout(settings.DIFY_TIMEOUT_SECONDS),
+                extensions={"trace": tracer.httpx_hook(resolved_trace_id)}
+            )
+            response.raise_for_status()
+            result = response.json()
+            if isinstance(result, dict) and "answer" in result:
+                result["answer"] = self._sanitize_text_artifacts(result.get("answer"))
+            if isinstance(result, dict):
+                result.setdefault("trace_id", resolved_trace_id)
+                self.pool.bind(result.get("conversation_id"), upstream.group)
+                self.pool.bind(result.get("message_id"), upstream.group)
+                history_store.capture_turn(
+                    conversation_id=result.get("conversation_id", ""),
+                    message_id=result.get("message_id", ""),
+                    user=user,
+                    query=query,
+                    answer=result.get("answer", ""),
+                    trace_id=resolved_trace_id,
+                    created_at=result.get("created_at"),
+                    new_conversation=not conversation_id
                 )
-                response.raise_for_status()
-                result = response.json()
-                if isinstance(result, dict) and "answer" in result:
-                    result["answer"] = self._sanitize_text_artifacts(result.get("answer"))
-                if isinstance(result, dict):
-                    result.setdefault("trace_id", resolved_trace_id)
-                return result
-            except httpx.HTTPStatusError as e:
-                error_detail = e.response.text
-                logger.error(f"Dify API error {e.response.status_code}: {error_detail}")
-                raise Exception(f"Dify API error: {e.response.status_code} - {error_detail}")
-            except Exception as e:
-                logger.error(f"Failed to call Dify API: {str(e)}")
-                raise Exception(f"Failed to call Dify API: {str(e)}")
+            return result
+        except httpx.HTTPStatusError as e:
+            error_detail = e.response.text
+            logger.error(f"Dify API error {e.response.status_code}: {error_detail}")
+            raise Exception(f"Dify API error: {e.response.status_code} - {error_detail}")
+        except Exception as e:
+            logger.error(f"Failed to call Dify API: {str(e)}")
+            raise Exception(f"Failed to call Dify API: {str(e)}")
+
+    def _track_stream_turn(self, turn: Dict[str, Any], event_json: Dict[str, Any]) -> None:
+        """Accumulate the raw answer and IDs of a streamed turn for the history store."""
+        turn["conversation_id"] = event_json.get("conversation_id") or turn["conversation_id"]
+        turn["message_id"] = event_json.get("message_id") or turn["message_id"]
+
+        event_type = event_json.get("event")
+        if event_type == "message" and isinstance(event_json.get("answer"), str):
+            turn["message_parts"].append(event_json["answer"])
+        elif event_type in ("agent_message", "text_chunk"):
+            data = event_json.get("data")
+            text = event_json.get("answer") if event_type == "agent_message" else None
+            if isinstance(data, dict):
+                text = data.get("text") or data.get("answer") or text
+            if isinstance(text, str):
+                turn["chunk_parts"].append(text)
+
+    def _capture_stream_turn(
+        self,
+        turn: Dict[str, Any],
+        user: str,
+        query: str,
+        trace_id: str,
+        request_conversation_id: Optional[str],
+        event_json: Dict[str, Any]
+    ) -> None:
+        """Hand a completed streamed turn to the history store (once per stream)."""
+        if turn["recorded"]:
+            return
+        turn["recorded"] = True
+
+        answer = ""
+        if event_json.get("event") == "workflow_finished":
+            outputs = (event_json.get("data") or {}).get("outputs") or {}
+            answer = outputs.get("answer") if isinstance(outputs.get("answer"), str) else ""
+        if not answer:
+            answer = "".join(turn["message_parts"]) or "".join(turn["chunk_parts"])
+
+        history_store.capture_turn(
+            conversation_id=turn["conversation_id"],
+            message_id=turn["message_id"],
+            user=user,
+            query=query,
+            answer=self._sanitize_text_artifacts(answer),
+            trace_id=trace_id,
+            created_at=turn["created_at"],
+            new_conversation=not request_conversation_id
+        )
 
     async def delete_conversation(
         self,
@@ -308,23 +519,26 @@ class DifyClient:
             "user": user
         }
 
-        async with httpx.AsyncClient(timeout=30.0, verify=settings.VERIFY_SSL) as client:
-            try:
-                logger.info(f"Deleting conversation in Dify: conversation_id={conversation_id}, user={user}")
-                response = await client.request(
-                    "DELETE",
-                    f"{self.api_url}/conversations/{conversation_id}",
-                    headers=self.headers,
-                    json=payload
-                )
+        try:
+            upstream = await self._route_conversation(conversation_id, user)
+            logger.info(f"Deleting conversation in Dify ({upstream.name}): conversation_id={conversation_id}, user={user}")
+            response = await self._request(
+                upstream,
+                "DELETE",
+                f"/conversations/{conversation_id}",
+                headers=upstream.headers,
+                json=payload,
+                timeout=self._build_timeout(settings.DIFY_REQUEST_TIMEOUT_SECONDS)
+            )
 
-                if response.status_code not in (200, 204):
-                    error_detail = response.text
-                    logger.error(f"Dify delete conversation error {response.status_code}: {error_detail}")
-                    raise Exception(f"Dify API error: {response.status_code} - {error_detail}")
-            except Exception as e:
-                logger.error(f"Failed to delete conversation in Dify: {str(e)}")
-                raise Exception(f"Failed to delete conversation in Dify: {str(e)}")
+            if response.status_code not in (200, 204):
+                error_detail = response.text
+                logger.error(f"Dify delete conversation error {response.status_code}: {error_detail}")
+                raise Exception(f"Dify API error: {response.status_code} - {error_detail}")
+            self.pool.forget(conversation_id)
+        except Exception as e:
+            logger.error(f"Failed to delete conversation in Dify: {str(e)}")
+            raise Exception(f"Failed to delete conversation in Dify: {str(e)}")
 
     async def message_feedback(
         self,
@@ -351,25 +565,31 @@ class DifyClient:
             "content": content
         }
 
-        async with httpx.AsyncClient(timeout=30.0, verify=settings.VERIFY_SSL) as client:
-            try:
-                logger.info(f"Submitting message feedback: message_id={message_id}, rating={rating}, user={user}")
-                response = await client.post(
-                    f"{self.api_url}/messages/{message_id}/feedbacks",
-                    headers=self.headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                if response.content:
-                    return response.json()
-                return {"result": "success"}
-            except httpx.HTTPStatusError as e:
-                error_detail = e.response.text
-                logger.error(f"Dify message feedback error {e.response.status_code}: {error_detail}")
-                raise Exception(f"Dify API error: {e.response.status_code} - {error_detail}")
-            except Exception as e:
-                logger.error(f"Failed to submit message feedback in Dify: {str(e)}")
-                raise Exception(f"Failed to submit message feedback in Dify: {str(e)}")
+        upstream = self.pool.route(message_id)
+        try:
+            logger.info(f"Submitting message feedback ({upstream.name}): message_id={message_id}, rating={rating}, user={user}")
+            response = await self._request(
+                upstream,
+                "POST",
+                f"/messages/{message_id}/feedbacks",
+                headers=upstream.headers,
+                json=payload,
+                timeout=self._build_timeout(settings.DIFY_REQUEST_TIMEOUT_SECONDS)
+            )
+            response.raise_for_status()
+            if response.content:
+                return response.json()
+            return {"result": "success"}
+        except httpx.HTTPStatusError as e:
+            # Re-raised as is: the feedback queue retries on the status code
+            logger.error(f"Dify message feedback error {e.response.status_code}: {e.response.text}")
+            raise
+        except httpx.TransportError as e:
+            logger.error(f"Failed to submit message feedback in Dify: {type(e).__name__}: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to submit message feedback in Dify: {str(e)}")
+            raise Exception(f"Failed to submit message feedback in Dify: {str(e)}")
     
     async def stream_message(
         self,
@@ -377,7 +597,8 @@ class DifyClient:
         user: str,
         conversation_id: Optional[str] = None,
         inputs: Optional[Dict[str, Any]] = None,
-        trace_id: Optional[str] = None
+        trace_id: Optional[str] = None,
+        stream_format: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
         """
         Send a message to Dify API with streaming response.
@@ -387,6 +608,7 @@ class DifyClient:
             user: User identifier
             conversation_id: Optional conversation ID
             inputs: Optional additional inputs
+            stream_format: "compact" for the slim event schema (see CompactStreamEncoder); Dify's events otherwise
             
         Yields:
             Streaming response chunks
@@ -400,137 +622,222 @@ class DifyClient:
             "user": user,
             "trace_id": resolved_trace_id
         }
-        request_headers = self._build_dify_request_headers(resolved_trace_id)
+        upstream = await self._route_conversation(conversation_id, user)
+        request_headers = self._build_dify_request_headers(upstream, resolved_trace_id)
         request_params = {"trace_id": resolved_trace_id}
 
-        yield json.dumps({
+        compact_encoder = CompactStreamEncoder() if stream_format == STREAM_FORMAT_COMPACT else None
+        # Stateful, so artifacts split across chunks are caught and deltas need no re-cleaning downstream
+        text_sanitizer = StreamEventSanitizer()
+
+        def encode_event(event_json: Dict[str, Any], data: str) -> List[str]:
+            return compact_encoder.encode(event_json) if compact_encoder else [data]
+
+        trace_context = {
             "event": "trace_context",
             "trace_id": resolved_trace_id,
             "workflow_run_id": "",
             "task_id": ""
-        }, ensure_ascii=False)
+        }
+        for item in encode_event(trace_context, json.dumps(trace_context, ensure_ascii=False)):
+            yield item
         
-        async with httpx.AsyncClient(timeout=settings.DIFY_TIMEOUT_SECONDS, verify=settings.VERIFY_SSL) as client:
-            try:
-                logger.info(f"=== DIFY STREAMING REQUEST ===")
-                logger.info(f"URL: {self.api_url}/chat-messages")
-                logger.info(f"Headers: {json.dumps(dict(request_headers), ensure_ascii=False)}")
-                logger.info(f"Payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+        stream_timeout = self._build_timeout(
+            max(settings.DIFY_FIRST_EVENT_TIMEOUT_SECONDS, settings.DIFY_IDLE_TIMEOUT_SECONDS)
+        )
+        stream_started_at = upstream.begin()
+        metrics.incr("dify_stream_started_total")
+        tracer.record(resolved_trace_id, "upstream_request", upstream=upstream.name)
+        # Sampled sessions keep the raw upstream lines and their timing for replay
+        capture = traffic_capture.start_session(
+            resolved_trace_id, user, query, conversation_id, inputs, upstream.name, stream_started_at
+        )
+        try:
+            logger.info(f"=== DIFY STREAMING REQUEST ===")
+            logger.info(f"URL: {upstream.url}/chat-messages (upstream: {upstream.name})")
+            logger.info(f"Headers: {json.dumps(dict(request_headers), ensure_ascii=False)}")
+            logger.info(f"Payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
                 
-                async with client.stream(
-                    "POST",
-                    f"{self.api_url}/chat-messages",
-                    headers=request_headers,
-                    params=request_params,
-                    json=payload
-                ) as response:
-                    # Log response status
-                    logger.info(f"Dify response status: {response.status_code}")
+            async with upstream.client.stream(
+                "POST",
+                f"{upstream.url}/chat-messages",
+                headers=request_headers,
+                params=request_params,
+                json=payload,
+                timeout=stream_timeout,
+                extensions={"trace": tracer.httpx_hook(resolved_trace_id)}
+            ) as response:
+                # Log response status
+                logger.info(f"Dify response status: {response.status_code}")
+                if capture:
+                    capture.response(response.status_code)
+                headers_elapsed = time.monotonic() - stream_started_at
+                metrics.observe("dify_stream_headers_seconds", headers_elapsed)
+                self.pool.record(
+                    upstream, headers_elapsed, ok=not self.pool.is_failure_status(response.status_code)
+                )
                     
-                    if response.status_code != 200:
-                        # Read error response
-                        error_body = await response.aread()
-                        error_text = error_body.decode('utf-8')
-                        logger.error(f"Dify API error {response.status_code}: {error_text}")
+                if response.status_code != 200:
+                    # Read error response
+                    error_body = await response.aread()
+                    error_text = error_body.decode('utf-8')
+                    logger.error(f"Dify API error {response.status_code}: {error_text}")
                         
-                        # Try to parse as JSON
-                        try:
-                            error_json = json.loads(error_text)
-                            logger.error(f"Parsed error: {json.dumps(error_json, ensure_ascii=False, indent=2)}")
-                        except:
-                            pass
+                    # Try to parse as JSON
+                    try:
+                        error_json = json.loads(error_text)
+                        logger.error(f"Parsed error: {json.dumps(error_json, ensure_ascii=False, indent=2)}")
+                    except:
+                        pass
                         
-                        raise Exception(f"Dify API error: {response.status_code} - {error_text}")
+                    raise Exception(f"Dify API error: {response.status_code} - {error_text}")
                     
-                    # Track if this is a workflow app (receives workflow_finished event)
-                    is_workflow_app = False
-                    received_message_event = False
+                # Track if this is a workflow app (receives workflow_finished event)
+                is_workflow_app = False
+                received_message_event = False
+                turn = {
+                    "conversation_id": conversation_id or "",
+                    "message_id": "",
+                    "message_parts": [],
+                    "chunk_parts": [],
+                    "created_at": int(time.time()),
+                    "recorded": False,
+                    "bound": False,
+                }
                     
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            data = line[6:]
-                            if data.strip():
-                                try:
-                                    event_json = json.loads(data)
-                                    event_type = event_json.get("event")
+                async for line in self._iter_lines_with_deadlines(response, stream_started_at, resolved_trace_id):
+                    if capture:
+                        capture.add(line)
+                    if line.startswith("data: "):
+                        data = line[6:]
+                        if data.strip():
+                            try:
+                                event_json = json.loads(data)
+                                event_type = event_json.get("event")
                                     
-                                    logger.info(f"=== STREAMING EVENT ===")
-                                    logger.info(f"Event Type: {event_type}")
-                                    logger.info(f"Raw Data: {data}")
-                                    logger.info(f"Parsed JSON: {json.dumps(event_json, ensure_ascii=False, indent=2)}")
-                                    event_json = self._sanitize_stream_event(event_json)
-                                    data = json.dumps(event_json, ensure_ascii=False)
+                                logger.info(f"=== STREAMING EVENT ===")
+                                logger.info(f"Event Type: {event_type}")
+                                logger.info(f"Raw Data: {data}")
+                                logger.info(f"Parsed JSON: {json.dumps(event_json, ensure_ascii=False, indent=2)}")
+                                self._track_stream_turn(turn, event_json)
+                                if not turn["bound"] and turn["conversation_id"] and turn["message_id"]:
+                                    # Follow-up turns and feedback must reach the upstream that owns this conversation
+                                    self.pool.bind(turn["conversation_id"], upstream.group)
+                                    self.pool.bind(turn["message_id"], upstream.group)
+                                    turn["bound"] = True
+                                if event_type in ("message_end", "workflow_finished"):
+                                    self._capture_stream_turn(turn, user, query, resolved_trace_id, conversation_id, event_json)
+                                    # Release the text each sanitizer held back before the reply closes
+                                    for flushed in text_sanitizer.flush():
+                                        for item in encode_event(flushed, json.dumps(flushed, ensure_ascii=False)):
+                                            yield item
+                                event_json = text_sanitizer.clean(event_json)
+                                data = json.dumps(event_json, ensure_ascii=False)
                                     
-                                    # Handle different chat message events
-                                    if event_type == "message":
-                                        # Full message event - contains complete answer
-                                        logger.info(f"Message event with answer: '{event_json.get('answer', '')[:100]}'")
-                                        yield data
-                                    elif event_type == "message_end":
-                                        # End of message - save conversation_id
-                                        logger.info(f"Message end event with conversation_id: {event_json.get('conversation_id', '')}")
-                                        yield data
-                                    elif event_type == "agent_message" or event_type == "text_chunk":
-                                        # Streaming text chunks
-                                        logger.info(f"Streaming event {event_type}: {json.dumps(event_json.get('data', {}), ensure_ascii=False)[:200]}")
-                                        yield data
-                                    elif event_type == "workflow_finished":
-                                        # Workflow finished - contains final answer in outputs
-                                        # Mark this as a workflow app
-                                        is_workflow_app = True
-                                        answer = event_json.get('data', {}).get('outputs', {}).get('answer', '')
-                                        logger.info(f"Workflow finished detected - this is a workflow app. Skipping stored message event.")
-                                        logger.info(f"Workflow finished with answer: {answer[:200]}")
-                                        yield data
-                                        break
-                                    elif event_type == "node_finished":
-                                        # Node finished - for workflow apps, don't send to frontend
-                                        # Only workflow_finished should be sent to avoid duplicate display
-                                        node_data = event_json.get('data', {})
-                                        node_type = node_data.get('node_type', '')
-                                        logger.info(f"Node finished ({node_type}) - not sent to frontend (waiting for workflow_finished)")
-                                        pass
-                                    elif event_type == "agent_thought":
-                                        # Agent reasoning - log only, don't yield to frontend
-                                        logger.info(f"Agent thought (not sent to frontend): {json.dumps(event_json.get('thought', ''), ensure_ascii=False)[:200]}")
-                                        pass
-                                    elif event_type == "message_file":
-                                        # File attachments
-                                        logger.info(f"Message file: {json.dumps(event_json.get('file', {}), ensure_ascii=False)}")
-                                        yield data
-                                    elif event_type == "workflow_started":
-                                        logger.info(f"Workflow started event forwarded to frontend")
-                                        yield data
-                                    elif event_type == "node_started":
-                                        # Node started - log only, don't show to user
-                                        logger.info(f"Node started (not sent to frontend)")
-                                        pass
-                                    elif event_type == "ping":
-                                        # Ping event - keep connection alive, don't show to user
-                                        logger.debug(f"Ping event received")
-                                        pass
-                                    else:
-                                        # Log unknown events but don't yield (avoid showing unexpected data)
-                                        logger.warning(f"Unknown event type (not sent to frontend): {event_type}")
-                                        pass
+                                # Handle different chat message events
+                                if event_type == "message":
+                                    # Full message event - contains complete answer
+                                    logger.info(f"Message event with answer: '{event_json.get('answer', '')[:100]}'")
+                                    for item in encode_event(event_json, data):
+                                        yield item
+                                elif event_type == "message_end":
+                                    # End of message - save conversation_id
+                                    logger.info(f"Message end event with conversation_id: {event_json.get('conversation_id', '')}")
+                                    for item in encode_event(event_json, data):
+                                        yield item
+                                elif event_type == "agent_message" or event_type == "text_chunk":
+                                    # Streaming text chunks
+                                    logger.info(f"Streaming event {event_type}: {json.dumps(event_json.get('data', {}), ensure_ascii=False)[:200]}")
+                                    for item in encode_event(event_json, data):
+                                        yield item
+                                elif event_type == "workflow_finished":
+                                    # Workflow finished - contains final answer in outputs
+                                    # Mark this as a workflow app
+                                    is_workflow_app = True
+                                    answer = event_json.get('data', {}).get('outputs', {}).get('answer', '')
+                                    logger.info(f"Workflow finished detected - this is a workflow app. Skipping stored message event.")
+                                    logger.info(f"Workflow finished with answer: {answer[:200]}")
+                                    for item in encode_event(event_json, data):
+                                        yield item
+                                    break
+                                elif event_type == "node_finished":
+                                    # Node finished - for workflow apps, don't send to frontend
+                                    # Only workflow_finished should be sent to avoid duplicate display
+                                    node_data = event_json.get('data') or {}
+                                    node_type = node_data.get('node_type', '')
+                                    workflow_stats.node_finished(resolved_trace_id, node_data)
+                                    logger.info(
+                                        f"Node finished ({node_type}, {node_data.get('title', '')}, "
+                                        f"{node_data.get('elapsed_time', '?')}s) - not sent to frontend"
+                                    )
+                                elif event_type == "agent_thought":
+                                    # Agent reasoning - log only, don't yield to frontend
+                                    logger.info(f"Agent thought (not sent to frontend): {json.dumps(event_json.get('thought', ''), ensure_ascii=False)[:200]}")
+                                    pass
+                                elif event_type == "message_file":
+                                    # File attachments
+                                    logger.info(f"Message file: {json.dumps(event_json.get('file', {}), ensure_ascii=False)}")
+                                    for item in encode_event(event_json, data):
+                                        yield item
+                                elif event_type == "workflow_started":
+                                    logger.info(f"Workflow started event forwarded to frontend")
+                                    for item in encode_event(event_json, data):
+                                        yield item
+                                elif event_type == "node_started":
+                                    # Node started - timing only, don't show to user
+                                    workflow_stats.node_started(resolved_trace_id, event_json.get('data') or {})
+                                    logger.info(f"Node started (not sent to frontend)")
+                                elif event_type == "ping":
+                                    # Ping event - keep connection alive, don't show to user
+                                    logger.debug(f"Ping event received")
+                                    pass
+                                else:
+                                    # Log unknown events but don't yield (avoid showing unexpected data)
+                                    logger.warning(f"Unknown event type (not sent to frontend): {event_type}")
+                                    pass
                                         
-                                except Exception as e:
-                                    logger.warning(f"Failed to parse event json: {e}, raw: {data}")
-            except httpx.HTTPStatusError as e:
-                error_msg = f"Dify API error: {e.response.status_code}"
-                try:
-                    error_detail = await e.response.aread()
-                    decoded_error = error_detail.decode()
-                    error_msg += f" - {decoded_error}"
-                    logger.error(f"Dify streaming error {e.response.status_code}: {decoded_error}")
-                except:
-                    pass
-                raise Exception(error_msg)
-            except Exception as e:
-                detailed_error = self._format_exception(e)
-                if "Dify API error" not in detailed_error:
-                    logger.error(f"Failed to stream from Dify API: {detailed_error}", exc_info=True)
-                raise Exception(f"Failed to stream from Dify API: {detailed_error}")
+                            except Exception as e:
+                                logger.warning(f"Failed to parse event json: {e}, raw: {data}")
+
+                # Upstream closed without message_end/workflow_finished: still release the held-back tail
+                for flushed in text_sanitizer.flush():
+                    for item in encode_event(flushed, json.dumps(flushed, ensure_ascii=False)):
+                        yield item
+        except httpx.ConnectTimeout as e:
+            metrics.incr("dify_stream_timeout_total.connect")
+            self.pool.record(upstream, None, ok=False)
+            raise Exception(f"Failed to stream from Dify API: {self._format_exception(e)}")
+        except httpx.HTTPStatusError as e:
+            error_msg = f"Dify API error: {e.response.status_code}"
+            try:
+                error_detail = await e.response.aread()
+                decoded_error = error_detail.decode()
+                error_msg += f" - {decoded_error}"
+                logger.error(f"Dify streaming error {e.response.status_code}: {decoded_error}")
+            except:
+                pass
+            raise Exception(error_msg)
+        except Exception as e:
+            if isinstance(e, (httpx.TransportError, DifyStreamTimeout)):
+                self.pool.record(upstream, None, ok=False)
+            detailed_error = self._format_exception(e)
+            if "Dify API error" not in detailed_error:
+                logger.error(
+                    f"Failed to stream from Dify API: {detailed_error}",
+                    exc_info=not isinstance(e, DifyStreamTimeout)
+                )
+            raise Exception(f"Failed to stream from Dify API: {detailed_error}")
+        finally:
+            upstream.end()
+            metrics.observe("dify_stream_duration_seconds", time.monotonic() - stream_started_at)
+            if capture:
+                error = sys.exc_info()[1]
+                if error is None:
+                    capture.finish("completed")
+                elif isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+                    capture.finish("cancelled")
+                else:
+                    capture.finish("error", str(error))
     
     async def get_conversations(
         self, 
@@ -551,6 +858,62 @@ class DifyClient:
         Returns:
             List of conversations with pagination info
         """
+        result = orjson.loads(await self.get_conversations_raw(user, last_id, limit, sort_by))
+        if 'data' in result:
+            logger.info(f"Number of conversations: {len(result['data'])}")
+            for idx, conv in enumerate(result['data']):
+                logger.info(f"Conversation {idx + 1}:")
+                logger.info(f"  - ID: {conv.get('id', 'N/A')}")
+                logger.info(f"  - Name: {conv.get('name', 'N/A')}")
+                logger.info(f"  - Status: {conv.get('status', 'N/A')}")
+                logger.info(f"  - Created at: {conv.get('created_at', 'N/A')}")
+                logger.info(f"  - Updated at: {conv.get('updated_at', 'N/A')}")
+        return result
+
+    async def get_conversations_raw(
+        self,
+        user: str,
+        last_id: Optional[str] = None,
+        limit: int = 20,
+        sort_by: str = "-updated_at"
+    ) -> bytes:
+        """
+        Get conversation history for a user as the upstream JSON bytes.
+
+        Used by the proxy endpoint so the body can be passed through without
+        a decode/encode round trip.
+
+        Args:
+            user: User identifier
+            last_id: Optional last conversation ID for pagination
+            limit: Number of records to return (default 20, max 100)
+            sort_by: Sort field, default -updated_at (desc by updated time)
+
+        Returns:
+            Raw JSON response body (merged across groups when several are configured)
+        """
+        groups = self.pool.groups()
+        try:
+            if len(groups) > 1:
+                return orjson.dumps(await self._get_merged_conversations(groups, user, last_id, limit, sort_by))
+            return await self._fetch_conversations_page(groups[0], user, last_id, limit, sort_by)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Dify API HTTP error: {e.response.status_code}")
+            logger.error(f"Error response: {e.response.text}")
+            raise Exception(f"Dify API error: {e.response.status_code} - {e.response.text}")
+        except Exception as e:
+            logger.error(f"Failed to get conversations: {str(e)}")
+            raise Exception(f"Failed to get conversations: {str(e)}")
+
+    async def _fetch_conversations_page(
+        self,
+        group: str,
+        user: str,
+        last_id: Optional[str],
+        limit: int,
+        sort_by: str
+    ) -> bytes:
+        upstream = self.pool.choose(group)
         params = {
             "user": user,
             "limit": limit,
@@ -558,45 +921,96 @@ class DifyClient:
         }
         if last_id:
             params["last_id"] = last_id
-        
+
         logger.info(f"=== GET CONVERSATIONS ===")
-        logger.info(f"Request URL: {self.api_url}/conversations")
+        logger.info(f"Request URL: {upstream.url}/conversations (upstream: {upstream.name})")
         logger.info(f"Request Params: {json.dumps(params, ensure_ascii=False)}")
-            
-        async with httpx.AsyncClient(timeout=30.0, verify=settings.VERIFY_SSL) as client:
-            try:
-                response = await client.get(
-                    f"{self.api_url}/conversations",
-                    headers=self.headers,
-                    params=params
-                )
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"=== CONVERSATIONS RESPONSE ===")
-                logger.info(f"Response Status: {response.status_code}")
-                logger.info(f"Full Response: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                if 'data' in result:
-                    logger.info(f"Number of conversations: {len(result['data'])}")
-                    for idx, conv in enumerate(result['data']):
-                        logger.info(f"Conversation {idx + 1}:")
-                        logger.info(f"  - ID: {conv.get('id', 'N/A')}")
-                        logger.info(f"  - Name: {conv.get('name', 'N/A')}")
-                        logger.info(f"  - Status: {conv.get('status', 'N/A')}")
-                        logger.info(f"  - Created at: {conv.get('created_at', 'N/A')}")
-                        logger.info(f"  - Updated at: {conv.get('updated_at', 'N/A')}")
-                return result
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Dify API HTTP error: {e.response.status_code}")
-                logger.error(f"Error response: {e.response.text}")
-                raise Exception(f"Dify API error: {e.response.status_code} - {e.response.text}")
-            except Exception as e:
-                logger.error(f"Failed to get conversations: {str(e)}")
-                raise Exception(f"Failed to get conversations: {str(e)}")
+
+        response = await self._request(
+            upstream,
+            "GET",
+            "/conversations",
+            headers=upstream.headers,
+            params=params,
+            timeout=self._build_timeout(settings.DIFY_REQUEST_TIMEOUT_SECONDS)
+        )
+        response.raise_for_status()
+        logger.info(f"=== CONVERSATIONS RESPONSE ===")
+        logger.info(f"Response Status: {response.status_code}, Size: {len(response.content)} bytes")
+        return response.content
+
+    async def _get_merged_conversations(
+        self,
+        groups: List[str],
+        user: str,
+        last_id: Optional[str],
+        limit: int,
+        sort_by: str
+    ) -> Dict[str, Any]:
+        """
+        Fetch one page from every group and merge them in ``sort_by`` order.
+
+        Each group keeps its own cursor. The cursors behind a returned page
+        are remembered under (user, last conversation ID), so the frontend
+        can keep paging with a plain ``last_id``. A cursor that is unknown
+        (evicted, or issued before a restart) only pages its owner's group.
+        """
+        if last_id:
+            cursors = self._list_cursors.get((user, last_id))
+            if cursors is None:
+                owner = self.pool.group_of(last_id) or groups[0]
+                cursors = {group: (last_id if group == owner else None, group != owner) for group in groups}
+        else:
+            cursors = {group: (None, False) for group in groups}
+
+        active = [group for group in groups if not cursors.get(group, (None, True))[1]]
+        results = await asyncio.gather(
+            *(self._fetch_conversations_page(group, user, cursors[group][0], limit, sort_by) for group in active),
+            return_exceptions=True
+        )
+
+        pages: Dict[str, Dict[str, Any]] = {}
+        for group, result in zip(active, results):
+            if isinstance(result, Exception):
+                # Keep the cursor: the next page retries this group.
+                metrics.incr("upstream_list_partial_total")
+                logger.warning(f"Conversation list from group {group} failed, returning the others: {str(result)}")
+                continue
+            pages[group] = orjson.loads(result)
+        if active and not pages:
+            raise results[0]
+
+        sort_field = sort_by.lstrip("-") or "updated_at"
+        merged: Dict[str, Dict[str, Any]] = {}
+        for group, page in pages.items():
+            for conv in page.get("data") or []:
+                if isinstance(conv, dict) and conv.get("id"):
+                    self.pool.bind(conv["id"], group)
+                    merged.setdefault(conv["id"], conv)
+        data = sorted(merged.values(), key=lambda conv: conv.get(sort_field) or 0, reverse=sort_by.startswith("-"))
+        data = data[:limit]
+        returned_ids = {conv["id"] for conv in data}
+
+        next_cursors = dict(cursors)
+        for group, page in pages.items():
+            items = [conv for conv in page.get("data") or [] if isinstance(conv, dict) and conv.get("id")]
+            included = [conv for conv in items if conv["id"] in returned_ids]
+            cursor = included[-1]["id"] if included else cursors[group][0]
+            next_cursors[group] = (cursor, not page.get("has_more") and len(included) == len(items))
+
+        has_more = any(not done for _, done in next_cursors.values())
+        if has_more and data:
+            self._list_cursors[(user, data[-1]["id"])] = next_cursors
+            while len(self._list_cursors) > self._list_cursor_max_entries:
+                self._list_cursors.popitem(last=False)
+        return {"limit": limit, "has_more": has_more, "data": data}
     
     async def get_conversation_messages(
         self,
         conversation_id: str,
-        user: str
+        user: str,
+        first_id: Optional[str] = None,
+        limit: int = 20
     ) -> Dict[str, Any]:
         """
         Get messages for a specific conversation.
@@ -604,45 +1018,63 @@ class DifyClient:
         Args:
             conversation_id: Conversation ID
             user: User identifier
+            first_id: Optional ID of the oldest message already loaded (pages backwards)
+            limit: Number of messages to return (default 20, max 100)
             
         Returns:
             List of messages in the conversation
         """
-        params = {"user": user}
+        params = {"user": user, "limit": limit}
+        if first_id:
+            params["first_id"] = first_id
         logger.info(f"=== GET CONVERSATION MESSAGES ===")
         logger.info(f"Conversation ID: {conversation_id}")
         logger.info(f"User: {user}")
-        logger.info(f"Request URL: {self.api_url}/messages")
         logger.info(f"Request Params: {json.dumps({**params, 'conversation_id': conversation_id}, ensure_ascii=False)}")
+
+        # An unbound conversation (e.g. opened from a link after a restart) is looked up group by group.
+        owner = self.pool.group_of(conversation_id)
+        candidate_groups = [owner] if owner else self.pool.groups()
             
-        async with httpx.AsyncClient(timeout=30.0, verify=settings.VERIFY_SSL) as client:
-            try:
-                response = await client.get(
-                    f"{self.api_url}/messages",
-                    headers=self.headers,
-                    params={**params, "conversation_id": conversation_id}
+        try:
+            for index, group in enumerate(candidate_groups):
+                upstream = self.pool.choose(group)
+                logger.info(f"Request URL: {upstream.url}/messages (upstream: {upstream.name})")
+                response = await self._request(
+                    upstream,
+                    "GET",
+                    "/messages",
+                    headers=upstream.headers,
+                    params={**params, "conversation_id": conversation_id},
+                    timeout=self._build_timeout(settings.DIFY_REQUEST_TIMEOUT_SECONDS)
                 )
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"=== CONVERSATION MESSAGES RESPONSE ===")
-                logger.info(f"Response Status: {response.status_code}")
-                logger.info(f"Full Response: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                if 'data' in result:
-                    logger.info(f"Number of messages: {len(result['data'])}")
-                    for idx, msg in enumerate(result['data']):
-                        if isinstance(msg, dict) and 'answer' in msg:
-                            msg['answer'] = self._sanitize_text_artifacts(msg.get('answer'))
-                        logger.info(f"Message {idx + 1}:")
-                        logger.info(f"  - Query: {msg.get('query', 'N/A')}")
-                        logger.info(f"  - Answer: {msg.get('answer', 'N/A')[:200]}...")
-                        logger.info(f"  - Created at: {msg.get('created_at', 'N/A')}")
-                return result
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Dify API HTTP error: {e.response.status_code}")
-                logger.error(f"Error response: {e.response.text}")
-                raise Exception(f"Dify API error: {e.response.status_code} - {e.response.text}")
-            except Exception as e:
-                raise Exception(f"Failed to get conversation messages: {str(e)}")
+                if response.status_code == 404 and index < len(candidate_groups) - 1:
+                    continue
+                break
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+            self.pool.bind(conversation_id, upstream.group)
+            for msg in result.get("data") or []:
+                if isinstance(msg, dict):
+                    self.pool.bind(msg.get("id"), upstream.group)
+            logger.info(f"=== CONVERSATION MESSAGES RESPONSE ===")
+            logger.info(f"Response Status: {response.status_code}, Size: {len(response.content)} bytes")
+            if 'data' in result:
+                logger.info(f"Number of messages: {len(result['data'])}")
+                for idx, msg in enumerate(result['data']):
+                    if isinstance(msg, dict) and 'answer' in msg:
+                        msg['answer'] = self._sanitize_text_artifacts(msg.get('answer'))
+                    logger.info(f"Message {idx + 1}:")
+                    logger.info(f"  - Query: {msg.get('query', 'N/A')}")
+                    logger.info(f"  - Answer: {msg.get('answer', 'N/A')[:200]}...")
+                    logger.info(f"  - Created at: {msg.get('created_at', 'N/A')}")
+            return result
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Dify API HTTP error: {e.response.status_code}")
+            logger.error(f"Error response: {e.response.text}")
+            raise Exception(f"Dify API error: {e.response.status_code} - {e.response.text}")
+        except Exception as e:
+            raise Exception(f"Failed to get conversation messages: {str(e)}")
 
 
 # Global client instance
@@ -0,0 +1,268 @@
+"""Asynchronous feedback delivery queue."""
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+import httpx
+
+from app.config import settings
+from app.services.dify_client import DifyClient, dify_client
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+FeedbackKey = Tuple[str, str]
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Transport failures, timeouts, 429 and 5xx may succeed later; anything else will not."""
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code == 429 or status_code >= 500
+    return False
+
+
+class FeedbackQueue:
+    """
+    In-process queue that delivers like/dislike feedback to Dify in the background.
+
+    Only the latest rating per (message, user) is kept, so repeated toggles
+    collapse into one upstream call. Delivery runs with bounded concurrency
+    over the shared Dify client. Transport errors, timeouts, 429 and 5xx are
+    retried with exponential backoff; other rejections (4xx) are dropped at
+    once. Anything not yet delivered is spooled to a JSON file so it
+    survives restarts.
+    """
+
+    def __init__(
+        self,
+        client: DifyClient,
+        spool_path: str,
+        concurrency: int = 4,
+        flush_interval: float = 1.0,
+        max_attempts: int = 8,
+        retry_base_seconds: float = 2.0,
+        retry_max_seconds: float = 300.0
+    ):
+        self.client = client
+        self.spool_path = pathlib.Path(spool_path)
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._pending: Dict[FeedbackKey, Dict[str, Any]] = {}
+        self._inflight: Dict[FeedbackKey, Dict[str, Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    def submit(
+        self,
+        message_id: str,
+        user: str,
+        rating: Optional[str],
+        content: str = ""
+    ) -> None:
+        """
+        Accept feedback for delivery without waiting on Dify.
+
+        Args:
+            message_id: Dify message ID
+            user: User identifier
+            rating: like/dislike/None (None revokes the previous rating)
+            content: Optional feedback text
+        """
+        key = (message_id, user)
+        if key in self._pending:
+            metrics.incr("feedback_deduped_total")
+        self._pending[key] = {
+            "message_id": message_id,
+            "user": user,
+            "rating": rating,
+            "content": content or "",
+            "attempts": 0,
+            "next_attempt_at": 0.0,
+            "enqueued_at": time.time(),
+        }
+        metrics.incr("feedback_enqueued_total")
+        self._dirty = True
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Return current queue depth."""
+        return {"pending": len(self._pending), "inflight": len(self._inflight)}
+
+    async def start(self) -> None:
+        """Load spooled items and start the background worker."""
+        if self._worker is not None:
+            return
+        await self._load_spool()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"Feedback queue started, pending={len(self._pending)}")
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """
+        Stop the worker, try a final short drain, then spool what is left.
+
+        Args:
+            drain_timeout: Seconds to wait for in-flight and due deliveries
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        try:
+            self._dispatch_due(ignore_backoff=True)
+            if self._tasks:
+                await asyncio.wait_for(asyncio.gather(*self._tasks, return_exceptions=True), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Feedback queue drain timed out, spooling {len(self._pending) + len(self._inflight)} item(s)")
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        await self._write_spool()
+        logger.info(f"Feedback queue stopped, spooled={len(self._pending)}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            self._dispatch_due()
+            if self._dirty:
+                await self._write_spool()
+
+    def _dispatch_due(self, ignore_backoff: bool = False) -> None:
+        now = time.time()
+        for key, item in list(self._pending.items()):
+            # A newer rating waits until the previous call for the same message finishes,
+            # so Dify always ends up with the latest value.
+            if key in self._inflight:
+                continue
+            if not ignore_backoff and item["next_attempt_at"] > now:
+                continue
+
+            del self._pending[key]
+            self._inflight[key] = item
+            task = asyncio.create_task(self._deliver(key, item))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, key: FeedbackKey, item: Dict[str, Any]) -> None:
+        try:
+            async with self._semaphore:
+                started_at = time.monotonic()
+                await self.client.message_feedback(
+                    message_id=item["message_id"],
+                    rating=item["rating"],
+                    user=item["user"],
+                    content=item["content"]
+                )
+            metrics.incr("feedback_delivered_total")
+            metrics.observe("feedback_delivery_seconds", time.monotonic() - started_at)
+            metrics.observe("feedback_queue_latency_seconds", time.time() - item["enqueued_at"])
+        except asyncio.CancelledError:
+            self._requeue(key, item)
+            raise
+        except Exception as e:
+            item["attempts"] += 1
+            metrics.incr("feedback_failed_total")
+            if not _is_retryable(e):
+                # Not requeued, so it also leaves the spool
+                metrics.incr("feedback_rejected_total")
+                logger.error(
+                    f"Feedback rejected by Dify, not retrying: "
+                    f"message_id={item['message_id']}, rating={item['rating']}, error={str(e)}"
+                )
+            elif item["attempts"] >= self.max_attempts:
+                metrics.incr("feedback_dropped_total")
+                logger.error(
+                    f"Dropping feedback after {item['attempts']} attempts: "
+                    f"message_id={item['message_id']}, rating={item['rating']}, error={str(e)}"
+                )
+            else:
+                delay = min(self.retry_base_seconds * (2 ** (item["attempts"] - 1)), self.retry_max_seconds)
+                item["next_attempt_at"] = time.time() + delay
+                logger.warning(
+                    f"Feedback delivery failed (attempt {item['attempts']}), retrying in {delay:.0f}s: "
+                    f"message_id={item['message_id']}, error={str(e)}"
+                )
+                self._requeue(key, item)
+        finally:
+            self._inflight.pop(key, None)
+            self._dirty = True
+            self._wakeup.set()
+
+    def _requeue(self, key: FeedbackKey, item: Dict[str, Any]) -> None:
+        # A rating submitted while this one was in flight supersedes it.
+        if key not in self._pending:
+            self._pending[key] = item
+
+    async def _load_spool(self) -> None:
+        try:
+            items = await asyncio.to_thread(self._read_spool_file)
+        except Exception as e:
+            logger.error(f"Failed to read feedback spool {self.spool_path}: {str(e)}")
+            return
+
+        for item in items:
+            key = (item.get("message_id"), item.get("user"))
+            if not all(key) or key in self._pending:
+                continue
+            item.setdefault("rating", None)
+            item.setdefault("content", "")
+            item.setdefault("attempts", 0)
+            item.setdefault("enqueued_at", time.time())
+            item["next_attempt_at"] = 0.0
+            self._pending[key] = item
+
+    def _read_spool_file(self) -> list:
+        if not self.spool_path.exists():
+            return []
+        with open(self.spool_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [item for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+
+    async def _write_spool(self) -> None:
+        self._dirty = False
+        # In-flight items are spooled too: a crash mid-request must not lose them.
+        snapshot = dict(self._inflight)
+        snapshot.update(self._pending)
+        try:
+            await asyncio.to_thread(self._write_spool_file, list(snapshot.values()))
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Failed to write feedback spool {self.spool_path}: {str(e)}")
+
+    def _write_spool_file(self, items: list) -> None:
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.spool_path.with_suffix(self.spool_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_path, self.spool_path)
+
+
+# Global queue instance
+feedback_queue = FeedbackQueue(
+    client=dify_client,
+    spool_path=settings.FEEDBACK_SPOOL_PATH,
+    concurrency=settings.FEEDBACK_CONCURRENCY,
+    flush_interval=settings.FEEDBACK_FLUSH_INTERVAL_SECONDS,
+    max_attempts=settings.FEEDBACK_MAX_ATTEMPTS
+)
@@ -0,0 +1,440 @@
+"""Local SQLite mirror of conversations and messages with full-text search."""
+import asyncio
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Upstream updated_at may trail our own capture time by a few seconds.
+UPDATED_AT_SLACK_SECONDS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    created_at INTEGER NOT NULL DEFAULT 0,
+    updated_at INTEGER NOT NULL DEFAULT 0,
+    synced INTEGER NOT NULL DEFAULT 0,
+    backfill_first_id TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    conversation_id TEXT NOT NULL,
+    user TEXT NOT NULL,
+    query TEXT NOT NULL DEFAULT '',
+    answer TEXT NOT NULL DEFAULT '',
+    trace_id TEXT,
+    feedback_rating TEXT,
+    created_at INTEGER NOT NULL,
+    captured_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, created_at, seq);
+CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations(user, updated_at);
+"""
+
+FTS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, query, answer) VALUES (new.seq, new.query, new.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, query, answer) VALUES ('delete', old.seq, old.query, old.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF query, answer ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, query, answer) VALUES ('delete', old.seq, old.query, old.answer);
+    INSERT INTO messages_fts(rowid, query, answer) VALUES (new.seq, new.query, new.answer);
+END;
+"""
+
+UPSERT_MESSAGE = """
+INSERT INTO messages (id, conversation_id, user, query, answer, trace_id, feedback_rating, created_at, captured_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    query = excluded.query,
+    answer = excluded.answer,
+    trace_id = COALESCE(excluded.trace_id, messages.trace_id),
+    feedback_rating = COALESCE(excluded.feedback_rating, messages.feedback_rating)
+"""
+
+
+class HistoryStore:
+    """
+    Write-through mirror of Dify conversation history.
+
+    Completed turns are captured as they stream, and pages fetched from
+    Dify are stored as they pass through. A conversation is marked
+    ``synced`` once its full history is known locally; only then are
+    message reads served from SQLite, otherwise callers fall back to Dify.
+
+    All SQLite work runs in worker threads via ``asyncio.to_thread`` on a
+    single WAL-mode connection guarded by a lock.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = pathlib.Path(path)
+        self.enabled = enabled
+        self.fts_tokenizer: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and self._conn is not None
+
+    async def open(self) -> None:
+        """Open the database and create the schema."""
+        if not self.enabled or self._conn is not None:
+            return
+        try:
+            await asyncio.to_thread(self._open_sync)
+            logger.info(f"History store opened: {self.path} (fts tokenizer: {self.fts_tokenizer})")
+        except Exception as e:
+            self._conn = None
+            logger.error(f"Failed to open history store {self.path}, falling back to Dify only: {str(e)}")
+
+    async def close(self) -> None:
+        """Wait for pending captures, then close the database."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.to_thread(conn.close)
+
+    def _open_sync(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+
+        # Trigram tokenization gives substring matches for CJK text; fall back
+        # to unicode61 on SQLite builds older than 3.34.
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                    f"query, answer, content='messages', content_rowid='seq', tokenize='{tokenizer}')"
+                )
+                self.fts_tokenizer = tokenizer
+                break
+            except sqlite3.OperationalError:
+                continue
+        if self.fts_tokenizer:
+            conn.executescript(FTS_TRIGGERS)
+        conn.commit()
+        self._conn = conn
+
+    def _run_in_background(self, func, *args) -> None:
+        """Schedule a write without delaying the caller."""
+        if not self.available:
+            return
+
+        async def runner():
+            try:
+                await asyncio.to_thread(self._locked, func, *args)
+            except Exception as e:
+                metrics.incr("history_store_write_error_total")
+                logger.error(f"History store write failed ({func.__name__}): {str(e)}")
+
+        task = asyncio.create_task(runner())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _locked(self, func, *args):
+        with self._lock:
+            conn = self._conn
+            if conn is None:
+                return None
+            with conn:
+                return func(conn, *args)
+
+    async def _read(self, func, *args):
+        if not self.available:
+            return None
+        return await asyncio.to_thread(self._locked, func, *args)
+
+    # ----- capture -----------------------------------------------------------
+
+    def capture_turn(
+        self,
+        conversation_id: str,
+        message_id: str,
+        user: str,
+        query: str,
+        answer: str,
+        trace_id: Optional[str] = None,
+        created_at: Optional[int] = None,
+        new_conversation: bool = False
+    ) -> None:
+        """
+        Record a completed question/answer turn.
+
+        Args:
+            conversation_id: Dify conversation ID
+            message_id: Dify message ID
+            user: User identifier
+            query: User question
+            answer: Final answer text
+            trace_id: Trace ID sent to Dify
+            created_at: Turn start time (unix seconds)
+            new_conversation: True when this turn created the conversation, so
+                its whole history is known locally
+        """
+        if not conversation_id or not message_id:
+            return
+        self._run_in_background(
+            self._capture_turn_sync,
+            conversation_id, message_id, user, query or "", answer or "",
+            trace_id, int(created_at or time.time()), new_conversation
+        )
+
+    def _capture_turn_sync(
+        self, conn, conversation_id, message_id, user, query, answer, trace_id, created_at, new_conversation
+    ) -> None:
+        now = int(time.time())
+        conn.execute(
+            "INSERT INTO conversations (id, user, created_at, updated_at, synced) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET updated_at = MAX(conversations.updated_at, excluded.updated_at)",
+            (conversation_id, user, created_at, now, 1 if new_conversation else 0)
+        )
+        conn.execute(UPSERT_MESSAGE, (message_id, conversation_id, user, query, answer, trace_id, None, created_at, now))
+        metrics.incr("history_store_turns_captured_total")
+
+    def capture_conversations(self, user: str, result: Dict[str, Any]) -> None:
+        """Upsert conversation names and timestamps from a Dify list response."""
+        conversations = [conv for conv in (result.get("data") or []) if isinstance(conv, dict) and conv.get("id")]
+        if conversations:
+            self._run_in_background(self._capture_conversations_sync, user, conversations)
+
+    def _capture_conversations_sync(self, conn, user, conversations) -> None:
+        for conv in conversations:
+            upstream_updated = int(conv.get("updated_at") or conv.get("created_at") or 0)
+            row = conn.execute(
+                "SELECT updated_at, synced FROM conversations WHERE id = ?", (conv["id"],)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO conversations (id, user, name, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (conv["id"], user, conv.get("name") or "", int(conv.get("created_at") or 0), upstream_updated)
+                )
+                continue
+
+            # Activity we did not capture (another client, Dify console) invalidates the mirror.
+            stale = row["synced"] and upstream_updated > row["updated_at"] + UPDATED_AT_SLACK_SECONDS
+            if stale:
+                metrics.incr("history_store_invalidated_total")
+            conn.execute(
+                "UPDATE conversations SET name = ?, updated_at = MAX(updated_at, ?), "
+                "synced = CASE WHEN ? THEN 0 ELSE synced END, "
+                "backfill_first_id = CASE WHEN ? THEN NULL ELSE backfill_first_id END WHERE id = ?",
+                (conv.get("name") or "", upstream_updated, stale, stale, conv["id"])
+            )
+
+    def capture_messages_page(
+        self,
+        conversation_id: str,
+        user: str,
+        result: Dict[str, Any],
+        first_id: Optional[str] = None
+    ) -> None:
+        """
+        Store one page of Dify messages and track how much history is mirrored.
+
+        Pages are chained from the latest page backwards through ``first_id``;
+        once the chain reaches a page without ``has_more`` the conversation
+        is marked synced.
+        """
+        messages = [msg for msg in (result.get("data") or []) if isinstance(msg, dict) and msg.get("id")]
+        self._run_in_background(
+            self._capture_messages_page_sync, conversation_id, user, messages, bool(result.get("has_more")), first_id
+        )
+
+    def _capture_messages_page_sync(self, conn, conversation_id, user, messages, has_more, first_id) -> None:
+        now = int(time.time())
+        for msg in messages:
+            feedback = msg.get("feedback") if isinstance(msg.get("feedback"), dict) else {}
+            conn.execute(UPSERT_MESSAGE, (
+                msg["id"], conversation_id, user, msg.get("query") or "", msg.get("answer") or "",
+                None, feedback.get("rating"), int(msg.get("created_at") or now), now
+            ))
+
+        newest = max((int(msg.get("created_at") or 0) for msg in messages), default=0)
+        conn.execute(
+            "INSERT INTO conversations (id, user, created_at, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET updated_at = MAX(conversations.updated_at, excluded.updated_at)",
+            (conversation_id, user, min((int(msg.get("created_at") or now) for msg in messages), default=now), newest)
+        )
+        row = conn.execute(
+            "SELECT synced, backfill_first_id FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row["synced"]:
+            return
+
+        oldest_id = messages[0]["id"] if messages else None
+        if first_id is None or row["backfill_first_id"] == first_id:
+            if has_more:
+                conn.execute("UPDATE conversations SET backfill_first_id = ? WHERE id = ?", (oldest_id, conversation_id))
+            else:
+                conn.execute(
+                    "UPDATE conversations SET synced = 1, backfill_first_id = NULL WHERE id = ?", (conversation_id,)
+                )
+                metrics.incr("history_store_conversations_synced_total")
+
+    def set_feedback(self, message_id: str, rating: Optional[str]) -> None:
+        """Mirror a feedback rating onto the stored message."""
+        self._run_in_background(self._set_feedback_sync, message_id, rating)
+
+    def _set_feedback_sync(self, conn, message_id, rating) -> None:
+        conn.execute("UPDATE messages SET feedback_rating = ? WHERE id = ?", (rating, message_id))
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        """Remove a conversation and its messages from the mirror."""
+        self._run_in_background(self._delete_conversation_sync, conversation_id)
+
+    def _delete_conversation_sync(self, conn, conversation_id) -> None:
+        conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    # ----- reads -------------------------------------------------------------
+
+    async def get_messages(
+        self,
+        conversation_id: str,
+        user: str,
+        first_id: Optional[str] = None,
+        limit: int = 20
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Serve a page of messages in Dify's response shape.
+
+        Returns:
+            The page, or None when the conversation is not fully mirrored
+            (the caller should then ask Dify)
+        """
+        try:
+            result = await self._read(self._get_messages_sync, conversation_id, user, first_id, max(1, limit))
+        except Exception as e:
+            logger.error(f"History store read failed: {str(e)}")
+            result = None
+        metrics.incr("history_store_hit_total" if result is not None else "history_store_miss_total")
+        return result
+
+    def _get_messages_sync(self, conn, conversation_id, user, first_id, limit) -> Optional[Dict[str, Any]]:
+        conv = conn.execute(
+            "SELECT synced FROM conversations WHERE id = ? AND user = ?", (conversation_id, user)
+        ).fetchone()
+        if conv is None or not conv["synced"]:
+            return None
+
+        params: List[Any] = [conversation_id]
+        cursor_clause = ""
+        if first_id:
+            anchor = conn.execute(
+                "SELECT created_at, seq FROM messages WHERE id = ? AND conversation_id = ?", (first_id, conversation_id)
+            ).fetchone()
+            if anchor is None:
+                return None
+            cursor_clause = "AND (created_at < ? OR (created_at = ? AND seq < ?))"
+            params += [anchor["created_at"], anchor["created_at"], anchor["seq"]]
+
+        rows = conn.execute(
+            f"SELECT id, conversation_id, query, answer, feedback_rating, created_at FROM messages "
+            f"WHERE conversation_id = ? {cursor_clause} ORDER BY created_at DESC, seq DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+        has_more = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        return {
+            "limit": limit,
+            "has_more": has_more,
+            "data": [
+                {
+                    "id": row["id"],
+                    "conversation_id": row["conversation_id"],
+                    "query": row["query"],
+                    "answer": row["answer"],
+                    "created_at": row["created_at"],
+                    "feedback": {"rating": row["feedback_rating"]} if row["feedback_rating"] else None,
+                }
+                for row in rows
+            ],
+        }
+
+    async def search(self, user: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Full-text search over a user's stored questions and answers.
+
+        Args:
+            user: User identifier
+            query: Search text; whitespace-separated terms must all match
+            limit: Max hits, newest first
+
+        Returns:
+            Hits with message/conversation IDs, question and a highlighted snippet
+        """
+        started_at = time.monotonic()
+        hits = await self._read(self._search_sync, user, query, max(1, limit))
+        metrics.observe("history_search_seconds", time.monotonic() - started_at)
+        return hits or []
+
+    def _search_sync(self, conn, user, query, limit) -> List[Dict[str, Any]]:
+        terms = [term for term in query.split() if term]
+        if not terms:
+            return []
+
+        # Trigram needs >= 3 characters per term; shorter terms use LIKE instead.
+        use_fts = self.fts_tokenizer is not None and (
+            self.fts_tokenizer != "trigram" or all(len(term) >= 3 for term in terms)
+        )
+        if use_fts:
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+            sql = (
+                "SELECT m.id, m.conversation_id, c.name AS conversation_name, m.query, m.created_at, "
+                "snippet(messages_fts, 1, '**', '**', '…', 24) AS snippet "
+                "FROM messages_fts JOIN messages m ON m.seq = messages_fts.rowid "
+                "LEFT JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE messages_fts MATCH ? AND m.user = ? ORDER BY m.created_at DESC LIMIT ?"
+            )
+            params: List[Any] = [match, user, limit]
+        else:
+            clauses = []
+            params = []
+            for term in terms:
+                escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                clauses.append("(m.query LIKE ? ESCAPE '\\' OR m.answer LIKE ? ESCAPE '\\')")
+                params += [f"%{escaped}%", f"%{escaped}%"]
+            sql = (
+                "SELECT m.id, m.conversation_id, c.name AS conversation_name, m.query, m.created_at, "
+                "substr(m.answer, 1, 160) AS snippet "
+                "FROM messages m LEFT JOIN conversations c ON c.id = m.conversation_id "
+                f"WHERE m.user = ? AND {' AND '.join(clauses)} ORDER BY m.created_at DESC LIMIT ?"
+            )
+            params = [user, *params, limit]
+
+        rows = conn.execute(sql, params).fetchall()
+        return [
+            {
+                "message_id": row["id"],
+                "conversation_id": row["conversation_id"],
+                "conversation_name": row["conversation_name"] or "",
+                "query": row["query"],
+                "snippet": row["snippet"] or "",
+                "created_at": row["created_at"],
+            }
+            for row in rows
+        ]
+
+
+# Global store instance
+history_store = HistoryStore(settings.HISTORY_DB_PATH, enabled=settings.HISTORY_STORE_ENABLED)
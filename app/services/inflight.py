@@ -0,0 +1,169 @@
+"""Deduplication of identical chat streams that are in flight."""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class InflightStream:
+    """One upstream stream and the subscriber queues it fans out to."""
+
+    def __init__(self, key: str, trace_id: str):
+        self.key = key
+        self.trace_id = trace_id
+        self.events: List[str] = []
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class InflightRegistry:
+    """
+    Shares one upstream stream between identical chat requests.
+
+    Requests are keyed on user, conversation, whitespace-normalized query,
+    inputs and stream format. A duplicate that arrives while the stream is
+    running gets every event emitted so far replayed into its queue followed
+    by the live tail. The upstream is cancelled only when its last subscriber
+    leaves. A stream is forgotten as soon as it ends, so a deliberate re-run
+    of the same question starts a new upstream call; with ``window_seconds``
+    above 0 a completed stream (and its events) is kept that much longer
+    for late duplicates such as a double click.
+
+    Subscriber queues receive ``("chunk", str)``, then ``("done", None)`` or
+    ``("error", Exception)``.
+    """
+
+    def __init__(self, window_seconds: float = 0.0):
+        self.window_seconds = window_seconds
+        self._streams: Dict[str, InflightStream] = {}
+
+    @staticmethod
+    def make_key(
+        user: str,
+        conversation_id: Optional[str],
+        query: str,
+        inputs: Optional[Dict[str, Any]],
+        stream_format: Optional[str]
+    ) -> str:
+        material = json.dumps(
+            [user, conversation_id or "", " ".join(query.split()), inputs or {}, stream_format or ""],
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.blake2b(material.encode("utf-8"), digest_size=16).hexdigest()
+
+    def subscribe(
+        self,
+        key: str,
+        trace_id: str,
+        start: Callable[[], AsyncIterator[str]]
+    ) -> Tuple[asyncio.Queue, InflightStream, bool]:
+        """
+        Attach to the running stream for ``key`` or start a new one.
+
+        Args:
+            key: Request key from make_key
+            trace_id: Trace ID of the subscribing request
+            start: Opens the upstream stream when no shared one exists
+
+        Returns:
+            (queue, stream, attached) where attached is True for a duplicate
+        """
+        stream = self._streams.get(key)
+        attached = stream is not None
+        if stream is None:
+            stream = InflightStream(key, trace_id)
+            self._streams[key] = stream
+            stream.task = asyncio.create_task(self._pump(stream, start()))
+        else:
+            metrics.incr("inflight_dedup_total")
+            logger.info(f"Request {trace_id} attached to in-flight stream {stream.trace_id} ({len(stream.events)} events to replay)")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for chunk in stream.events:
+            queue.put_nowait(("chunk", chunk))
+        if stream.finished_at is not None:
+            queue.put_nowait(("done", None))
+        else:
+            stream.subscribers.add(queue)
+        return queue, stream, attached
+
+    def unsubscribe(self, stream: InflightStream, queue: asyncio.Queue) -> None:
+        """Detach a subscriber; the last one to leave a running stream cancels it."""
+        stream.subscribers.discard(queue)
+        if not stream.subscribers and stream.finished_at is None and stream.task and not stream.task.done():
+            logger.info(f"Last subscriber left stream {stream.trace_id}, cancelling upstream")
+            # Forgotten now, not when the cancellation lands: the task may not have
+            # started yet, and later duplicates must not attach to a dying stream
+            self._forget(stream)
+            stream.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams": len(self._streams),
+            "running": sum(1 for stream in self._streams.values() if stream.finished_at is None),
+            "subscribers": sum(len(stream.subscribers) for stream in self._streams.values()),
+            "event_bytes": sum(sum(len(chunk) for chunk in stream.events) for stream in self._streams.values()),
+        }
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Replay buffer of every shared stream, largest first (for /debug/memory)."""
+        now = time.monotonic()
+        streams = []
+        for stream in self._streams.values():
+            streams.append({
+                "trace_id": stream.trace_id,
+                "finished_seconds_ago": round(now - stream.finished_at, 1) if stream.finished_at is not None else None,
+                "subscribers": len(stream.subscribers),
+                "events": len(stream.events),
+                "event_bytes": sum(len(chunk) for chunk in stream.events),
+            })
+        return sorted(streams, key=lambda stream: stream["event_bytes"], reverse=True)
+
+    async def _pump(self, stream: InflightStream, chunks: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in chunks:
+                stream.events.append(chunk)
+                for queue in stream.subscribers:
+                    queue.put_nowait(("chunk", chunk))
+        except asyncio.CancelledError:
+            self._forget(stream)
+            error = Exception(f"Shared upstream stream {stream.trace_id} was cancelled")
+            for queue in stream.subscribers:
+                queue.put_nowait(("error", error))
+            stream.subscribers.clear()
+            raise
+        except Exception as e:
+            self._forget(stream)
+            for queue in stream.subscribers:
+                queue.put_nowait(("error", e))
+        else:
+            stream.finished_at = time.monotonic()
+            for queue in stream.subscribers:
+                queue.put_nowait(("done", None))
+            if self.window_seconds > 0:
+                asyncio.get_running_loop().call_later(self.window_seconds, self._expire, stream)
+            else:
+                self._forget(stream)
+        stream.subscribers.clear()
+
+    def _forget(self, stream: InflightStream) -> None:
+        if self._streams.get(stream.key) is stream:
+            del self._streams[stream.key]
+
+    def _expire(self, stream: InflightStream) -> None:
+        self._forget(stream)
+        # Subscriber queues already hold their copies
+        stream.events = []
+
+# Global registry instance
+inflight_streams = InflightRegistry(window_seconds=settings.INFLIGHT_DEDUP_WINDOW_SECONDS)
@@ -0,0 +1,638 @@
+"""
+Server-side rendering of bot answers.
+
+Python port of ``ChatBot.markdownToHtml`` (static/chat.js) and
+``ChartExtract.extractTableChartConfig`` (static/chart-extract.js), so
+history pages can ship ready-made HTML and chart configs. Keep the two in
+step and bump ``RENDERER_VERSION`` when the output changes. Unlike the
+browser path, the HTML is sanitized against a tag/attribute allowlist.
+"""
+import html
+import math
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.stream_sanitizer import ARTIFACT_PATTERN
+
+# Part of the render cache key: bump whenever the rendered output changes.
+RENDERER_VERSION = "2"
+
+SECTION_HEADING_WHITELIST = ["总体概览", "关键指标", "异常提示", "建议操作", "具体明细"]
+CHART_QUESTION_KEYWORDS = ["图表", "chart", "柱状图", "饼图", "趋势图"]
+DEFAULT_MAX_POINTS = 12
+LINE_MAX_POINTS = 5000
+
+PRESERVED_TAG_PATTERN = re.compile(r"<(details|summary|/details|/summary|pre|code|/pre|/code)>")
+CODE_BLOCK_PATTERN = re.compile(r"```([A-Za-z0-9_]*)?\n?([\s\S]*?)```")
+TABLE_PATTERN = re.compile(r"\|(.+)\|\n\|[-:\s|]+\|\n((?:\|.+\|\n?)+)")
+URL_PATTERN = re.compile(r"(https?://[^\s<]+)")
+NUMBER_PATTERN = re.compile(r"(-?[0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]+)?%?)")
+BLOCK_TAGS = "ul|ol|li|h1|h2|h3|blockquote|pre|div|table|tr|thead|tbody"
+
+# Sanitizer allowlist. Elements outside it are unwrapped (children kept),
+# except DROP_WITH_CONTENT, which disappear entirely.
+ALLOWED_TAGS = {
+    "a", "b", "blockquote", "br", "code", "del", "details", "div", "em", "h1", "h2", "h3", "h4",
+    "h5", "h6", "hr", "i", "li", "ol", "p", "pre", "s", "span", "strong", "sub", "summary", "sup",
+    "table", "tbody", "td", "th", "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRIBUTES = {
+    "*": {"class", "title"},
+    "a": {"href", "target", "rel"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan"},
+    "details": {"open"},
+}
+DROP_WITH_CONTENT = {"script", "style", "iframe", "object", "embed", "template", "textarea", "noscript", "svg", "math"}
+VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "wbr", "area", "base", "col", "embed", "source", "track"}
+SAFE_URL_PATTERN = re.compile(r"^(https?:|mailto:|/|#)", re.IGNORECASE)
+
+
+# --- Text cleanup -------------------------------------------------------------
+
+def remove_artifact_text(text: str) -> str:
+    """Port of ``removeArtifactText``: normalize newlines and drop Dify file artifacts."""
+    normalized = str(text or "").replace("\r\n", "\n").replace("\r", "\n").replace("\\n", "\n")
+    normalized = re.sub("[\u200b-\u200d\ufeff]", "", normalized)
+    normalized = ARTIFACT_PATTERN.sub("", normalized)
+    normalized = re.sub(r"(^|\n)[\t \f\v]*\.[\t \f\v]*(?=\n|$)", r"\1", normalized)
+    normalized = re.sub(r"^\s*$", "", normalized, flags=re.MULTILINE)
+    normalized = re.sub(r"\n{3,}", "\n\n", normalized)
+    return normalized.strip()
+
+
+def escape_html(text: str) -> str:
+    return html.escape(text, quote=True).replace("&#x27;", "&#039;")
+
+
+# --- Markdown -----------------------------------------------------------------
+
+def markdown_to_html(markdown: str) -> str:
+    """
+    Convert an answer to sanitized HTML, mirroring ``markdownToHtml``.
+
+    Args:
+        markdown: Answer text, already passed through ``remove_artifact_text``
+
+    Returns:
+        HTML fragment
+    """
+    text = markdown
+    preserved_tags: List[str] = []
+
+    def preserve(match: "re.Match") -> str:
+        preserved_tags.append(match.group(0))
+        return f"__HTML_TAG_{len(preserved_tags) - 1}__"
+
+    text = PRESERVED_TAG_PATTERN.sub(preserve, text)
+
+    def code_block(match: "re.Match") -> str:
+        language = match.group(1) or "text"
+        return f'<pre class="code-block {language}"><code>{escape_html(match.group(2).strip())}</code></pre>'
+
+    text = CODE_BLOCK_PATTERN.sub(code_block, text)
+    text = re.sub(r"`([^`]+)`", r'<code class="inline-code">\1</code>', text)
+    text = re.sub(r"^> (.+)$", r"<blockquote>\1</blockquote>", text, flags=re.MULTILINE)
+    text = TABLE_PATTERN.sub(_render_table, text)
+
+    text = re.sub(r"^### (.+)$", r'<h3 class="markdown-h3">\1</h3>', text, flags=re.MULTILINE)
+    text = re.sub(r"^## (.+)$", r'<h2 class="markdown-h2">\1</h2>', text, flags=re.MULTILINE)
+    text = re.sub(r"^# (.+)$", r'<h1 class="markdown-h1">\1</h1>', text, flags=re.MULTILINE)
+    text = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", text)
+    text = re.sub(r"\*([^*]+)\*", r"<em>\1</em>", text)
+    text = URL_PATTERN.sub(_linkify, text)
+
+    # Blank lines between list items would otherwise become stray <br>s.
+    text = re.sub(r"\n\n(- )", r"\n\1", text)
+    text = re.sub(r"\n\n([0-9]+\. )", r"\n\1", text)
+    text = re.sub(r"^([0-9]+)\.\s+(.+)$", r'<li class="ordered">\2</li>', text, flags=re.MULTILINE)
+    if '<li class="ordered">' in text:
+        text = re.sub(
+            r'(<li class="ordered">.*</li>\n?)+',
+            lambda match: "<ol>" + match.group(0).replace(' class="ordered"', "") + "</ol>",
+            text
+        )
+    text = _render_unordered_lists(text)
+
+    text = text.replace("\n", "<br>")
+    text = re.sub(rf"(<br>)+(</?(?:{BLOCK_TAGS})[^>]*>)", r"\2", text)
+    text = re.sub(rf"(</?(?:{BLOCK_TAGS})[^>]*>)(<br>)+", r"\1", text)
+    text = re.sub(r"(<br>){2,}", "<br>", text)
+
+    for index, tag in enumerate(preserved_tags):
+        text = text.replace(f"__HTML_TAG_{index}__", tag, 1)
+
+    text = _emphasize_key_numbers(text)
+    root = _parse_fragment(text)
+    if "<ul>" in text or "<ol>" in text:
+        _enhance_reply_sections(root)
+    return _serialize(root.children)
+
+
+def _render_table(match: "re.Match") -> str:
+    headers = [cell.strip() for cell in match.group(1).split("|") if cell.strip()]
+    rows = [
+        [cell.strip() for cell in row.split("|") if cell.strip()]
+        for row in match.group(2).strip().split("\n")
+    ]
+    table = '<table class="mes-table"><thead><tr>'
+    table += "".join(f"<th>{header}</th>" for header in headers)
+    table += "</tr></thead><tbody>"
+    for row in rows:
+        table += "<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>"
+    table += "</tbody></table>"
+    return f'<div class="mes-table-wrapper">{table}</div>'
+
+
+def _linkify(match: "re.Match") -> str:
+    url = match.group(1)
+    trailing = ""
+    if re.search(r"[.,!?;:)]$", url):
+        url, trailing = url[:-1], url[-1]
+    return f'<a href="{url}" target="_blank" rel="noopener noreferrer">{url}</a>{trailing}'
+
+
+def _render_unordered_lists(text: str) -> str:
+    result: List[str] = []
+    indent_stack: List[int] = []
+    open_li_stack: List[bool] = []
+
+    def close_list_item_at_level(level: int) -> None:
+        if open_li_stack[level]:
+            result.append("</li>")
+            open_li_stack[level] = False
+
+    def close_lists_until_indent(indent: int) -> None:
+        while indent_stack and indent_stack[-1] > indent:
+            close_list_item_at_level(len(indent_stack) - 1)
+            result.append("</ul>")
+            indent_stack.pop()
+            open_li_stack.pop()
+
+    for line in text.split("\n"):
+        match = re.match(r"^(\s*)-\s+(.+)\Z", line)
+        if not match:
+            close_lists_until_indent(-1)
+            if line:
+                result.append(line)
+            continue
+
+        indent = len(match.group(1).replace("\t", "    "))
+        content = match.group(2).strip()
+        if not content:
+            continue
+
+        close_lists_until_indent(indent)
+        if not indent_stack or indent > indent_stack[-1]:
+            result.append("<ul>")
+            indent_stack.append(indent)
+            open_li_stack.append(False)
+        else:
+            close_list_item_at_level(len(indent_stack) - 1)
+
+        result.append(f"<li>{content}")
+        open_li_stack[-1] = True
+
+    close_lists_until_indent(-1)
+    return "\n".join(result)
+
+
+def _should_emphasize_numeric_token(token: str) -> bool:
+    clean_token = str(token or "").strip()
+    if not clean_token:
+        return False
+    if "%" in clean_token or "." in clean_token or "," in clean_token:
+        return True
+    digits = re.sub(r"[^0-9-]", "", clean_token).replace("-", "", 1)
+    return len(digits) >= 2
+
+
+def _emphasize_key_numbers(text: str) -> str:
+    def emphasize(match: "re.Match") -> str:
+        token = match.group(0)
+        if not _should_emphasize_numeric_token(token):
+            return token
+        return f'<strong class="key-number">{token}</strong>'
+
+    parts = re.split(r"(<[^>]+>)", text)
+    return "".join(part if not part or part.startswith("<") else NUMBER_PATTERN.sub(emphasize, part) for part in parts)
+
+
+# --- Fragment tree (section layout + sanitizing serializer) -------------------
+
+class _Node:
+    __slots__ = ("tag", "attrs", "children", "text")
+
+    def __init__(self, tag: Optional[str] = None, attrs: Optional[List[Tuple[str, Optional[str]]]] = None, text: str = ""):
+        self.tag = tag
+        self.attrs = attrs or []
+        self.children: List["_Node"] = []
+        self.text = text
+
+    @property
+    def is_text(self) -> bool:
+        return self.tag is None
+
+    def text_content(self) -> str:
+        if self.is_text:
+            return self.text
+        return "".join(child.text_content() for child in self.children)
+
+    def get_class(self) -> str:
+        return next((value or "" for name, value in self.attrs if name == "class"), "")
+
+    def add_class(self, class_name: str) -> None:
+        classes = self.get_class().split()
+        if class_name not in classes:
+            classes.append(class_name)
+        self.attrs = [(name, value) for name, value in self.attrs if name != "class"] + [("class", " ".join(classes))]
+
+
+class _FragmentParser(HTMLParser):
+    """Builds a lenient element tree, roughly as ``innerHTML`` would."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node("#root")
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "li" and self.stack[-1].tag == "li":
+            self.stack.pop()
+        node = _Node(tag, attrs)
+        self.stack[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.stack[-1].children.append(_Node(tag, attrs))
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        children = self.stack[-1].children
+        if children and children[-1].is_text:
+            children[-1].text += data
+        else:
+            children.append(_Node(text=data))
+
+
+def _parse_fragment(fragment: str) -> _Node:
+    parser = _FragmentParser()
+    parser.feed(fragment)
+    parser.close()
+    return parser.root
+
+
+def _serialize(nodes: List[_Node]) -> str:
+    parts: List[str] = []
+    for node in nodes:
+        if node.is_text:
+            parts.append(html.escape(node.text, quote=False))
+            continue
+        if node.tag in DROP_WITH_CONTENT:
+            continue
+        if node.tag not in ALLOWED_TAGS:
+            parts.append(_serialize(node.children))
+            continue
+
+        allowed = ALLOWED_ATTRIBUTES["*"] | ALLOWED_ATTRIBUTES.get(node.tag, set())
+        attrs = []
+        for name, value in node.attrs:
+            if name not in allowed:
+                continue
+            if name == "href" and not SAFE_URL_PATTERN.match((value or "").strip()):
+                continue
+            attrs.append(f' {name}="{html.escape(value or "", quote=True)}"')
+        if node.tag == "a" and any(name == "target" for name, _ in node.attrs):
+            attrs = [attr for attr in attrs if not attr.startswith(" rel=")] + [' rel="noopener noreferrer"']
+
+        parts.append(f"<{node.tag}{''.join(attrs)}>")
+        if node.tag not in VOID_TAGS:
+            parts.append(_serialize(node.children))
+            parts.append(f"</{node.tag}>")
+    return "".join(parts)
+
+
+def _enhance_reply_sections(root: _Node) -> None:
+    """Port of ``enhanceReplySections``: auto headings and section wrappers around lists."""
+    root.children = _wrap_reply_sections(_promote_inline_text_to_section_heading(root.children))
+    _update_section_divider_state(root.children)
+
+
+def _is_break_or_text(node: _Node) -> bool:
+    return node.is_text or node.tag == "br"
+
+
+def _is_list(node: _Node) -> bool:
+    return node.tag in ("ul", "ol")
+
+
+def _is_heading(node: _Node) -> bool:
+    return node.tag in ("h1", "h2", "h3")
+
+
+def _is_ignorable_spacing(node: _Node) -> bool:
+    if node.is_text:
+        return not node.text.strip()
+    return node.tag == "br"
+
+
+def _promote_inline_text_to_section_heading(children: List[_Node]) -> List[_Node]:
+    result: List[_Node] = []
+    pending: List[_Node] = []
+    for node in children:
+        if _is_break_or_text(node):
+            pending.append(node)
+            continue
+        if _is_list(node):
+            heading_text = _extract_section_heading_text(pending)
+            if heading_text:
+                pending = []
+                heading = _Node("h3", [("class", "markdown-h3 markdown-section-heading markdown-auto-heading")])
+                heading.children.append(_Node(text=_format_section_heading_text(heading_text)))
+                result.extend([heading, node])
+                continue
+        result.extend(pending)
+        pending = []
+        result.append(node)
+    result.extend(pending)
+    return result
+
+
+def _extract_section_heading_text(nodes: List[_Node]) -> Optional[str]:
+    if not nodes:
+        return None
+
+    lines: List[str] = []
+    current_line = ""
+    for node in nodes:
+        if node.is_text:
+            current_line += node.text
+        elif node.tag == "br":
+            lines.append(current_line.strip())
+            current_line = ""
+    lines.append(current_line.strip())
+
+    meaningful_lines = [line for line in (re.sub(r"\s+", " ", line).strip() for line in lines) if line]
+    if not meaningful_lines or len(meaningful_lines) > 2:
+        return None
+    if len(meaningful_lines) == 2 and not _is_likely_heading_lead_in(meaningful_lines[0]):
+        return None
+
+    candidate = meaningful_lines[-1]
+    if not candidate or len(candidate) > 48:
+        return None
+    if re.search(r"[。！？!?]$", candidate) and not re.search(r"[：:]$", candidate):
+        return None
+    if not _is_whitelisted_section_heading(candidate):
+        return None
+    return re.sub(r"[：:]\s*$", "", candidate).strip() or None
+
+
+def _is_whitelisted_section_heading(text: str) -> bool:
+    normalized = re.sub(r"[：:]", "", str(text or ""))
+    normalized = re.sub(r"[()（）\[\]【】]", "", normalized)
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    return bool(normalized) and any(keyword in normalized for keyword in SECTION_HEADING_WHITELIST)
+
+
+def _is_likely_heading_lead_in(text: str) -> bool:
+    normalized = str(text or "").strip()
+    return bool(normalized) and len(normalized) <= 24 and bool(re.search(r"[：:]$", normalized))
+
+
+def _format_section_heading_text(text: str) -> str:
+    formatted = re.sub(r"\s+", " ", str(text or ""))
+    formatted = re.sub(r"(?<=[\u4e00-\u9fff]) (?=[\u4e00-\u9fff(（0-9A-Za-z])", "\u00a0", formatted)
+    formatted = re.sub(r"(?<=[(（0-9A-Za-z]) (?=[\u4e00-\u9fff])", "\u00a0", formatted)
+    return formatted.strip()
+
+
+def _wrap_reply_sections(children: List[_Node]) -> List[_Node]:
+    result: List[_Node] = []
+    index = 0
+    while index < len(children):
+        node = children[index]
+        if _is_heading(node):
+            list_index = _find_next_list_index(children, index + 1)
+            if list_index != -1:
+                section = _Node("div", [("class", "markdown-section")])
+                section.children.extend([node, children[list_index]])
+                result.append(section)
+                index = list_index + 1
+                continue
+
+        if _is_list(node):
+            section = _Node("div", [("class", "markdown-section markdown-section-list-only")])
+            section.children.append(node)
+            result.append(section)
+        elif not _is_ignorable_spacing(node):
+            result.append(node)
+        index += 1
+    return result
+
+
+def _find_next_list_index(children: List[_Node], start_index: int) -> int:
+    for index in range(start_index, len(children)):
+        if _is_list(children[index]):
+            return index
+        if not _is_ignorable_spacing(children[index]):
+            return -1
+    return -1
+
+
+def _update_section_divider_state(children: List[_Node]) -> None:
+    sections = [node for node in children if not node.is_text and "markdown-section" in node.get_class().split()]
+    for index, section in enumerate(sections):
+        if "markdown-section-list-only" not in section.get_class().split():
+            continue
+        if any(re.sub(r"\s+", "", following.text_content()) for following in sections[index + 1:]):
+            section.add_class("markdown-section-has-divider")
+
+
+# --- Chart extraction ---------------------------------------------------------
+
+def should_generate_chart_for_question(question: str) -> bool:
+    source = str(question or "").lower()
+    return bool(source) and any(keyword in source for keyword in CHART_QUESTION_KEYWORDS)
+
+
+def get_requested_chart_type(question: str) -> Optional[str]:
+    """Port of ``getRequestedChartTypeFromQuestion``."""
+    source = re.sub(r"[\s\-_]+", "", str(question or "").lower())
+    source = re.sub(r"[，。！？、；：,.!?;:()（）【】\[\]\"'“”‘’]", "", source)
+    if not source:
+        return None
+    if any(keyword in source for keyword in ("饼图", "饼状图", "pie", "piechart")):
+        return "pie"
+    if any(keyword in source for keyword in ("柱状图", "条形图", "barchart", "bar")):
+        return "bar"
+    if any(keyword in source for keyword in ("趋势图", "折线图", "走势图", "linechart", "line", "trend")):
+        return "line"
+    return None
+
+
+def _strip_markdown_syntax(text: str) -> str:
+    stripped = re.sub(r"<[^>]*>", "", str(text or ""))
+    stripped = re.sub(r"\*\*|__", "", stripped)
+    return re.sub(r"[*_`~]", "", stripped).strip()
+
+
+def _numeric_value(text: str) -> Optional[float]:
+    match = re.search(r"-?[0-9]+(?:\.[0-9]+)?", str(text or "").replace(",", "").strip())
+    if not match:
+        return None
+    value = float(match.group(0))
+    return value if math.isfinite(value) else None
+
+
+def _is_time_like_label(label: str) -> bool:
+    return bool(re.search(
+        r"([0-9]{4}[-/.年][0-9]{1,2}|[0-9]{1,2}[-/.月][0-9]{1,2}|[0-9]{1,2}月|Q[1-4]|第[一二三四]季|周|星期|周[一二三四五六日天]|[0-9]{4}年"
+        r"|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)",
+        str(label or "").strip(),
+        re.IGNORECASE
+    ))
+
+
+def _is_total_like_label(label: str) -> bool:
+    normalized = re.sub(r"[\s_\-:：]", "", str(label or "").lower())
+    return bool(re.search(r"(合计|总计|汇总|小计|total|sum|grandtotal)", normalized, re.IGNORECASE))
+
+
+def _markdown_table_rows(content: str) -> List[str]:
+    lines = [line.strip() for line in str(content or "").split("\n")]
+    table_lines = [line for line in lines if line.startswith("|") and line.endswith("|")]
+    return table_lines[2:] if len(table_lines) >= 3 else []
+
+
+def _pair(label: str, raw_value: str) -> Optional[Dict[str, Any]]:
+    value = _numeric_value(raw_value)
+    if not label or value is None:
+        return None
+    return {"label": label, "value": value, "raw_value": raw_value}
+
+
+def _pairs_from_markdown_table(content: str) -> List[Dict[str, Any]]:
+    pairs = []
+    for row in _markdown_table_rows(content):
+        cells = [cell for cell in (_strip_markdown_syntax(cell) for cell in row.split("|")) if cell]
+        if len(cells) >= 2:
+            pair = _pair(cells[0], cells[1])
+            if pair:
+                pairs.append(pair)
+    return pairs
+
+
+def _pairs_from_cells(cells: List[str]) -> Optional[Dict[str, Any]]:
+    """Last column is the value; a leading sequence-number column moves the label to column two."""
+    if len(cells) < 2 or _numeric_value(cells[-1]) is None:
+        return None
+    label = _strip_markdown_syntax(cells[1] if len(cells) >= 3 and re.fullmatch(r"[0-9]+", cells[0]) else cells[0])
+    return _pair(label, cells[-1])
+
+
+def _pairs_from_table_rows(content: str) -> List[Dict[str, Any]]:
+    pairs = []
+    for row in _markdown_table_rows(content):
+        pair = _pairs_from_cells([cell for cell in (_strip_markdown_syntax(cell) for cell in row.split("|")) if cell])
+        if pair:
+            pairs.append(pair)
+    return pairs
+
+
+def _pairs_from_structured_rows(content: str) -> List[Dict[str, Any]]:
+    lines = [line.strip() for line in str(content or "").split("\n") if line.strip()]
+    if len(lines) < 3:
+        return []
+
+    def split_columns(line: str) -> List[str]:
+        separator = r"\t+" if "\t" in line else r"\s{2,}"
+        return [cell for cell in (_strip_markdown_syntax(cell) for cell in re.split(separator, line)) if cell]
+
+    if len(split_columns(lines[0])) < 2:
+        return []
+    pairs = []
+    for row in lines[1:]:
+        pair = _pairs_from_cells(split_columns(row))
+        if pair:
+            pairs.append(pair)
+    return pairs
+
+
+def _split_display_and_total_pairs(pairs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[float]]:
+    display_pairs = [pair for pair in pairs if not _is_total_like_label(pair["label"])]
+    percent_base = next(
+        (pair["value"] for pair in pairs if _is_total_like_label(pair["label"]) and pair["value"] > 0),
+        None
+    )
+    if percent_base is None:
+        total = sum(pair["value"] for pair in display_pairs)
+        percent_base = total if total > 0 else None
+    return display_pairs, percent_base
+
+
+def _infer_chart_type(content: str, labels: List[str], pairs: List[Dict[str, Any]]) -> str:
+    has_trend_keyword = re.search(
+        r"(趋势|走势|变化|按月|按周|按日|同比|环比|trend|timeline|over\s*time|time\s*series|month|week|day)",
+        content,
+        re.IGNORECASE
+    )
+    has_ratio_keyword = re.search(r"(占比|比例|构成|份额|百分比|distribution|ratio|share|composition)", content, re.IGNORECASE)
+    time_like_count = sum(1 for label in labels if _is_time_like_label(label))
+    has_percent_value = any("%" in pair["raw_value"] for pair in pairs)
+    is_near_hundred = abs(sum(pair["value"] for pair in pairs) - 100) <= 2
+
+    if has_trend_keyword or time_like_count >= max(2, math.ceil(len(labels) * 0.6)):
+        return "line"
+    if has_ratio_keyword or has_percent_value or is_near_hundred:
+        return "pie"
+    return "bar"
+
+
+def _build_chart_config(text: str, pairs: List[Dict[str, Any]], requested_type: Optional[str]) -> Optional[Dict[str, Any]]:
+    display_pairs, percent_base = _split_display_and_total_pairs(pairs)
+    if len(display_pairs) < 2:
+        return None
+
+    head_pairs = display_pairs[:DEFAULT_MAX_POINTS]
+    chart_type = requested_type or _infer_chart_type(text, [pair["label"] for pair in head_pairs], head_pairs)
+    data = display_pairs[:LINE_MAX_POINTS] if chart_type == "line" else head_pairs
+    return {
+        "chartType": chart_type,
+        "labels": [pair["label"] for pair in data],
+        "values": [pair["value"] for pair in data],
+        "percentBase": percent_base,
+    }
+
+
+def extract_table_chart_config(content: str, requested_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Port of ``ChartExtract.extractTableChartConfig``; same camelCase keys as the browser version."""
+    text = str(content or "").strip()
+    if not text:
+        return None
+    for extract in (_pairs_from_markdown_table, _pairs_from_table_rows, _pairs_from_structured_rows):
+        config = _build_chart_config(text, extract(text), requested_type)
+        if config:
+            return config
+    return None
+
+
+def render_answer(answer: str, question: str = "") -> Dict[str, Any]:
+    """
+    Render one bot answer the way the history view would.
+
+    Returns:
+        {"html": sanitized fragment, "chart": chart config or None}; the chart
+        is only built when the question asks for one, as in the browser.
+    """
+    chart = None
+    if should_generate_chart_for_question(question):
+        chart = extract_table_chart_config(answer, get_requested_chart_type(question))
+    return {"html": markdown_to_html(remove_artifact_text(answer)), "chart": chart}
@@ -0,0 +1,72 @@
+"""In-process metrics registry (counters and sliding-window timings)."""
+import math
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Tuple
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """Build count / p50 / p95 / p99 / max summary for a list of samples."""
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50": round(percentile(ordered, 50), 4),
+        "p95": round(percentile(ordered, 95), 4),
+        "p99": round(percentile(ordered, 99), 4),
+        "max": round(ordered[-1], 4) if ordered else 0.0,
+    }
+
+
+class MetricsRegistry:
+    """
+    Lightweight metrics store living in the application process.
+
+    Counters are monotonic integers. Timings keep the most recent samples
+    (bounded by ``max_samples`` and ``window_seconds``) so percentiles
+    reflect current behaviour rather than process lifetime.
+    """
+
+    def __init__(self, max_samples: int = 2048, window_seconds: float = 900.0):
+        self.max_samples = max_samples
+        self.window_seconds = window_seconds
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = defaultdict(
+            lambda: deque(maxlen=self.max_samples)
+        )
+
+    def incr(self, name: str, value: int = 1) -> None:
+        self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        self._samples[name].append((time.monotonic(), float(value)))
+
+    def _window_values(self, name: str) -> List[float]:
+        samples = self._samples.get(name)
+        if not samples:
+            return []
+        cutoff = time.monotonic() - self.window_seconds
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return [value for _, value in samples]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "counters": dict(sorted(self._counters.items())),
+            "timings": {
+                name: summarize(self._window_values(name))
+                for name in sorted(self._samples)
+            },
+            "window_seconds": self.window_seconds,
+        }
+
+
+# Global metrics instance
+metrics = MetricsRegistry()
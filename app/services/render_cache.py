@@ -0,0 +1,187 @@
+"""Cache of pre-rendered history answers (memory LRU with on-disk spill)."""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.markdown_render import RENDERER_VERSION, render_answer
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """
+    Rendered answers keyed by message ID and content hash.
+
+    Entries live in an LRU bounded by ``max_chars`` of HTML. Evicted entries
+    (and everything still in memory at shutdown) are spilled to
+    ``spill_dir`` as small JSON files, so a restart or a long-unvisited
+    conversation costs a file read instead of a re-render. The spill
+    directory is pruned to ``max_spill_files`` by age.
+    """
+
+    def __init__(self, max_chars: int = 8000000, spill_dir: str = "", max_spill_files: int = 20000):
+        self.max_chars = max_chars
+        self.spill_dir = pathlib.Path(spill_dir) if spill_dir else None
+        self.max_spill_files = max_spill_files
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._chars = 0
+        self._spill_count: Optional[int] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def cache_key(message_id: str, answer: str, question: str) -> str:
+        digest = hashlib.blake2b(
+            f"{RENDERER_VERSION}\0{question}\0{answer}".encode("utf-8"), digest_size=12
+        ).hexdigest()
+        return f"{message_id}-{digest}"
+
+    async def annotate(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return a copy of a messages page with ``rendered`` added to every answer.
+
+        Args:
+            page: Dify messages page (``data`` in chronological order)
+
+        Returns:
+            New page dict; each message with an answer gets
+            ``rendered: {"html": ..., "chart": ...}``
+        """
+        messages = page.get("data") or []
+        keyed: List[Tuple[int, str]] = []
+        misses: Dict[str, Tuple[str, str]] = {}
+        results: Dict[str, Dict[str, Any]] = {}
+        for index, message in enumerate(messages):
+            answer = message.get("answer")
+            if not answer:
+                continue
+            question = message.get("query") or ""
+            key = self.cache_key(str(message.get("id") or index), answer, question)
+            keyed.append((index, key))
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                results[key] = entry
+            else:
+                misses[key] = (answer, question)
+
+        metrics.incr("render_cache_hits_total", len(results))
+        if misses:
+            started_at = time.monotonic()
+            loaded, spill_hits = await asyncio.to_thread(self._load_or_render, misses)
+            metrics.observe("render_cache_fill_seconds", time.monotonic() - started_at)
+            metrics.incr("render_cache_spill_hits_total", spill_hits)
+            metrics.incr("render_cache_misses_total", len(misses) - spill_hits)
+            for key, entry in loaded.items():
+                results[key] = entry
+                self._put(key, entry)
+
+        annotated = list(messages)
+        for index, key in keyed:
+            annotated[index] = {**messages[index], "rendered": results[key]}
+        return {**page, "data": annotated}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "chars": self._chars, "spill_files": self._spill_count}
+
+    async def close(self) -> None:
+        """Spill what is still in memory and wait for pending writes."""
+        if self.spill_dir is not None and self._entries:
+            self._spill(list(self._entries.items()))
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _put(self, key: str, entry: Dict[str, Any]) -> None:
+        self._entries[key] = entry
+        self._chars += len(entry["html"])
+        evicted = []
+        while self._chars > self.max_chars and len(self._entries) > 1:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._chars -= len(old_entry["html"])
+            evicted.append((old_key, old_entry))
+        if evicted and self.spill_dir is not None:
+            self._spill(evicted)
+
+    def _load_or_render(self, misses: Dict[str, Tuple[str, str]]) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """Read spilled entries or render (runs in a worker thread). Returns entries and spill hits."""
+        loaded = {}
+        spill_hits = 0
+        for key, (answer, question) in misses.items():
+            entry = self._read_spill_file(key)
+            if entry is not None:
+                spill_hits += 1
+            else:
+                try:
+                    entry = render_answer(answer, question)
+                except Exception as e:
+                    # The browser renders the raw answer itself when ``rendered`` is missing.
+                    logger.error(f"Failed to render answer {key}: {str(e)}")
+                    continue
+            loaded[key] = entry
+        return loaded, spill_hits
+
+    def _spill(self, entries: List[Tuple[str, Dict[str, Any]]]) -> None:
+        async def runner():
+            try:
+                await asyncio.to_thread(self._write_spill_files, entries)
+            except Exception as e:
+                logger.error(f"Failed to spill rendered answers to {self.spill_dir}: {str(e)}")
+
+        task = asyncio.create_task(runner())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _spill_path(self, key: str) -> pathlib.Path:
+        digest = key.rsplit("-", 1)[-1]
+        return self.spill_dir / digest[:2] / f"{key}.json"
+
+    def _read_spill_file(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.spill_dir is None:
+            return None
+        path = self._spill_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if isinstance(entry, dict) and "html" in entry else None
+
+    def _write_spill_files(self, entries: List[Tuple[str, Dict[str, Any]]]) -> None:
+        if self._spill_count is None:
+            self._spill_count = sum(1 for _ in self.spill_dir.glob("*/*.json")) if self.spill_dir.exists() else 0
+        for key, entry in entries:
+            path = self._spill_path(key)
+            if path.exists():
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._spill_count += 1
+        if self._spill_count > self.max_spill_files:
+            self._prune_spill()
+
+    def _prune_spill(self) -> None:
+        """Delete the oldest spill files down to 90% of the limit."""
+        files = sorted(self.spill_dir.glob("*/*.json"), key=lambda path: path.stat().st_mtime)
+        excess = len(files) - int(self.max_spill_files * 0.9)
+        for path in files[:max(excess, 0)]:
+            path.unlink(missing_ok=True)
+        self._spill_count = len(files) - max(excess, 0)
+        logger.info(f"Pruned {max(excess, 0)} spilled render cache file(s)")
+
+
+# Global cache instance
+render_cache = RenderCache(
+    max_chars=settings.RENDER_CACHE_MAX_CHARS,
+    spill_dir=settings.RENDER_CACHE_SPILL_DIR,
+    max_spill_files=settings.RENDER_CACHE_SPILL_MAX_FILES
+)
@@ -0,0 +1,121 @@
+"""Compact encoding of the chat event stream."""
+import json
+from typing import Any, Dict, List, Optional
+
+STREAM_FORMAT_DIFY = "dify"
+STREAM_FORMAT_COMPACT = "compact"
+STREAM_FORMATS = (STREAM_FORMAT_DIFY, STREAM_FORMAT_COMPACT)
+
+META_FIELDS = ("conversation_id", "message_id", "task_id", "workflow_run_id", "trace_id")
+
+
+def answer_fingerprint(text: str) -> Dict[str, Any]:
+    """
+    Length and 32-bit FNV-1a hash of an answer over UTF-16 code units.
+
+    Matches ``ChartExtract.hashContent`` and ``String.length`` in the browser,
+    so the client can check its accumulated deltas without a copy of the answer.
+    """
+    units = text.encode("utf-16-le")
+    value = 0x811C9DC5
+    for index in range(0, len(units), 2):
+        value ^= units[index] | (units[index + 1] << 8)
+        value = (value * 0x01000193) & 0xFFFFFFFF
+    return {"length": len(units) // 2, "hash": format(value, "x")}
+
+
+class CompactStreamEncoder:
+    """
+    Re-encodes Dify stream events for the opt-in ``compact`` stream format.
+
+    Identifiers are sent in a ``meta`` event when they first appear or change,
+    text events shrink to ``{"d": "<delta>"}`` and the closing ``end`` event
+    carries the answer's length and hash. The full answer is only included in
+    ``end`` when it differs from the deltas already sent (for example a
+    workflow app that streams nothing before ``workflow_finished``). Like the
+    browser, only the first text source of a reply (``message`` or
+    ``agent_message``/``text_chunk``) is forwarded.
+    """
+
+    def __init__(self):
+        self.meta: Dict[str, str] = {}
+        self.mode: Optional[str] = None
+        self.parts: List[str] = []
+
+    def encode(self, event: Dict[str, Any]) -> List[str]:
+        """
+        Encode one sanitized Dify event.
+
+        Args:
+            event: Event as forwarded in the ``dify`` format
+
+        Returns:
+            Zero or more JSON strings to send in place of the event
+        """
+        event_type = event.get("event")
+        encoded = []
+        meta = self._meta_update(event)
+        if meta:
+            encoded.append(self._dumps({"event": "meta", **meta}))
+
+        if event_type == "trace_context":
+            return encoded
+        if event_type in ("message", "agent_message", "text_chunk"):
+            delta = self._text_of(event)
+            mode = "message" if event_type == "message" else "chunk"
+            if delta and (self.mode is None or self.mode == mode):
+                self.mode = mode
+                self.parts.append(delta)
+                encoded.append(self._dumps({"d": delta}))
+            return encoded
+        if event_type in ("message_end", "workflow_finished"):
+            streamed = "".join(self.parts)
+            end: Dict[str, Any] = {"event": "end"}
+            final = streamed
+            if event_type == "workflow_finished":
+                answer = ((event.get("data") or {}).get("outputs") or {}).get("answer")
+                if isinstance(answer, str) and answer.strip():
+                    final = answer
+            if final != streamed:
+                end["answer"] = final
+            end.update(answer_fingerprint(final))
+            encoded.append(self._dumps(end))
+            return encoded
+        if event_type == "workflow_started":
+            encoded.append(self._dumps({"event": "progress"}))
+            return encoded
+
+        encoded.append(self._dumps(event))
+        return encoded
+
+    def _meta_update(self, event: Dict[str, Any]) -> Dict[str, str]:
+        data = event.get("data") if isinstance(event.get("data"), dict) else {}
+        values = {field: event.get(field) or data.get(field) for field in META_FIELDS}
+        if event.get("event") == "message" and not values["message_id"]:
+            values["message_id"] = event.get("id")
+        if event.get("event") in ("workflow_started", "workflow_finished") and not values["workflow_run_id"]:
+            values["workflow_run_id"] = data.get("id")
+
+        changed = {}
+        for field, value in values.items():
+            if isinstance(value, str) and value and self.meta.get(field) != value:
+                self.meta[field] = value
+                changed[field] = value
+        return changed
+
+    @staticmethod
+    def _text_of(event: Dict[str, Any]) -> str:
+        if event.get("event") == "message":
+            answer = event.get("answer")
+            return answer if isinstance(answer, str) else ""
+        data = event.get("data")
+        if isinstance(data, dict):
+            for key in ("text", "answer"):
+                if isinstance(data.get(key), str):
+                    return data[key]
+            return ""
+        return data if isinstance(data, str) else ""
+
+    @staticmethod
+    def _dumps(payload: Dict[str, Any]) -> str:
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,181 @@
+"""Incremental cleanup of streamed answer text."""
+import re
+from typing import Any, Dict, List
+
+# Same rules as removeArtifactText/cleanUpText in chat.js (ASCII \b and \d like JavaScript).
+# Also used by markdown_render, so streamed and server-rendered answers agree.
+ARTIFACT_PATTERN = re.compile(r"(?<![A-Za-z0-9_])[0-9]{10,}\.text(?![A-Za-z0-9_])")
+# A chunk ending in something that may still grow into an artifact, e.g. "1712345678.te".
+_ARTIFACT_PREFIX_PATTERN = re.compile(r"(?<![A-Za-z0-9_])[0-9]+(?:\.(?:t(?:e(?:xt?)?)?)?)?\Z")
+_ZERO_WIDTH_PATTERN = re.compile("[\u200b-\u200d\ufeff]")
+_INLINE_WHITESPACE = " \t\f\v"
+
+
+class StreamTextSanitizer:
+    """
+    Cleans one streamed answer chunk by chunk.
+
+    The output of all ``feed`` calls plus ``finish`` equals cleaning the
+    whole answer at once: line breaks are normalized, ``\\d{10,}.text``
+    artifacts removed, lines holding only whitespace or a lone ``.`` are
+    emptied, blank lines collapse to at most one and the answer is trimmed.
+    Only the smallest tail that could still change meaning is held back
+    between chunks: a trailing ``\\r`` or backslash, a number that may become
+    an artifact, pending whitespace and a line-leading ``.``.
+    """
+
+    def __init__(self):
+        self._carry = ""
+        self._artifact_pending = ""
+        self._artifact_prev = ""
+        self._started = False
+        self._at_line_start = True
+        self._gap: List[str] = []
+        self._dot_hold = ""
+
+    def feed(self, text: str) -> str:
+        """Add a raw chunk; returns the clean text that can be sent now."""
+        text = self._carry + (text or "")
+        self._carry = ""
+        if text.endswith("\r") or text.endswith("\\"):
+            text, self._carry = text[:-1], text[-1]
+        return self._shape(self._filter_artifacts(self._normalize(text), final=False))
+
+    def finish(self) -> str:
+        """Flush the held tail at the end of the answer."""
+        text = self._normalize(self._carry)
+        self._carry = ""
+        cleaned = self._shape(self._filter_artifacts(text, final=True))
+        # Trailing whitespace and a trailing lone "." are dropped.
+        self._gap = []
+        self._dot_hold = ""
+        return cleaned
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\\n", "\n")
+        return _ZERO_WIDTH_PATTERN.sub("", text)
+
+    def _filter_artifacts(self, text: str, final: bool) -> str:
+        data = self._artifact_pending + text
+        prev = self._artifact_prev
+        split = len(data)
+        if not final:
+            match = _ARTIFACT_PREFIX_PATTERN.search(prev + data, len(prev))
+            if match:
+                split = match.start() - len(prev)
+        ready, self._artifact_pending = data[:split], data[split:]
+        if not ready:
+            return ""
+
+        # One character of context on each side stands in for the \b checks.
+        context = prev + ready + self._artifact_pending[:1]
+        pieces = []
+        position = len(prev)
+        for match in ARTIFACT_PATTERN.finditer(context, len(prev), len(prev) + len(ready) + 1):
+            pieces.append(context[position:match.start()])
+            position = match.end()
+        pieces.append(context[position:len(prev) + len(ready)])
+        self._artifact_prev = ready[-1]
+        return "".join(pieces)
+
+    def _shape(self, text: str) -> str:
+        out = []
+        for char in text:
+            if char == "\n":
+                # A line that was only whitespace and a "." counts as blank.
+                self._dot_hold = ""
+                self._gap.append(char)
+                self._at_line_start = True
+            elif char in _INLINE_WHITESPACE:
+                if self._dot_hold:
+                    self._dot_hold += char
+                else:
+                    self._gap.append(char)
+            elif char == "." and self._at_line_start and not self._dot_hold:
+                self._dot_hold = char
+            else:
+                out.append(self._flush_gap())
+                if self._dot_hold:
+                    out.append(self._dot_hold)
+                    self._dot_hold = ""
+                out.append(char)
+                self._at_line_start = False
+        return "".join(out)
+
+    def _flush_gap(self) -> str:
+        gap = "".join(self._gap)
+        self._gap = []
+        if not self._started:
+            self._started = True
+            return ""
+        newlines = gap.count("\n")
+        if not newlines:
+            return gap
+        # Keep the previous line's trailing spaces and the new line's indentation.
+        return gap[:gap.index("\n")] + "\n" * min(newlines, 2) + gap[gap.rindex("\n") + 1:]
+
+
+def clean_answer_text(text: str) -> str:
+    """Clean a complete answer with the same rules as StreamTextSanitizer."""
+    sanitizer = StreamTextSanitizer()
+    return sanitizer.feed(text) + sanitizer.finish()
+
+
+class StreamEventSanitizer:
+    """
+    Per-stream text cleanup for Dify events.
+
+    Each text field (``answer`` of message events, ``data.text``/``data.answer``
+    of agent_message/text_chunk events) gets its own StreamTextSanitizer, so
+    artifacts split across chunks are removed and every forwarded delta is
+    final. ``flush`` returns copies of the last event of each field carrying
+    the held-back tail; send them before ``message_end``/``workflow_finished``.
+    """
+
+    def __init__(self):
+        self._sanitizers: Dict[str, StreamTextSanitizer] = {}
+        self._templates: Dict[str, Dict[str, Any]] = {}
+
+    def clean(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        event_type = event.get("event")
+        sanitized = dict(event)
+        if event_type in ("message", "agent_message", "text_chunk") and isinstance(sanitized.get("answer"), str):
+            sanitized["answer"] = self._feed(f"{event_type}:answer", sanitized, sanitized["answer"])
+
+        data = sanitized.get("data")
+        if isinstance(data, dict):
+            data = dict(data)
+            sanitized["data"] = data
+            if event_type in ("agent_message", "text_chunk"):
+                for key in ("text", "answer"):
+                    if isinstance(data.get(key), str):
+                        data[key] = self._feed(f"{event_type}:data.{key}", sanitized, data[key])
+            outputs = data.get("outputs")
+            if isinstance(outputs, dict) and isinstance(outputs.get("answer"), str):
+                data["outputs"] = {**outputs, "answer": clean_answer_text(outputs["answer"])}
+        return sanitized
+
+    def flush(self) -> List[Dict[str, Any]]:
+        flushed = []
+        for field, sanitizer in self._sanitizers.items():
+            tail = sanitizer.finish()
+            if not tail:
+                continue
+            event = dict(self._templates[field])
+            if field.endswith(":answer"):
+                event["answer"] = tail
+            else:
+                data = {key: value for key, value in event["data"].items() if key not in ("text", "answer")}
+                event["data"] = {**data, field.rsplit(".", 1)[-1]: tail}
+            flushed.append(event)
+        self._sanitizers.clear()
+        self._templates.clear()
+        return flushed
+
+    def _feed(self, field: str, event: Dict[str, Any], text: str) -> str:
+        sanitizer = self._sanitizers.get(field)
+        if sanitizer is None:
+            sanitizer = self._sanitizers[field] = StreamTextSanitizer()
+        self._templates[field] = event
+        return sanitizer.feed(text)
@@ -0,0 +1,268 @@
+"""Query suggestions from frequently asked questions."""
+import asyncio
+import bisect
+import heapq
+import json
+import logging
+import math
+import os
+import pathlib
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_SCOPE = "*"
+
+
+def normalize_query(query: str) -> str:
+    """NFKC (full-width to half-width), case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", query or "").casefold().split())
+
+
+class ScopeIndex:
+    """
+    Sorted keys plus per-key entries for one scope (a user, or global).
+
+    Entries rank by ``rank = log2(score) + t / half_life``: exponential
+    decay multiplies every score by the same factor, so the order of stored
+    ranks never changes with time and lookups need no recomputation.
+    """
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.cache: Dict[str, List[Tuple[float, str]]] = {}
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        if key not in self.entries:
+            bisect.insort(self.keys, key)
+        self.entries[key] = entry
+        self.cache.clear()
+
+    def remove(self, key: str) -> None:
+        if self.entries.pop(key, None) is not None:
+            del self.keys[bisect.bisect_left(self.keys, key)]
+            self.cache.clear()
+
+    def top(self, prefix: str, limit: int) -> List[Tuple[float, str]]:
+        cache_key = f"{limit}:{prefix}"
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\U0010ffff", start)
+        entries = self.entries
+        result = heapq.nlargest(limit, ((entries[key]["rank"], key) for key in self.keys[start:end]))
+        if len(self.cache) >= 256:
+            self.cache.clear()
+        self.cache[cache_key] = result
+        return result
+
+
+class SuggestionIndex:
+    """
+    In-memory prefix index of past chat queries, per user and global.
+
+    Queries are normalized (see normalize_query) and ranked by frequency
+    with exponential decay (``half_life_days``). Each scope keeps a sorted
+    key list searched with bisect, and results are cached per prefix until
+    the scope changes, so a keystroke lookup is a dictionary hit in the
+    common case. A query only appears in global suggestions once
+    ``global_min_users`` different users have asked it, so one person's
+    order numbers are not offered to everyone. The index is snapshotted to
+    a JSON file periodically and on shutdown.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        half_life_days: float = 14.0,
+        max_user_entries: int = 500,
+        max_global_entries: int = 5000,
+        global_min_users: int = 2,
+        snapshot_interval: float = 300.0,
+        min_length: int = 2,
+        max_length: int = 200
+    ):
+        self.snapshot_path = pathlib.Path(snapshot_path) if snapshot_path else None
+        self.half_life_seconds = half_life_days * 86400.0
+        self.max_user_entries = max_user_entries
+        self.max_global_entries = max_global_entries
+        self.global_min_users = global_min_users
+        self.snapshot_interval = snapshot_interval
+        self.min_length = min_length
+        self.max_length = max_length
+        self._scopes: Dict[str, ScopeIndex] = {}
+        self._worker: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    def record(self, user: str, query: str, now: Optional[float] = None) -> None:
+        """
+        Count one asked query for its user and for the global scope.
+
+        Args:
+            user: User identifier
+            query: Query text as sent by the user
+            now: Timestamp (defaults to the current time)
+        """
+        display = " ".join((query or "").split())
+        key = normalize_query(display)
+        if not (self.min_length <= len(key) <= self.max_length):
+            return
+        now = time.time() if now is None else now
+        self._bump(user, key, display, now)
+        self._bump(GLOBAL_SCOPE, key, display, now, user=user)
+        self._dirty = True
+        metrics.incr("suggest_recorded_total")
+
+    def suggest(self, user: Optional[str], prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """
+        Top queries starting with ``prefix``: the user's own first, then global ones.
+
+        Args:
+            user: User identifier (None for global suggestions only)
+            prefix: Text typed so far
+            limit: Maximum number of suggestions
+
+        Returns:
+            List of {"text", "scope"} dicts
+        """
+        key_prefix = normalize_query(prefix)
+        if not key_prefix:
+            return []
+        suggestions = []
+        seen = set()
+        scopes = [(user, "user")] if user else []
+        scopes.append((GLOBAL_SCOPE, "global"))
+        for scope_name, label in scopes:
+            scope = self._scopes.get(scope_name)
+            if scope is None:
+                continue
+            # Global entries below the user threshold are skipped, so ask for a few extra
+            extra = limit * 2 if label == "global" else 0
+            for _, key in scope.top(key_prefix, limit + extra):
+                entry = scope.entries[key]
+                if key in seen or key == key_prefix:
+                    continue
+                if label == "global" and len(entry.get("users", [])) < self.global_min_users:
+                    continue
+                seen.add(key)
+                suggestions.append({"text": entry["text"], "scope": label})
+                if len(suggestions) >= limit:
+                    return suggestions
+        return suggestions
+
+    def stats(self) -> Dict[str, Any]:
+        global_scope = self._scopes.get(GLOBAL_SCOPE)
+        return {
+            "scopes": len(self._scopes),
+            "global_entries": len(global_scope.entries) if global_scope else 0,
+        }
+
+    async def start(self) -> None:
+        """Load the snapshot and start periodic snapshotting."""
+        if self._worker is not None or self.snapshot_path is None:
+            return
+        try:
+            data = await asyncio.to_thread(self._read_snapshot_file)
+        except Exception as e:
+            logger.error(f"Failed to load suggestion snapshot {self.snapshot_path}: {str(e)}")
+            data = None
+        if data:
+            self._load(data)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"Suggestion index started, scopes={len(self._scopes)}")
+
+    async def stop(self) -> None:
+        """Stop snapshotting and write a final snapshot."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self._snapshot()
+
+    def _rank(self, score: float, at: float) -> float:
+        return math.log2(score) + at / self.half_life_seconds
+
+    def _bump(self, scope_name: str, key: str, display: str, now: float, user: Optional[str] = None) -> None:
+        # Entries are replaced, never mutated, so a snapshot can serialize them in a worker thread.
+        scope = self._scopes.get(scope_name)
+        if scope is None:
+            scope = self._scopes[scope_name] = ScopeIndex()
+        entry = scope.entries.get(key)
+        if entry is None:
+            entry = {"text": display, "rank": self._rank(1.0, now)}
+            self._evict_if_full(scope, scope_name)
+        else:
+            # Decay the stored score to ``now`` and add this hit.
+            decayed = 2.0 ** (entry["rank"] - now / self.half_life_seconds)
+            entry = {**entry, "text": display, "rank": self._rank(decayed + 1.0, now)}
+        if user is not None:
+            # Distinct askers, counted up to the global threshold
+            users = entry.get("users", [])
+            if user not in users and len(users) < self.global_min_users:
+                entry["users"] = users + [user]
+        scope.put(key, entry)
+
+    def _evict_if_full(self, scope: ScopeIndex, scope_name: str) -> None:
+        limit = self.max_global_entries if scope_name == GLOBAL_SCOPE else self.max_user_entries
+        if len(scope.entries) >= limit:
+            weakest = min(scope.entries, key=lambda key: scope.entries[key]["rank"])
+            scope.remove(weakest)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            await self._snapshot()
+
+    async def _snapshot(self) -> None:
+        if not self._dirty or self.snapshot_path is None:
+            return
+        data = {name: scope.entries.copy() for name, scope in self._scopes.items()}
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._write_snapshot_file, data)
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Failed to write suggestion snapshot {self.snapshot_path}: {str(e)}")
+
+    def _load(self, data: Dict[str, Dict[str, Any]]) -> None:
+        for scope_name, entries in data.items():
+            scope = self._scopes[scope_name] = ScopeIndex()
+            for key, entry in entries.items():
+                if isinstance(entry, dict) and "text" in entry and "rank" in entry:
+                    scope.entries[key] = entry
+            scope.keys = sorted(scope.entries)
+
+    def _read_snapshot_file(self) -> Optional[Dict[str, Any]]:
+        if not self.snapshot_path.exists():
+            return None
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else None
+
+    def _write_snapshot_file(self, data: Dict[str, Any]) -> None:
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.snapshot_path.with_suffix(self.snapshot_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+
+
+# Global index instance
+suggestion_index = SuggestionIndex(
+    snapshot_path=settings.SUGGEST_SNAPSHOT_PATH,
+    half_life_days=settings.SUGGEST_HALF_LIFE_DAYS,
+    max_user_entries=settings.SUGGEST_MAX_USER_ENTRIES,
+    max_global_entries=settings.SUGGEST_MAX_GLOBAL_ENTRIES,
+    global_min_users=settings.SUGGEST_GLOBAL_MIN_USERS,
+    snapshot_interval=settings.SUGGEST_SNAPSHOT_INTERVAL_SECONDS
+)
@@ -0,0 +1,148 @@
+"""In-process span recorder keyed by trace ID."""
+import asyncio
+import json
+import logging
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from uuid import uuid4
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# httpcore trace events worth a span, mapped to span names.
+HTTPX_TRACE_EVENTS = {
+    "connection.connect_tcp.complete": "upstream_connected",
+    "connection.start_tls.complete": "upstream_tls_ready",
+    "http11.send_request_headers.started": "upstream_request_sent",
+    "http2.send_request_headers.started": "upstream_request_sent",
+    "http11.receive_response_headers.complete": "upstream_headers",
+    "http2.receive_response_headers.complete": "upstream_headers",
+}
+
+
+def ensure_trace_id(trace_id: Optional[str] = None) -> str:
+    """Return the caller's trace ID, or a new one when it is empty."""
+    candidate = str(trace_id or "").strip()
+    return candidate or str(uuid4())
+
+
+class TraceRecorder:
+    """
+    Bounded ring of per-trace span timelines.
+
+    A span is a named point in time (request received, upstream connected,
+    first upstream byte, first event forwarded, heartbeat, stream end...)
+    with a few attributes. Only the latest ``max_traces`` traces are kept.
+    When ``export_path`` is set, every finished trace is also appended to
+    that file as one JSON line.
+    """
+
+    def __init__(self, max_traces: int = 1000, max_spans: int = 256, export_path: str = ""):
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self.export_path = pathlib.Path(export_path) if export_path else None
+        self._traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._export_lock = threading.Lock()
+
+    def record(self, trace_id: Optional[str], name: str, **attrs: Any) -> None:
+        """Append a span to a trace, starting the trace if needed."""
+        if not trace_id:
+            return
+        now = time.monotonic()
+        trace = self._traces.get(trace_id)
+        if trace is None:
+            trace = {"started_at": time.time(), "t0": now, "spans": [], "dropped": 0, "finished": False}
+            self._traces[trace_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+        if len(trace["spans"]) >= self.max_spans:
+            trace["dropped"] += 1
+            return
+        span = {"name": name, "offset_ms": round((now - trace["t0"]) * 1000, 1)}
+        span.update({key: value for key, value in attrs.items() if value is not None})
+        trace["spans"].append(span)
+
+    def finish(self, trace_id: Optional[str], name: str, **attrs: Any) -> None:
+        """Record the final span of a trace and export it."""
+        trace = self._traces.get(trace_id) if trace_id else None
+        if trace is not None and trace["finished"]:
+            return
+        self.record(trace_id, name, **attrs)
+        trace = self._traces.get(trace_id) if trace_id else None
+        if trace is None:
+            return
+        trace["finished"] = True
+        if self.export_path is not None:
+            self._export(self.get(trace_id))
+
+    def httpx_hook(self, trace_id: str) -> Callable[[str, Dict[str, Any]], Awaitable[None]]:
+        """
+        Build an httpx ``trace`` extension that records connection-level spans.
+
+        A request that reuses a pooled connection records no ``upstream_connected``.
+        """
+        async def hook(event_name: str, info: Dict[str, Any]) -> None:
+            span_name = HTTPX_TRACE_EVENTS.get(event_name)
+            if span_name:
+                self.record(trace_id, span_name)
+        return hook
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """Return a trace timeline with the gap before every span."""
+        trace = self._traces.get(trace_id)
+        if trace is None:
+            return None
+
+        spans = []
+        previous_offset = 0.0
+        for span in trace["spans"]:
+            spans.append({**span, "delta_ms": round(span["offset_ms"] - previous_offset, 1)})
+            previous_offset = span["offset_ms"]
+        return {
+            "trace_id": trace_id,
+            "started_at": trace["started_at"],
+            "finished": trace["finished"],
+            "duration_ms": previous_offset,
+            "dropped_spans": trace["dropped"],
+            "spans": spans,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {"traces": len(self._traces), "export_pending": len(self._tasks)}
+
+    async def close(self) -> None:
+        """Wait for pending exports."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _export(self, trace: Dict[str, Any]) -> None:
+        line = json.dumps(trace, ensure_ascii=False) + "\n"
+
+        async def runner():
+            try:
+                await asyncio.to_thread(self._append_line, line)
+            except Exception as e:
+                logger.error(f"Failed to export trace {trace['trace_id']} to {self.export_path}: {str(e)}")
+
+        task = asyncio.create_task(runner())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _append_line(self, line: str) -> None:
+        with self._export_lock:
+            self.export_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+# Global recorder instance
+tracer = TraceRecorder(
+    max_traces=settings.TRACE_MAX_TRACES,
+    export_path=settings.TRACE_EXPORT_PATH
+)
@@ -0,0 +1,215 @@
+"""Sampled capture of upstream Dify streams for replay (see scripts/replay_capture.py)."""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import pathlib
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FORMAT_VERSION = 1
+
+
+class CaptureSession:
+    """
+    One sampled upstream stream: every SSE line with its offset from the request.
+
+    Offsets are milliseconds since the request was sent, so a replay can
+    reproduce the time to response headers, the first event and every gap
+    in between. The user ID is replaced by a salted hash in the record and
+    in any event line that echoes it.
+    """
+
+    def __init__(self, capture: "TrafficCapture", record: Dict[str, Any], user: str, started_at: float):
+        self.capture = capture
+        self.record = record
+        self.user = user
+        self.started_at = started_at
+        self.size = 0
+        self.finished = False
+
+    def response(self, status_code: int) -> None:
+        self.record["status"] = status_code
+        self.record["headers_ms"] = self._offset_ms()
+
+    def add(self, line: str) -> None:
+        """Record a non-empty upstream line."""
+        if not line.strip() or self.record["truncated"]:
+            return
+        if self.size + len(line) > self.capture.max_session_bytes:
+            self.record["truncated"] = True
+            return
+        self.size += len(line)
+        # Very short IDs would match unrelated text
+        if len(self.user) >= 3 and self.user in line:
+            line = line.replace(self.user, self.record["user"])
+        self.record["events"].append([self._offset_ms(), line])
+
+    def finish(self, outcome: str, error: Optional[str] = None) -> None:
+        """Close the session ("completed", "error" or "cancelled") and queue it for writing."""
+        if self.finished:
+            return
+        self.finished = True
+        self.record["outcome"] = outcome
+        self.record["duration_ms"] = self._offset_ms()
+        if error:
+            self.record["error"] = error[:500]
+        self.capture.submit(self.record)
+
+    def _offset_ms(self) -> float:
+        return round((time.monotonic() - self.started_at) * 1000, 1)
+
+
+class TrafficCapture:
+    """
+    Writes a sample of upstream Dify SSE sessions to gzip-compressed JSONL.
+
+    Disabled when ``directory`` is empty, and also when ``redact_salt`` is:
+    employee IDs are short enough that an unsalted hash is reversed by
+    hashing every possible ID. Each finished session is one JSON
+    line in ``<directory>/capture-YYYYMMDD.jsonl.gz``; batches are appended
+    as separate gzip members from a worker thread, so files stay readable
+    with ``gzip.open`` while they grow. Sessions finishing while
+    ``max_pending`` are already waiting are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        directory: str = "",
+        sample_rate: float = 0.05,
+        redact_salt: str = "",
+        max_session_bytes: int = 2000000,
+        max_pending: int = 200
+    ):
+        self.directory = pathlib.Path(directory) if directory else None
+        self.missing_salt = self.directory is not None and not redact_salt
+        if self.missing_salt:
+            self.directory = None
+        self.sample_rate = sample_rate
+        self.redact_salt = redact_salt
+        self.max_session_bytes = max_session_bytes
+        self.max_pending = max_pending
+        self._pending: List[Dict[str, Any]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        self.captured = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None and self.sample_rate > 0
+
+    def redact_user(self, user: str) -> str:
+        digest = hashlib.blake2b(f"{self.redact_salt}:{user}".encode("utf-8"), digest_size=6).hexdigest()
+        return f"u_{digest}"
+
+    def start_session(
+        self,
+        trace_id: str,
+        user: str,
+        query: str,
+        conversation_id: Optional[str],
+        inputs: Optional[Dict[str, Any]],
+        upstream: str,
+        started_at: float
+    ) -> Optional[CaptureSession]:
+        """
+        Begin capturing a stream if it is sampled.
+
+        Args:
+            trace_id: Trace ID of the request
+            user: User identifier (stored hashed)
+            query: Query text
+            conversation_id: Conversation ID, empty for a new conversation
+            inputs: Dify inputs
+            upstream: Name of the upstream serving the stream
+            started_at: time.monotonic() when the upstream request was sent
+
+        Returns:
+            A CaptureSession, or None when capture is off or the stream was not sampled
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        record = {
+            "v": CAPTURE_FORMAT_VERSION,
+            "captured_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "trace_id": trace_id,
+            "user": self.redact_user(user),
+            "query": query,
+            "conversation_id": conversation_id or "",
+            "inputs": inputs or {},
+            "upstream": upstream,
+            "status": None,
+            "headers_ms": None,
+            "events": [],
+            "truncated": False,
+        }
+        return CaptureSession(self, record, user, started_at)
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            metrics.incr("capture_dropped_total")
+            return
+        self._pending.append(record)
+        self.captured += 1
+        metrics.incr("capture_sessions_total")
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+
+    def start(self) -> None:
+        """Report whether capture is on; a capture directory without a salt is refused."""
+        if self.missing_salt:
+            logger.error("CAPTURE_DIR is set but CAPTURE_REDACT_SALT is empty; traffic capture is disabled")
+        elif self.enabled:
+            logger.info(f"Capturing {self.sample_rate:.0%} of Dify streams to {self.directory}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+        }
+
+    async def close(self) -> None:
+        """Write sessions that are still pending."""
+        if self._flusher is not None:
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        if self._pending:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} captured session(s) to {self.directory}: {str(e)}")
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode("utf-8")
+        path = self.directory / f"capture-{datetime.now(timezone.utc):%Y%m%d}.jsonl.gz"
+        with self._write_lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(path, "ab") as f:
+                f.write(gzip.compress(data))
+
+
+# Global capture instance
+traffic_capture = TrafficCapture(
+    directory=settings.CAPTURE_DIR,
+    sample_rate=settings.CAPTURE_SAMPLE_RATE,
+    redact_salt=settings.CAPTURE_REDACT_SALT,
+    max_session_bytes=settings.CAPTURE_MAX_SESSION_BYTES,
+    max_pending=settings.CAPTURE_MAX_PENDING
+)
@@ -0,0 +1,253 @@
+"""Routing across several Dify upstreams (replicas or per-plant instances)."""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the latency moving average.
+LATENCY_EWMA_ALPHA = 0.2
+# Latency assumed when no upstream has answered yet.
+INITIAL_LATENCY_SECONDS = 0.5
+
+
+class Upstream:
+    """
+    One Dify endpoint with its own connection pool and health state.
+
+    Upstreams in the same ``group`` share conversation storage (replicas of
+    one Dify deployment); different groups are independent instances, e.g.
+    one per plant.
+    """
+
+    def __init__(self, name: str, url: str, api_key: str, group: str, weight: float = 1.0):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.api_key = api_key
+        self.group = group
+        self.weight = max(weight, 0.01)
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests_total = 0
+        self.failures_total = 0
+        self.last_used_at = 0.0
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled client for this upstream, created on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                verify=settings.VERIFY_SSL,
+                limits=httpx.Limits(
+                    max_connections=settings.DIFY_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.DIFY_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.DIFY_KEEPALIVE_EXPIRY_SECONDS,
+                ),
+            )
+        return self._client
+
+    def is_healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def score(self, default_latency: float) -> float:
+        """Lower is better: expected wait given the requests already in flight."""
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return (self.outstanding + 1) * latency / self.weight
+
+    def begin(self) -> float:
+        """Mark a request as in flight and return its start time."""
+        self.outstanding += 1
+        self.requests_total += 1
+        return time.monotonic()
+
+    def end(self) -> None:
+        self.outstanding = max(self.outstanding - 1, 0)
+        self.last_used_at = time.monotonic()
+
+    def has_warm_connection(self, now: float) -> bool:
+        """Whether a pooled connection is most likely open: a request is in flight or ended recently."""
+        return self.outstanding > 0 or now - self.last_used_at < settings.DIFY_KEEPALIVE_EXPIRY_SECONDS
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "group": self.group,
+            "weight": self.weight,
+            "healthy": self.is_healthy(now),
+            "outstanding": self.outstanding,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "requests_total": self.requests_total,
+            "failures_total": self.failures_total,
+        }
+
+
+class UpstreamPool:
+    """
+    Picks an upstream per request and keeps conversations on their owner.
+
+    New conversations go to the healthy upstream with the lowest
+    ``(outstanding + 1) * latency / weight``. Conversation and message IDs
+    are remembered with the group that created them, so follow-up turns,
+    history reads, deletes and feedback reach the instance that owns them.
+    An upstream failing ``eject_after_failures`` times in a row is skipped
+    for ``eject_seconds``; after that one request probes it again.
+    """
+
+    def __init__(
+        self,
+        upstreams: List[Upstream],
+        eject_after_failures: int = 3,
+        eject_seconds: float = 30.0,
+        affinity_max_entries: int = 100000
+    ):
+        if not upstreams:
+            raise ValueError("At least one Dify upstream is required")
+        self.upstreams = upstreams
+        self.eject_after_failures = max(1, eject_after_failures)
+        self.eject_seconds = eject_seconds
+        self.affinity_max_entries = affinity_max_entries
+        self._affinity: "OrderedDict[str, str]" = OrderedDict()
+
+    @classmethod
+    def from_settings(cls) -> "UpstreamPool":
+        """Build the pool from DIFY_UPSTREAMS, or the single DIFY_API_URL/DIFY_API_KEY pair."""
+        upstreams = []
+        for index, entry in enumerate(settings.dify_upstreams):
+            name = str(entry.get("name") or f"upstream-{index + 1}")
+            upstreams.append(Upstream(
+                name=name,
+                url=entry["url"],
+                api_key=entry.get("api_key") or settings.DIFY_API_KEY,
+                group=str(entry.get("group") or name),
+                weight=float(entry.get("weight") or 1.0)
+            ))
+        if not upstreams:
+            upstreams.append(Upstream("default", settings.DIFY_API_URL, settings.DIFY_API_KEY, "default"))
+        return cls(
+            upstreams,
+            eject_after_failures=settings.UPSTREAM_EJECT_AFTER_FAILURES,
+            eject_seconds=settings.UPSTREAM_EJECT_SECONDS,
+            affinity_max_entries=settings.UPSTREAM_AFFINITY_MAX_ENTRIES
+        )
+
+    @property
+    def primary(self) -> Upstream:
+        return self.upstreams[0]
+
+    def groups(self) -> List[str]:
+        """Distinct groups in configuration order."""
+        return list(dict.fromkeys(upstream.group for upstream in self.upstreams))
+
+    def choose(self, group: Optional[str] = None) -> Upstream:
+        """
+        Pick the best upstream, optionally restricted to one group.
+
+        When every candidate is ejected the one whose ejection ends first is
+        used anyway: a slow answer beats a guaranteed error.
+        """
+        candidates = [u for u in self.upstreams if group is None or u.group == group]
+        if not candidates:
+            candidates = [u for u in self.upstreams if u.group == self.primary.group]
+
+        now = time.monotonic()
+        healthy = [u for u in candidates if u.is_healthy(now)]
+        if not healthy:
+            metrics.incr("upstream_all_ejected_total")
+            return min(candidates, key=lambda u: u.ejected_until)
+
+        # An upstream without samples is scored like the fastest peer so it gets tried, not starved.
+        observed = [u.latency_ewma for u in healthy if u.latency_ewma is not None]
+        default_latency = min(observed) if observed else INITIAL_LATENCY_SECONDS
+        return min(healthy, key=lambda u: u.score(default_latency))
+
+    def route(self, owned_id: Optional[str] = None) -> Upstream:
+        """
+        Pick the upstream for a request about ``owned_id`` (conversation or message ID).
+
+        Unknown IDs go to the primary group, where pre-existing conversations live.
+        """
+        if not owned_id:
+            return self.choose()
+        return self.choose(self.group_of(owned_id) or self.primary.group)
+
+    def group_of(self, owned_id: str) -> Optional[str]:
+        group = self._affinity.get(owned_id)
+        if group is not None:
+            self._affinity.move_to_end(owned_id)
+        return group
+
+    def bind(self, owned_id: Optional[str], group: str) -> None:
+        """Remember which group owns a conversation or message ID."""
+        if not owned_id or len(self.upstreams) == 1:
+            return
+        self._affinity[owned_id] = group
+        self._affinity.move_to_end(owned_id)
+        while len(self._affinity) > self.affinity_max_entries:
+            self._affinity.popitem(last=False)
+
+    def forget(self, owned_id: str) -> None:
+        self._affinity.pop(owned_id, None)
+
+    def record(self, upstream: Upstream, elapsed: Optional[float], ok: bool) -> None:
+        """
+        Feed one outcome into the upstream's latency average and health state.
+
+        Args:
+            upstream: Upstream that served the request
+            elapsed: Seconds until response headers, or None to skip the latency sample
+            ok: False for connect errors, timeouts, 429 and 5xx responses
+        """
+        if elapsed is not None:
+            if upstream.latency_ewma is None:
+                upstream.latency_ewma = elapsed
+            else:
+                upstream.latency_ewma += LATENCY_EWMA_ALPHA * (elapsed - upstream.latency_ewma)
+
+        if ok:
+            upstream.consecutive_failures = 0
+            return
+
+        upstream.failures_total += 1
+        upstream.consecutive_failures += 1
+        metrics.incr(f"upstream_failures_total.{upstream.name}")
+        if upstream.consecutive_failures >= self.eject_after_failures:
+            upstream.ejected_until = time.monotonic() + self.eject_seconds
+            metrics.incr(f"upstream_ejected_total.{upstream.name}")
+            logger.warning(
+                f"Ejecting Dify upstream {upstream.name} ({upstream.url}) for {self.eject_seconds:.0f}s "
+                f"after {upstream.consecutive_failures} consecutive failures"
+            )
+
+    @staticmethod
+    def is_failure_status(status_code: int) -> bool:
+        return status_code == 429 or status_code >= 500
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "upstreams": {upstream.name: upstream.stats(now) for upstream in self.upstreams},
+            "affinity_entries": len(self._affinity),
+        }
+
+    async def aclose(self) -> None:
+        for upstream in self.upstreams:
+            await upstream.aclose()
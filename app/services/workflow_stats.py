@@ -0,0 +1,138 @@
+"""Per-node timing for Dify workflow runs."""
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.metrics import summarize
+
+
+class WorkflowStats:
+    """
+    Collects ``node_started`` / ``node_finished`` events from Dify streams.
+
+    Every trace gets a node timeline (kept for the most recent
+    ``max_traces`` traces), and node durations are aggregated per node
+    title and per node type over a sliding window, so slow workflow steps
+    (LLM, MES HTTP tool, code node) show up as p50/p95/p99.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 3600.0,
+        max_samples: int = 4096,
+        max_traces: int = 500,
+        max_nodes: int = 500
+    ):
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self.max_traces = max_traces
+        self.max_nodes = max_nodes
+        self._timelines: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # title -> (node_type, samples of (finished_at monotonic, seconds, failed))
+        self._by_title: Dict[str, Tuple[str, Deque[Tuple[float, float, bool]]]] = {}
+        self._by_type: Dict[str, Deque[Tuple[float, float, bool]]] = defaultdict(
+            lambda: deque(maxlen=self.max_samples)
+        )
+
+    def node_started(self, trace_id: str, data: Dict[str, Any]) -> None:
+        """Record the start of a workflow node."""
+        timeline = self._timeline(trace_id)
+        execution_id = data.get("id") or data.get("node_id") or ""
+        timeline["open"][execution_id] = time.monotonic()
+
+    def node_finished(self, trace_id: str, data: Dict[str, Any]) -> None:
+        """Record a finished workflow node and add its duration to the aggregates."""
+        now = time.monotonic()
+        timeline = self._timeline(trace_id)
+        execution_id = data.get("id") or data.get("node_id") or ""
+        started_at = timeline["open"].pop(execution_id, None)
+
+        elapsed = data.get("elapsed_time")
+        if not isinstance(elapsed, (int, float)):
+            elapsed = now - started_at if started_at is not None else None
+        if elapsed is None:
+            return
+
+        title = str(data.get("title") or data.get("node_id") or "unknown")
+        node_type = str(data.get("node_type") or "unknown")
+        status = data.get("status") or "succeeded"
+        failed = status != "succeeded"
+        start_offset = (started_at if started_at is not None else now - elapsed) - timeline["started_at"]
+
+        timeline["nodes"].append({
+            "node_id": data.get("node_id"),
+            "title": title,
+            "node_type": node_type,
+            "status": status,
+            "start_offset_ms": round(max(start_offset, 0.0) * 1000, 1),
+            "elapsed_ms": round(float(elapsed) * 1000, 1),
+            "error": data.get("error") or None,
+        })
+
+        entry = self._by_title.get(title)
+        if entry is None:
+            if len(self._by_title) >= self.max_nodes:
+                return
+            entry = (node_type, deque(maxlen=self.max_samples))
+            self._by_title[title] = entry
+        entry[1].append((now, float(elapsed), failed))
+        self._by_type[node_type].append((now, float(elapsed), failed))
+
+    def get_timeline(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """Return the node timeline of one trace, ordered by start time."""
+        timeline = self._timelines.get(trace_id)
+        if timeline is None:
+            return None
+        return {
+            "trace_id": trace_id,
+            "nodes": sorted(timeline["nodes"], key=lambda node: node["start_offset_ms"]),
+            "unfinished": len(timeline["open"]),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latency percentiles (seconds) per node title and per node type, slowest p95 first."""
+        nodes = {}
+        for title, (node_type, samples) in self._by_title.items():
+            window = self._window(samples)
+            if window:
+                nodes[title] = {"node_type": node_type, **self._summarize(window)}
+        by_type = {}
+        for node_type, samples in self._by_type.items():
+            window = self._window(samples)
+            if window:
+                by_type[node_type] = self._summarize(window)
+        return {
+            "window_seconds": self.window_seconds,
+            "nodes": dict(sorted(nodes.items(), key=lambda item: item[1]["p95"], reverse=True)),
+            "node_types": dict(sorted(by_type.items(), key=lambda item: item[1]["p95"], reverse=True)),
+            "traces_retained": len(self._timelines),
+        }
+
+    def _timeline(self, trace_id: str) -> Dict[str, Any]:
+        timeline = self._timelines.get(trace_id)
+        if timeline is None:
+            timeline = {"started_at": time.monotonic(), "open": {}, "nodes": []}
+            self._timelines[trace_id] = timeline
+            while len(self._timelines) > self.max_traces:
+                self._timelines.popitem(last=False)
+        return timeline
+
+    def _window(self, samples: Deque[Tuple[float, float, bool]]) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - self.window_seconds
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return list(samples)
+
+    @staticmethod
+    def _summarize(window: List[Tuple[float, float, bool]]) -> Dict[str, Any]:
+        summary = summarize([elapsed for _, elapsed, _ in window])
+        summary["failed"] = sum(1 for _, _, failed in window if failed)
+        return summary
+
+
+# Global stats instance
+workflow_stats = WorkflowStats(
+    window_seconds=settings.WORKFLOW_STATS_WINDOW_SECONDS,
+    max_traces=settings.WORKFLOW_STATS_MAX_TRACES
+)
@@ -0,0 +1,353 @@
+// Chart data extraction shared by the chat page and chart-worker.js
+// 纯函数，不依赖 DOM，可在主线程或 Web Worker 中运行
+(function (root) {
+    const DEFAULT_MAX_POINTS = 12;
+    // 折线图允许保留更多数据点，渲染时再按画布宽度降采样
+    const LINE_MAX_POINTS = 5000;
+
+    function stripMarkdownSyntax(text) {
+        return String(text || '')
+            .replace(/<[^>]*>/g, '')
+            .replace(/\*\*|__/g, '')
+            .replace(/[*_`~]/g, '')
+            .trim();
+    }
+
+    function getNumericValueFromText(text) {
+        const source = String(text || '').replace(/,/g, '').trim();
+        const match = source.match(/-?\d+(?:\.\d+)?/);
+        if (!match) {
+            return null;
+        }
+        const value = Number(match[0]);
+        return Number.isFinite(value) ? value : null;
+    }
+
+    function isTimeLikeLabel(label) {
+        const normalized = String(label || '').trim();
+        return /(\d{4}[-\/.年]\d{1,2}|\d{1,2}[-\/.月]\d{1,2}|\d{1,2}月|Q[1-4]|第[一二三四]季|周|星期|周[一二三四五六日天]|\d{4}年|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)/i.test(normalized);
+    }
+
+    function isTotalLikeLabel(label) {
+        const normalized = String(label || '')
+            .toLowerCase()
+            .replace(/[\s_\-:：]/g, '');
+        return /(合计|总计|汇总|小计|total|sum|grandtotal)/i.test(normalized);
+    }
+
+    function getMarkdownTableRows(content) {
+        const lines = String(content || '').split('\n').map(line => line.trim());
+        const tableLines = lines.filter(line => line.startsWith('|') && line.endsWith('|'));
+        if (tableLines.length < 3) {
+            return [];
+        }
+        return tableLines.slice(2);
+    }
+
+    function extractPairsFromMarkdownTable(content) {
+        const result = [];
+
+        for (const row of getMarkdownTableRows(content)) {
+            const cells = row.split('|').map(cell => stripMarkdownSyntax(cell)).filter(Boolean);
+            if (cells.length < 2) {
+                continue;
+            }
+
+            const label = cells[0];
+            const rawValue = cells[1];
+            const value = getNumericValueFromText(rawValue);
+            if (!label || value === null) {
+                continue;
+            }
+
+            result.push({ label, value, rawValue });
+        }
+
+        return result;
+    }
+
+    // 多列表格：取最后一列为数值，序号列存在时取第二列为标签（与渲染后 HTML 表格的解析规则一致）
+    function extractPairsFromTableRows(content) {
+        const result = [];
+
+        for (const row of getMarkdownTableRows(content)) {
+            const cells = row.split('|').map(cell => stripMarkdownSyntax(cell)).filter(Boolean);
+            if (cells.length < 2) {
+                continue;
+            }
+
+            const rawValue = cells[cells.length - 1];
+            const value = getNumericValueFromText(rawValue);
+            if (value === null) {
+                continue;
+            }
+
+            const label = stripMarkdownSyntax(cells.length >= 3 && /^\d+$/.test(cells[0]) ? cells[1] : cells[0]);
+            if (!label) {
+                continue;
+            }
+
+            result.push({ label, value, rawValue });
+        }
+
+        return result;
+    }
+
+    function extractPairsFromLines(content) {
+        const lines = String(content || '').split('\n').map(line => line.trim()).filter(Boolean);
+        const result = [];
+        const patterns = [
+            /^[-*]\s*([^:：]{1,40})\s*[:：]\s*([-+]?\d[\d,.]*\s*%?)/,
+            /^(?:\d+[.)、]\s*)?([^:：]{1,40})\s*[:：]\s*([-+]?\d[\d,.]*\s*%?)/,
+            /^([^:：]{1,30})\s+([-+]?\d[\d,.]*\s*%?)$/
+        ];
+
+        for (const line of lines) {
+            const plainLine = stripMarkdownSyntax(line);
+            let matched = null;
+            for (const pattern of patterns) {
+                const match = plainLine.match(pattern);
+                if (match) {
+                    matched = match;
+                    break;
+                }
+            }
+
+            if (!matched) {
+                continue;
+            }
+
+            const label = stripMarkdownSyntax(matched[1]);
+            const rawValue = matched[2];
+            const value = getNumericValueFromText(rawValue);
+            if (!label || value === null) {
+                continue;
+            }
+
+            result.push({ label, value, rawValue });
+        }
+
+        return result;
+    }
+
+    function extractPairsFromStructuredRows(content) {
+        const lines = String(content || '').split('\n').map(line => line.trim()).filter(Boolean);
+        if (lines.length < 3) {
+            return [];
+        }
+
+        const splitColumns = (line) => {
+            if (line.includes('\t')) {
+                return line.split(/\t+/).map(cell => stripMarkdownSyntax(cell)).filter(Boolean);
+            }
+            return line.split(/\s{2,}/).map(cell => stripMarkdownSyntax(cell)).filter(Boolean);
+        };
+
+        const headerCells = splitColumns(lines[0]);
+        if (headerCells.length < 2) {
+            return [];
+        }
+
+        const result = [];
+
+        for (const row of lines.slice(1)) {
+            const cells = splitColumns(row);
+            if (cells.length < 2) {
+                continue;
+            }
+
+            const rawValue = cells[cells.length - 1];
+            const value = getNumericValueFromText(rawValue);
+            if (value === null) {
+                continue;
+            }
+
+            const label = stripMarkdownSyntax(cells.length >= 3 && /^\d+$/.test(cells[0]) ? cells[1] : cells[0]);
+            if (!label) {
+                continue;
+            }
+
+            result.push({ label, value, rawValue });
+        }
+
+        return result;
+    }
+
+    function splitDisplayAndTotalPairs(pairs) {
+        const sourcePairs = Array.isArray(pairs) ? pairs : [];
+        const displayPairs = sourcePairs.filter(pair => !isTotalLikeLabel(pair.label));
+        const totalPairs = sourcePairs.filter(pair => isTotalLikeLabel(pair.label));
+
+        let percentBase = null;
+        for (const pair of totalPairs) {
+            const value = Number(pair.value);
+            if (Number.isFinite(value) && value > 0) {
+                percentBase = value;
+                break;
+            }
+        }
+
+        if (!Number.isFinite(percentBase)) {
+            const sum = displayPairs.reduce((acc, pair) => acc + (Number(pair.value) || 0), 0);
+            percentBase = sum > 0 ? sum : null;
+        }
+
+        return { displayPairs, percentBase };
+    }
+
+    function inferChartType(content, labels, pairs) {
+        const source = String(content || '');
+        const hasTrendKeyword = /(趋势|走势|变化|按月|按周|按日|同比|环比|trend|timeline|over\s*time|time\s*series|month|week|day)/i.test(source);
+        const hasRatioKeyword = /(占比|比例|构成|份额|百分比|distribution|ratio|share|composition)/i.test(source);
+        const timeLikeCount = labels.filter(label => isTimeLikeLabel(label)).length;
+        const hasPercentValue = pairs.some(pair => /%/.test(pair.rawValue));
+        const total = pairs.reduce((sum, pair) => sum + pair.value, 0);
+        const isNearHundred = Math.abs(total - 100) <= 2;
+
+        if (hasTrendKeyword || timeLikeCount >= Math.max(2, Math.ceil(labels.length * 0.6))) {
+            return 'line';
+        }
+        if (hasRatioKeyword || hasPercentValue || isNearHundred) {
+            return 'pie';
+        }
+        return 'bar';
+    }
+
+    function buildChartConfig(text, pairs, requestedType = null) {
+        const splitResult = splitDisplayAndTotalPairs(pairs);
+        const displayPairs = splitResult.displayPairs.filter(pair => pair.label && Number.isFinite(pair.value));
+        if (displayPairs.length < 2) {
+            return null;
+        }
+
+        // 图表类型按前 12 项推断，保持与历史行为一致
+        const headPairs = displayPairs.slice(0, DEFAULT_MAX_POINTS);
+        const chartType = requestedType || inferChartType(text, headPairs.map(pair => pair.label), headPairs);
+        const data = chartType === 'line'
+            ? displayPairs.slice(0, LINE_MAX_POINTS)
+            : headPairs;
+
+        return {
+            chartType,
+            labels: data.map(pair => pair.label),
+            values: data.map(pair => pair.value),
+            percentBase: splitResult.percentBase
+        };
+    }
+
+    function extractTableChartConfig(content, requestedType = null) {
+        const text = String(content || '').trim();
+        if (!text) {
+            return null;
+        }
+
+        // 依次尝试：markdown 两列表格 -> markdown 多列表格 -> 制表符/多空格列
+        const extractors = [extractPairsFromMarkdownTable, extractPairsFromTableRows, extractPairsFromStructuredRows];
+        for (const extract of extractors) {
+            const config = buildChartConfig(text, extract(text), requestedType);
+            if (config) {
+                return config;
+            }
+        }
+
+        return null;
+    }
+
+    function extractChartConfigFromContent(content, requestedType = null) {
+        const text = String(content || '').trim();
+        if (!text) {
+            return null;
+        }
+
+        let pairs = extractPairsFromMarkdownTable(text);
+        if (pairs.length < 2) {
+            pairs = extractPairsFromLines(text);
+        }
+        if (pairs.length < 2) {
+            pairs = extractPairsFromStructuredRows(text);
+        }
+        if (pairs.length < 2) {
+            return null;
+        }
+
+        return buildChartConfig(text, pairs, requestedType);
+    }
+
+    // FNV-1a 32 位哈希，用于按内容缓存图表配置
+    function hashContent(text) {
+        const source = String(text || '');
+        let hash = 0x811c9dc5;
+        for (let index = 0; index < source.length; index += 1) {
+            hash ^= source.charCodeAt(index);
+            hash = Math.imul(hash, 0x01000193);
+        }
+        return (hash >>> 0).toString(16);
+    }
+
+    // Largest-Triangle-Three-Buckets 降采样，保留折线的视觉形状
+    function downsampleLttb(labels, values, threshold) {
+        const length = values.length;
+        if (threshold >= length || threshold < 3) {
+            return { labels, values };
+        }
+
+        const sampledLabels = [labels[0]];
+        const sampledValues = [values[0]];
+        const bucketSize = (length - 2) / (threshold - 2);
+        let anchor = 0;
+
+        for (let bucket = 0; bucket < threshold - 2; bucket += 1) {
+            const nextStart = Math.floor((bucket + 1) * bucketSize) + 1;
+            const nextEnd = Math.min(Math.floor((bucket + 2) * bucketSize) + 1, length);
+            let avgX = 0;
+            let avgY = 0;
+            for (let index = nextStart; index < nextEnd; index += 1) {
+                avgX += index;
+                avgY += values[index];
+            }
+            const nextCount = Math.max(nextEnd - nextStart, 1);
+            avgX /= nextCount;
+            avgY /= nextCount;
+
+            const rangeStart = Math.floor(bucket * bucketSize) + 1;
+            const rangeEnd = Math.floor((bucket + 1) * bucketSize) + 1;
+            let maxArea = -1;
+            let chosen = rangeStart;
+            for (let index = rangeStart; index < rangeEnd; index += 1) {
+                const area = Math.abs(
+                    (anchor - avgX) * (values[index] - values[anchor]) -
+                    (anchor - index) * (avgY - values[anchor])
+                );
+                if (area > maxArea) {
+                    maxArea = area;
+                    chosen = index;
+                }
+            }
+
+            sampledLabels.push(labels[chosen]);
+            sampledValues.push(values[chosen]);
+            anchor = chosen;
+        }
+
+        sampledLabels.push(labels[length - 1]);
+        sampledValues.push(values[length - 1]);
+        return { labels: sampledLabels, values: sampledValues };
+    }
+
+    root.ChartExtract = {
+        stripMarkdownSyntax,
+        getNumericValueFromText,
+        isTimeLikeLabel,
+        isTotalLikeLabel,
+        extractPairsFromMarkdownTable,
+        extractPairsFromTableRows,
+        extractPairsFromLines,
+        extractPairsFromStructuredRows,
+        splitDisplayAndTotalPairs,
+        inferChartType,
+        extractTableChartConfig,
+        extractChartConfigFromContent,
+        hashContent,
+        downsampleLttb
+    };
+})(typeof self !== 'undefined' ? self : this);
@@ -0,0 +1,14 @@
+// Chart extraction worker: keeps table parsing off the UI thread
+importScripts('/static-debug/chart-extract.js?v=1');
+
+self.onmessage = (event) => {
+    const { id, content, requestedType, mode } = event.data || {};
+    try {
+        const config = mode === 'content'
+            ? self.ChartExtract.extractChartConfigFromContent(content, requestedType)
+            : self.ChartExtract.extractTableChartConfig(content, requestedType);
+        self.postMessage({ id, config });
+    } catch (error) {
+        self.postMessage({ id, config: null, error: String(error && error.message || error) });
+    }
+};
@@ -0,0 +1,156 @@
+// IndexedDB cache for conversation lists and latest message pages
+// 配合后端 ETag 实现 stale-while-revalidate：先渲染缓存，再带 If-None-Match 后台校验
+class ConversationCache {
+    constructor(options = {}) {
+        this.dbName = options.dbName || 'easymes-chat-cache';
+        this.storeName = 'entries';
+        this.maxBytes = options.maxBytes || 5 * 1024 * 1024;
+        this.maxEntries = options.maxEntries || 300;
+        this.dbPromise = null;
+        // key -> { size, accessedAt }，首次使用时从数据库加载，用于按大小和 LRU 淘汰
+        this.meta = null;
+    }
+
+    open() {
+        if (this.dbPromise) {
+            return this.dbPromise;
+        }
+
+        this.dbPromise = new Promise((resolve) => {
+            if (typeof indexedDB === 'undefined') {
+                resolve(null);
+                return;
+            }
+            try {
+                const request = indexedDB.open(this.dbName, 1);
+                request.onupgradeneeded = () => {
+                    request.result.createObjectStore(this.storeName, { keyPath: 'key' });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => resolve(null);
+                request.onblocked = () => resolve(null);
+            } catch (error) {
+                // 隐私模式等环境下 IndexedDB 不可用，缓存退化为空操作
+                console.warn('[Cache] IndexedDB unavailable:', error);
+                resolve(null);
+            }
+        });
+        return this.dbPromise;
+    }
+
+    async transaction(mode, callback) {
+        const db = await this.open();
+        if (!db) {
+            return null;
+        }
+
+        return new Promise((resolve) => {
+            let result = null;
+            let tx;
+            try {
+                tx = db.transaction(this.storeName, mode);
+            } catch (error) {
+                console.warn('[Cache] transaction failed:', error);
+                resolve(null);
+                return;
+            }
+            callback(tx.objectStore(this.storeName), (value) => {
+                result = value;
+            });
+            tx.oncomplete = () => resolve(result);
+            tx.onerror = () => resolve(null);
+            tx.onabort = () => resolve(null);
+        });
+    }
+
+    async loadMeta() {
+        if (this.meta) {
+            return this.meta;
+        }
+
+        const meta = new Map();
+        await this.transaction('readonly', (store) => {
+            const request = store.openCursor();
+            request.onsuccess = () => {
+                const cursor = request.result;
+                if (!cursor) {
+                    return;
+                }
+                meta.set(cursor.value.key, { size: cursor.value.size || 0, accessedAt: cursor.value.accessedAt || 0 });
+                cursor.continue();
+            };
+        });
+        this.meta = this.meta || meta;
+        return this.meta;
+    }
+
+    async get(key) {
+        const accessedAt = Date.now();
+        const entry = await this.transaction('readwrite', (store, done) => {
+            const request = store.get(key);
+            request.onsuccess = () => {
+                const value = request.result || null;
+                if (value) {
+                    value.accessedAt = accessedAt;
+                    store.put(value);
+                }
+                done(value);
+            };
+        });
+
+        if (entry && this.meta && this.meta.has(key)) {
+            this.meta.get(key).accessedAt = accessedAt;
+        }
+        return entry;
+    }
+
+    async put(key, data, etag = null) {
+        const size = JSON.stringify(data).length * 2;
+        if (size > this.maxBytes) {
+            return;
+        }
+
+        const meta = await this.loadMeta();
+        const entry = { key, data, etag, size, accessedAt: Date.now() };
+        await this.transaction('readwrite', (store) => {
+            store.put(entry);
+        });
+        meta.set(key, { size, accessedAt: entry.accessedAt });
+        await this.evict();
+    }
+
+    async delete(key) {
+        await this.transaction('readwrite', (store) => {
+            store.delete(key);
+        });
+        if (this.meta) {
+            this.meta.delete(key);
+        }
+    }
+
+    async evict() {
+        const meta = await this.loadMeta();
+        let totalBytes = 0;
+        meta.forEach((item) => {
+            totalBytes += item.size;
+        });
+        if (totalBytes <= this.maxBytes && meta.size <= this.maxEntries) {
+            return;
+        }
+
+        const victims = [];
+        const oldestFirst = Array.from(meta.entries()).sort((a, b) => a[1].accessedAt - b[1].accessedAt);
+        for (const [key, item] of oldestFirst) {
+            if (totalBytes <= this.maxBytes && meta.size - victims.length <= this.maxEntries) {
+                break;
+            }
+            victims.push(key);
+            totalBytes -= item.size;
+        }
+
+        await this.transaction('readwrite', (store) => {
+            victims.forEach((key) => store.delete(key));
+        });
+        victims.forEach((key) => meta.delete(key));
+    }
+}
@@ -0,0 +1,97 @@
+// WebSocket client for /api/v1/chat/ws, for dashboards that embed many chat sessions
+// 优先协商二进制帧协议 easymes.frames.v1：每帧首字节为类型（c=事件，e=错误，d=本轮结束），其余为 UTF-8 内容
+// 服务端不支持时自动回退到 JSON 信封 {"type":"chunk","data":...}
+class ChatSocketClient {
+    static PROTOCOL_FRAMES = 'easymes.frames.v1';
+    static PROTOCOL_JSON = 'easymes.json';
+
+    constructor(url, handlers = {}) {
+        this.url = url;
+        this.onEvent = handlers.onEvent || (() => {});
+        this.onError = handlers.onError || (() => {});
+        this.onDone = handlers.onDone || (() => {});
+        this.onClose = handlers.onClose || (() => {});
+        this.decoder = new TextDecoder('utf-8');
+        this.socket = null;
+        this.openPromise = null;
+    }
+
+    connect() {
+        if (this.openPromise) {
+            return this.openPromise;
+        }
+
+        this.openPromise = new Promise((resolve, reject) => {
+            const socket = new WebSocket(this.url, [ChatSocketClient.PROTOCOL_FRAMES, ChatSocketClient.PROTOCOL_JSON]);
+            socket.binaryType = 'arraybuffer';
+            socket.onopen = () => resolve(socket);
+            socket.onerror = () => reject(new Error('WebSocket connection failed'));
+            socket.onmessage = (message) => this.handleMessage(message.data);
+            socket.onclose = (event) => {
+                this.socket = null;
+                this.openPromise = null;
+                this.onClose(event);
+            };
+            this.socket = socket;
+        });
+        return this.openPromise;
+    }
+
+    async send(query, user, options = {}) {
+        const socket = await this.connect();
+        socket.send(JSON.stringify({
+            query,
+            user,
+            conversation_id: options.conversationId || '',
+            inputs: options.inputs || {},
+            trace_id: options.traceId || undefined,
+            // 'compact'：精简事件格式（meta / {"d": 增量} / end）
+            stream_format: options.streamFormat || undefined
+        }));
+    }
+
+    close() {
+        if (this.socket) {
+            this.socket.close();
+        }
+    }
+
+    handleMessage(data) {
+        if (typeof data === 'string') {
+            // 旧协议：JSON 信封，没有结束帧，由调用方根据 message_end / workflow_finished 判断
+            const envelope = JSON.parse(data);
+            if (envelope.type === 'chunk') {
+                this.dispatchEvent(envelope.data);
+            } else if (envelope.type === 'error') {
+                this.onError(envelope.message);
+            }
+            return;
+        }
+
+        const bytes = new Uint8Array(data);
+        if (bytes.length === 0) {
+            return;
+        }
+        const tag = String.fromCharCode(bytes[0]);
+        const payload = bytes.length > 1 ? this.decoder.decode(bytes.subarray(1)) : '';
+        if (tag === 'c') {
+            this.dispatchEvent(JSON.parse(payload));
+        } else if (tag === 'e') {
+            this.onError(payload);
+        } else if (tag === 'd') {
+            this.onDone();
+        }
+    }
+
+    dispatchEvent(event) {
+        try {
+            this.onEvent(event);
+        } catch (error) {
+            console.error('[ChatSocket] event handler error:', error);
+        }
+    }
+}
+
+if (typeof window !== 'undefined') {
+    window.ChatSocketClient = ChatSocketClient;
+}
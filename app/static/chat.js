@@ -2,6 +2,441 @@
 console.log('=== Chat.js loaded successfully ===');
 console.log('Current timestamp:', new Date().toISOString());
 
+// 虚拟列表：只保留可视区域及缓冲区内的节点，其余条目用上下占位块撑开高度
+class VirtualList {
+    constructor(container, options = {}) {
+        this.container = container;
+        this.renderItem = options.renderItem;
+        this.onUnmount = options.onUnmount || null;
+        this.onReachStart = options.onReachStart || null;
+        this.onReachEnd = options.onReachEnd || null;
+        // 聊天区在底部时跟随新消息滚动；侧边栏等列表关闭此行为
+        this.followBottom = options.followBottom ?? true;
+        this.estimateHeight = options.estimateHeight || 120;
+        this.overscanPx = options.overscanPx ?? 800;
+        this.reachStartThresholdPx = options.reachStartThresholdPx ?? 160;
+        this.reachEndThresholdPx = options.reachEndThresholdPx ?? 160;
+        this.items = [];
+        this.itemsByKey = new Map();
+        this.frameId = null;
+        this.gap = 0;
+        this.lastAnchor = null;
+        this.wasAtBottom = true;
+        this.resizeObserver = typeof ResizeObserver !== 'undefined'
+            ? new ResizeObserver((entries) => this.handleResize(entries))
+            : null;
+
+        // 由本组件负责滚动锚定，避免与浏览器的 scroll anchoring 叠加
+        this.container.style.overflowAnchor = 'none';
+        this.container.addEventListener('scroll', () => this.scheduleUpdate(), { passive: true });
+        window.addEventListener('resize', () => {
+            this.readGap();
+            this.scheduleUpdate();
+        });
+        this.attachSpacers();
+    }
+
+    attachSpacers() {
+        this.topSpacer = document.createElement('div');
+        this.topSpacer.className = 'virtual-list-spacer';
+        this.bottomSpacer = document.createElement('div');
+        this.bottomSpacer.className = 'virtual-list-spacer';
+        this.container.appendChild(this.topSpacer);
+        this.container.appendChild(this.bottomSpacer);
+        this.readGap();
+    }
+
+    readGap() {
+        const style = window.getComputedStyle(this.container);
+        this.gap = parseFloat(style.rowGap || style.gap) || 0;
+    }
+
+    // 清空列表及容器内的全部节点（包括列表外的静态内容）
+    reset() {
+        if (this.frameId !== null) {
+            cancelAnimationFrame(this.frameId);
+            this.frameId = null;
+        }
+        this.items.forEach((item) => this.unmountItem(item, false));
+        this.items = [];
+        this.itemsByKey.clear();
+        this.lastAnchor = null;
+        this.wasAtBottom = true;
+        this.container.innerHTML = '';
+        this.attachSpacers();
+    }
+
+    has(key) {
+        return this.itemsByKey.has(key);
+    }
+
+    getData(key) {
+        return this.itemsByKey.get(key)?.data || null;
+    }
+
+    getNode(key) {
+        return this.itemsByKey.get(key)?.node || null;
+    }
+
+    createItem(key, data, node = null, pinned = false) {
+        const item = { key, data: data || {}, height: null, node: null, pinned, mountCount: 0 };
+        if (node) {
+            item.node = node;
+            node.dataset.virtualKey = key;
+        }
+        return item;
+    }
+
+    append(key, data, { node = null, pinned = false } = {}) {
+        this.appendMany([{ key, data, node, pinned }]);
+    }
+
+    appendMany(entries) {
+        entries.forEach(({ key, data, node = null, pinned = false }) => {
+            if (this.itemsByKey.has(key)) {
+                return;
+            }
+            const item = this.createItem(key, data, node, pinned);
+            this.items.push(item);
+            this.itemsByKey.set(key, item);
+        });
+        this.update();
+    }
+
+    // 在顶部插入更早的条目，update() 内的锚定逻辑保证当前可视内容不跳动
+    prepend(entries) {
+        const newItems = entries
+            .filter(({ key }) => !this.itemsByKey.has(key))
+            .map(({ key, data }) => this.createItem(key, data));
+        if (!newItems.length) {
+            return;
+        }
+        newItems.forEach((item) => this.itemsByKey.set(item.key, item));
+        this.items = newItems.concat(this.items);
+        this.update();
+    }
+
+    // 按 key 与新数据对齐：保留未变化条目的节点和测量高度，只重建有变化的条目
+    sync(entries, isEqual = null) {
+        const nextItems = [];
+        const nextByKey = new Map();
+        entries.forEach(({ key, data }) => {
+            if (nextByKey.has(key)) {
+                return;
+            }
+            let item = this.itemsByKey.get(key);
+            if (!item) {
+                item = this.createItem(key, data);
+            } else if (isEqual ? !isEqual(item.data, data) : item.data !== data) {
+                item.data = data;
+                this.unmountItem(item, true);
+            }
+            nextItems.push(item);
+            nextByKey.set(key, item);
+        });
+
+        this.items.forEach((item) => {
+            if (!nextByKey.has(item.key)) {
+                this.unmountItem(item, true);
+            }
+        });
+        this.items = nextItems;
+        this.itemsByKey = nextByKey;
+        this.update();
+    }
+
+    keys() {
+        return this.items.map(item => item.key);
+    }
+
+    get size() {
+        return this.items.length;
+    }
+
+    updateData(key, patch) {
+        const item = this.itemsByKey.get(key);
+        if (item) {
+            item.data = { ...item.data, ...patch };
+        }
+    }
+
+    setPinned(key, pinned) {
+        const item = this.itemsByKey.get(key);
+        if (item && item.pinned !== pinned) {
+            item.pinned = pinned;
+            this.scheduleUpdate();
+        }
+    }
+
+    remove(key) {
+        const item = this.itemsByKey.get(key);
+        if (!item) {
+            return false;
+        }
+        this.unmountItem(item, false);
+        this.itemsByKey.delete(key);
+        this.items.splice(this.items.indexOf(item), 1);
+        this.update();
+        return true;
+    }
+
+    lastKeyWhere(predicate) {
+        for (let index = this.items.length - 1; index >= 0; index -= 1) {
+            if (predicate(this.items[index].data)) {
+                return this.items[index].key;
+            }
+        }
+        return null;
+    }
+
+    pitchOf(item) {
+        return item.height ?? (this.estimateHeight + this.gap);
+    }
+
+    offsetOf(item) {
+        let offset = 0;
+        for (const current of this.items) {
+            if (current === item) {
+                break;
+            }
+            offset += this.pitchOf(current);
+        }
+        return offset;
+    }
+
+    totalHeight() {
+        return this.items.reduce((sum, item) => sum + this.pitchOf(item), 0);
+    }
+
+    // 列表坐标系原点：顶部占位块之后第一条消息的位置
+    listTop() {
+        const containerRect = this.container.getBoundingClientRect();
+        const spacerRect = this.topSpacer.getBoundingClientRect();
+        return spacerRect.top - containerRect.top + this.container.scrollTop + this.gap;
+    }
+
+    isNearBottom() {
+        const { scrollTop, scrollHeight, clientHeight } = this.container;
+        return scrollHeight - scrollTop - clientHeight <= 8;
+    }
+
+    captureAnchor() {
+        const containerTop = this.container.getBoundingClientRect().top;
+        for (const item of this.items) {
+            if (!item.node || !item.node.isConnected) {
+                continue;
+            }
+            const rect = item.node.getBoundingClientRect();
+            if (rect.bottom > containerTop) {
+                return { key: item.key, top: rect.top - containerTop };
+            }
+        }
+        return null;
+    }
+
+    restoreAnchor(anchor) {
+        const node = anchor ? this.getNode(anchor.key) : null;
+        if (!node || !node.isConnected) {
+            return;
+        }
+        const top = node.getBoundingClientRect().top - this.container.getBoundingClientRect().top;
+        const delta = top - anchor.top;
+        if (Math.abs(delta) > 0.5) {
+            this.container.scrollTop += delta;
+        }
+    }
+
+    scheduleUpdate() {
+        if (this.frameId !== null) {
+            return;
+        }
+        this.frameId = requestAnimationFrame(() => {
+            this.frameId = null;
+            this.update();
+        });
+    }
+
+    update() {
+        if (this.frameId !== null) {
+            cancelAnimationFrame(this.frameId);
+            this.frameId = null;
+        }
+
+        const stickToBottom = this.followBottom && this.isNearBottom();
+        const anchor = stickToBottom ? null : this.captureAnchor();
+        const anchorItem = anchor ? this.itemsByKey.get(anchor.key) : null;
+        const viewportHeight = this.container.clientHeight;
+
+        // 以锚点推算目标视口位置（顶部插入历史时当前 scrollTop 已失效）
+        let viewTop;
+        if (stickToBottom) {
+            viewTop = this.totalHeight() - viewportHeight;
+        } else if (anchorItem) {
+            viewTop = this.offsetOf(anchorItem) - anchor.top;
+        } else {
+            viewTop = this.container.scrollTop - this.listTop();
+        }
+
+        const lower = viewTop - this.overscanPx;
+        const upper = viewTop + viewportHeight + this.overscanPx;
+        let start = this.items.length;
+        let end = this.items.length;
+        let offset = 0;
+        for (let index = 0; index < this.items.length; index += 1) {
+            const pitch = this.pitchOf(this.items[index]);
+            if (start === this.items.length && offset + pitch > lower) {
+                start = index;
+            }
+            if (offset >= upper) {
+                end = index;
+                break;
+            }
+            offset += pitch;
+        }
+        if (start > end) {
+            start = end;
+        }
+        // 固定条目（流式消息、输入提示）必须保持挂载，只会出现在列表尾部
+        const firstPinned = this.items.findIndex((item) => item.pinned);
+        if (firstPinned !== -1 && firstPinned < start) {
+            start = firstPinned;
+        }
+
+        this.render(start, end);
+
+        if (stickToBottom) {
+            this.container.scrollTop = this.container.scrollHeight;
+        } else if (anchor) {
+            this.restoreAnchor(anchor);
+        }
+
+        this.lastAnchor = this.captureAnchor();
+        this.wasAtBottom = this.followBottom && this.isNearBottom();
+
+        if (
+            this.onReachStart &&
+            this.items.length &&
+            this.container.scrollTop <= this.reachStartThresholdPx
+        ) {
+            this.onReachStart();
+        }
+
+        if (this.onReachEnd && this.items.length) {
+            const { scrollTop, scrollHeight, clientHeight } = this.container;
+            if (scrollHeight - scrollTop - clientHeight <= this.reachEndThresholdPx) {
+                this.onReachEnd();
+            }
+        }
+    }
+
+    render(start, end) {
+        const desired = new Set(this.items.slice(start, end));
+        const trailingPinned = this.items.slice(end).filter((item) => item.pinned);
+        trailingPinned.forEach((item) => desired.add(item));
+
+        this.items.forEach((item) => {
+            if (item.node && !desired.has(item)) {
+                this.unmountItem(item, true);
+            }
+        });
+
+        const mounted = [];
+        const place = (item, cursor) => {
+            if (!item.node) {
+                item.node = this.renderItem(item);
+                item.node.dataset.virtualKey = item.key;
+            }
+            if (!item.observed) {
+                mounted.push(item);
+            }
+            if (item.node !== cursor) {
+                this.container.insertBefore(item.node, cursor);
+                return cursor;
+            }
+            return cursor.nextSibling;
+        };
+
+        let cursor = this.topSpacer.nextSibling;
+        for (let index = start; index < end; index += 1) {
+            cursor = place(this.items[index], cursor);
+        }
+        cursor = this.bottomSpacer.nextSibling;
+        trailingPinned.forEach((item) => {
+            cursor = place(item, cursor);
+        });
+
+        mounted.forEach((item) => {
+            item.mountCount += 1;
+            item.observed = true;
+            // 用 offsetHeight 测量，不受入场动画的 transform 影响
+            item.height = item.node.offsetHeight + this.gap;
+            if (this.resizeObserver) {
+                this.resizeObserver.observe(item.node);
+            }
+        });
+
+        let topHeight = 0;
+        for (let index = 0; index < start; index += 1) {
+            topHeight += this.pitchOf(this.items[index]);
+        }
+        let bottomHeight = 0;
+        for (let index = end; index < this.items.length; index += 1) {
+            if (!this.items[index].pinned) {
+                bottomHeight += this.pitchOf(this.items[index]);
+            }
+        }
+        this.topSpacer.style.height = `${topHeight}px`;
+        this.bottomSpacer.style.height = `${bottomHeight}px`;
+    }
+
+    unmountItem(item, notify) {
+        if (!item.node) {
+            return;
+        }
+        if (this.resizeObserver) {
+            this.resizeObserver.unobserve(item.node);
+        }
+        if (notify && this.onUnmount) {
+            this.onUnmount(item, item.node);
+        }
+        item.node.remove();
+        item.node = null;
+        item.observed = false;
+    }
+
+    handleResize(entries) {
+        let changed = false;
+        entries.forEach((entry) => {
+            const item = this.itemsByKey.get(entry.target.dataset.virtualKey);
+            if (!item || item.node !== entry.target) {
+                return;
+            }
+            const pitch = entry.target.offsetHeight + this.gap;
+            if (Math.abs(pitch - (item.height ?? 0)) > 0.5) {
+                item.height = pitch;
+                changed = true;
+            }
+        });
+        if (!changed) {
+            return;
+        }
+
+        if (this.wasAtBottom) {
+            this.container.scrollTop = this.container.scrollHeight;
+        } else {
+            this.restoreAnchor(this.lastAnchor);
+        }
+        this.scheduleUpdate();
+    }
+
+    scrollToBottom() {
+        this.container.scrollTop = this.container.scrollHeight;
+        this.update();
+        this.container.scrollTop = this.container.scrollHeight;
+        this.wasAtBottom = true;
+    }
+}
+
 class ChatBot {
     constructor() {
         this.sectionHeadingWhitelist = [
@@ -16,13 +451,46 @@ class ChatBot {
         this.isStreaming = false;
         this.showAvatarUrlInBotReply = false; // 临时调试开关：在机器人回复中显示 avatar URL
         this.avatarUpstreamUrlDebug = null;
+        this.userAvatarUrl = null; // bootstrap 返回的头像（data URI 或带内容哈希的 URL）
+        this.serverConfig = null;
+        this.serviceWorkerReady = null; // navigator.serviceWorker.register() 的 Promise
         this.isWorkflowApp = false; // 标记是否为 workflow 应用
         this.abortController = null; // 用于中断请求
         this.chartInstances = new Map();
         this.chartModal = null;
+        this.chartModalInstance = null;
+        this.chartWorker = null;
+        this.chartWorkerDisabled = false;
+        this.chartWorkerSeq = 0;
+        this.chartWorkerRequests = new Map();
+        this.chartConfigCache = new Map();
+        this.chartConfigCacheLimit = 200;
+        this.messageSeq = 0;
+        // 已渲染消息 HTML 的 LRU 缓存，按字符数限制总量
+        this.renderedHtmlCache = new Map();
+        this.renderedHtmlCacheChars = 0;
+        this.renderedHtmlCacheCharLimit = 4000000;
+        this.historyFirstId = null;
+        this.historyHasMore = false;
+        this.historyLoading = false;
+        this.historyGeneration = 0;
+        this.conversationCache = new ConversationCache();
+        // 输入联想：防抖请求 /api/v1/suggest，新输入到来时中断上一次请求
+        this.suggestBox = null;
+        this.suggestItems = [];
+        this.suggestIndex = -1;
+        this.suggestTimer = null;
+        this.suggestController = null;
+        this.suggestDisabled = false;
+        this.suggestDebounceMs = 120;
         
         // DOM elements
         this.chatMessages = document.getElementById('chatMessages');
+        this.messageList = this.chatMessages ? new VirtualList(this.chatMessages, {
+            renderItem: (item) => this.renderMessageRecord(item),
+            onUnmount: (item) => this.cleanupChartForMessage(item.key),
+            onReachStart: () => this.loadOlderMessages()
+        }) : null;
         this.chatForm = document.getElementById('chatForm');
         this.messageInput = document.getElementById('messageInput');
         this.sendBtn = document.getElementById('sendBtn');
@@ -42,6 +510,17 @@ class ChatBot {
         this.activeConversationMenu = null;
         this.isMultiSelectMode = false;
         this.selectedConversationIds = new Set();
+        this.conversationPageSize = 40;
+        this.conversationLastId = null;
+        this.conversationHasMore = false;
+        this.conversationLoadingMore = false;
+        this.conversationRefreshSeq = 0;
+        this.conversationVirtualList = this.conversationList ? new VirtualList(this.conversationList, {
+            renderItem: (item) => this.renderConversationRow(item.data),
+            onReachEnd: () => this.loadMoreConversations(),
+            followBottom: false,
+            estimateHeight: 60
+        }) : null;
         
         this.init();
     }
@@ -75,10 +554,20 @@ class ChatBot {
         document.addEventListener('click', () => this.closeAllConversationMenus());
         
         // Auto-resize textarea
-        this.messageInput.addEventListener('input', () => this.autoResize());
+        this.messageInput.addEventListener('input', () => {
+            this.autoResize();
+            this.scheduleSuggest();
+        });
+        this.messageInput.addEventListener('blur', () => {
+            // 延迟关闭，保证点击联想项的 mousedown 先处理
+            setTimeout(() => this.hideSuggestions(), 150);
+        });
         
         // Enter to send, Shift+Enter for new line
         this.messageInput.addEventListener('keydown', (e) => {
+            if (this.handleSuggestKeydown(e)) {
+                return;
+            }
             if (e.key === 'Enter' && !e.shiftKey) {
                 e.preventDefault();
                 if (!this.isStreaming) {
@@ -90,6 +579,12 @@ class ChatBot {
         // 移动端虚拟键盘处理
         this.handleMobileKeyboard();
 
+        // 应用外壳离线缓存：再次打开时 HTML/CSS/JS 直接从缓存读取
+        this.registerServiceWorker();
+
+        // 一次请求取回头像、首页会话列表和配置，服务端同时预热 Dify 连接
+        this.bootstrap();
+
         // 调试：仅在开关打开时，获取后端最终头像 URL（从响应头读取）
         if (this.showAvatarUrlInBotReply) {
             this.resolveAvatarUpstreamUrlDebug();
@@ -192,6 +687,7 @@ class ChatBot {
         if (!message) {
             return;
         }
+        this.hideSuggestions();
 
         await this.submitMessage(message, true);
     }
@@ -232,10 +728,111 @@ class ChatBot {
         return employeeId || globalEmployeeId || 'CNHUSUN';
     }
 
-    getUserAvatarUrl() {
+    getAvatarProxyUrl() {
         const employeeId = this.userId || 'CNHUSUN';
         const encodedEmployeeId = encodeURIComponent(employeeId);
-        return `/api/v1/avatar?EmployeeId=${encodedEmployeeId}&avatarKey=${encodedEmployeeId}`;
+        return `/api/v1/avatar?EmployeeId=${encodedEmployeeId}&avatarKey=${encodedEmployeeId}&size=${this.getAvatarPixelSize()}`;
+    }
+
+    // 头像按 42px 显示，按设备像素比请求对应尺寸的缩略图
+    getAvatarPixelSize() {
+        return Math.ceil(42 * (window.devicePixelRatio || 1));
+    }
+
+    supportsWebp() {
+        try {
+            return document.createElement('canvas').toDataURL('image/webp').startsWith('data:image/webp');
+        } catch (error) {
+            return false;
+        }
+    }
+
+    getUserAvatarUrl() {
+        return this.userAvatarUrl || this.getAvatarProxyUrl();
+    }
+
+    // 启动聚合请求；任何部分失败都退回到原来的单独请求
+    async bootstrap() {
+        const refreshSeq = this.conversationRefreshSeq;
+        const params = new URLSearchParams({
+            user: this.userId,
+            limit: String(this.conversationPageSize),
+            avatar_size: String(this.getAvatarPixelSize()),
+            avatar_format: this.supportsWebp() ? 'webp' : 'jpeg'
+        });
+
+        let data;
+        try {
+            const response = await fetch(`/api/v1/bootstrap?${params.toString()}`);
+            if (!response.ok) {
+                throw new Error(`Bootstrap failed: ${response.status}`);
+            }
+            data = await response.json();
+        } catch (error) {
+            console.warn('[Bootstrap] Falling back to separate requests:', error);
+            return;
+        }
+
+        this.serverConfig = data.config || null;
+        this.syncServiceWorker();
+        if (data.avatar && data.avatar.url) {
+            this.userAvatarUrl = data.avatar.url;
+            if (!data.avatar.inline) {
+                // 提前拉取，首条消息渲染时头像已在浏览器缓存中
+                new Image().src = data.avatar.url;
+            }
+        }
+
+        // 侧边栏已经加载过列表时，以它的结果为准
+        if (data.conversations && refreshSeq === this.conversationRefreshSeq) {
+            const { page, etag } = data.conversations;
+            // 带 ETag 写入缓存：打开侧边栏时直接渲染，随后的校验请求多半是 304
+            await this.conversationCache.put(this.getConversationListCacheKey(), page, etag);
+        }
+    }
+
+    registerServiceWorker() {
+        if (!('serviceWorker' in navigator)) {
+            this.serviceWorkerReady = Promise.resolve(null);
+            return;
+        }
+        this.serviceWorkerReady = navigator.serviceWorker.register('/sw.js', { scope: '/' })
+            .catch((error) => {
+                console.warn('[SW] registration failed:', error);
+                return null;
+            });
+    }
+
+    // 版本握手：当前控制页面的 Service Worker 版本与服务端 shell_version 不一致时后台更新
+    // 新版本安装后下次打开页面生效，不打断正在进行的对话
+    async syncServiceWorker() {
+        if (!('serviceWorker' in navigator) || !this.serverConfig) {
+            return;
+        }
+        if (this.serverConfig.service_worker_enabled === false) {
+            const registrations = await navigator.serviceWorker.getRegistrations();
+            await Promise.all(registrations.map((registration) => registration.unregister()));
+            return;
+        }
+
+        const registration = await this.serviceWorkerReady;
+        const controller = navigator.serviceWorker.controller;
+        if (!registration || !controller || !this.serverConfig.shell_version) {
+            return;
+        }
+        const version = await new Promise((resolve) => {
+            const channel = new MessageChannel();
+            const timer = setTimeout(() => resolve(null), 2000);
+            channel.port1.onmessage = (event) => {
+                clearTimeout(timer);
+                resolve(event.data && event.data.version);
+            };
+            controller.postMessage({ type: 'get-shell-version' }, [channel.port2]);
+        });
+        if (version !== this.serverConfig.shell_version) {
+            console.log(`[SW] shell ${version} is outdated (server ${this.serverConfig.shell_version}), updating`);
+            registration.update().catch((error) => console.warn('[SW] update failed:', error));
+        }
     }
 
     appendAvatarUrlDebug(content) {
@@ -243,7 +840,7 @@ class ChatBot {
         if (!this.showAvatarUrlInBotReply) {
             return baseContent;
         }
-        const proxyUrl = this.getUserAvatarUrl();
+        const proxyUrl = this.getAvatarProxyUrl();
         const upstreamUrl = this.avatarUpstreamUrlDebug || '(loading...)';
         return `${baseContent}\n\n[DEBUG avatar_proxy_url] ${proxyUrl}\n[DEBUG avatar_upstream_url] ${upstreamUrl}`;
     }
@@ -253,7 +850,7 @@ class ChatBot {
             return;
         }
 
-        const proxyUrl = this.getUserAvatarUrl();
+        const proxyUrl = this.getAvatarProxyUrl();
         try {
             const resp = await fetch(proxyUrl, {
                 method: 'GET',
@@ -727,224 +1324,6 @@ class ChatBot {
         return text.replace(/[&<>"']/g, (m) => map[m]);
     }
 
-    stripMarkdownSyntax(text) {
-        return String(text || '')
-            .replace(/<[^>]*>/g, '')
-            .replace(/\*\*|__/g, '')
-            .replace(/[*_`~]/g, '')
-            .trim();
-    }
-
-    getNumericValueFromText(text) {
-        const source = String(text || '').replace(/,/g, '').trim();
-        const match = source.match(/-?\d+(?:\.\d+)?/);
-        if (!match) {
-            return null;
-        }
-        const value = Number(match[0]);
-        return Number.isFinite(value) ? value : null;
-    }
-
-    isTimeLikeLabel(label) {
-        const normalized = String(label || '').trim();
-        return /(\d{4}[-\/.年]\d{1,2}|\d{1,2}[-\/.月]\d{1,2}|\d{1,2}月|Q[1-4]|第[一二三四]季|周|星期|周[一二三四五六日天]|\d{4}年|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)/i.test(normalized);
-    }
-
-    extractPairsFromMarkdownTable(content) {
-        const lines = String(content || '').split('\n').map(line => line.trim());
-        const tableLines = lines.filter(line => line.startsWith('|') && line.endsWith('|'));
-        if (tableLines.length < 3) {
-            return [];
-        }
-
-        const dataRows = tableLines.slice(2);
-        const result = [];
-
-        for (const row of dataRows) {
-            const cells = row.split('|').map(cell => this.stripMarkdownSyntax(cell)).filter(Boolean);
-            if (cells.length < 2) {
-                continue;
-            }
-
-            const label = cells[0];
-            const rawValue = cells[1];
-            const value = this.getNumericValueFromText(rawValue);
-            if (!label || value === null) {
-                continue;
-            }
-
-            result.push({ label, value, rawValue });
-        }
-
-        return result;
-    }
-
-    extractPairsFromLines(content) {
-        const lines = String(content || '').split('\n').map(line => line.trim()).filter(Boolean);
-        const result = [];
-        const patterns = [
-            /^[-*]\s*([^:：]{1,40})\s*[:：]\s*([-+]?\d[\d,.]*\s*%?)/,
-            /^(?:\d+[.)、]\s*)?([^:：]{1,40})\s*[:：]\s*([-+]?\d[\d,.]*\s*%?)/,
-            /^([^:：]{1,30})\s+([-+]?\d[\d,.]*\s*%?)$/
-        ];
-
-        for (const line of lines) {
-            const plainLine = this.stripMarkdownSyntax(line);
-            let matched = null;
-            for (const pattern of patterns) {
-                const match = plainLine.match(pattern);
-                if (match) {
-                    matched = match;
-                    break;
-                }
-            }
-
-            if (!matched) {
-                continue;
-            }
-
-            const label = this.stripMarkdownSyntax(matched[1]);
-            const rawValue = matched[2];
-            const value = this.getNumericValueFromText(rawValue);
-            if (!label || value === null) {
-                continue;
-            }
-
-            result.push({ label, value, rawValue });
-        }
-
-        return result;
-    }
-
-    extractPairsFromStructuredRows(content) {
-        const lines = String(content || '').split('\n').map(line => line.trim()).filter(Boolean);
-        if (lines.length < 3) {
-            return [];
-        }
-
-        const splitColumns = (line) => {
-            if (line.includes('\t')) {
-                return line.split(/\t+/).map(cell => this.stripMarkdownSyntax(cell)).filter(Boolean);
-            }
-            return line.split(/\s{2,}/).map(cell => this.stripMarkdownSyntax(cell)).filter(Boolean);
-        };
-
-        const headerCells = splitColumns(lines[0]);
-        if (headerCells.length < 2) {
-            return [];
-        }
-
-        const dataRows = lines.slice(1);
-        const result = [];
-
-        for (const row of dataRows) {
-            const cells = splitColumns(row);
-            if (cells.length < 2) {
-                continue;
-            }
-
-            const rawValue = cells[cells.length - 1];
-            const value = this.getNumericValueFromText(rawValue);
-            if (value === null) {
-                continue;
-            }
-
-            let label = '';
-            if (cells.length >= 3 && /^\d+$/.test(cells[0])) {
-                label = cells[1];
-            } else {
-                label = cells[0];
-            }
-
-            label = this.stripMarkdownSyntax(label);
-            if (!label) {
-                continue;
-            }
-
-            result.push({ label, value, rawValue });
-        }
-
-        return result;
-    }
-
-    extractPairsFromRenderedTable(messageDiv) {
-        if (!messageDiv) {
-            return [];
-        }
-
-        const table = messageDiv.querySelector('.markdown-body table');
-        if (!table) {
-            return [];
-        }
-
-        const rows = table.querySelectorAll('tbody tr');
-        if (!rows.length) {
-            return [];
-        }
-
-        const result = [];
-        rows.forEach((row) => {
-            const cells = Array.from(row.querySelectorAll('td'))
-                .map(td => this.stripMarkdownSyntax(td.textContent || ''))
-                .filter(Boolean);
-
-            if (cells.length < 2) {
-                return;
-            }
-
-            const rawValue = cells[cells.length - 1];
-            const value = this.getNumericValueFromText(rawValue);
-            if (value === null) {
-                return;
-            }
-
-            let label = '';
-            if (cells.length >= 3 && /^\d+$/.test(cells[0])) {
-                label = cells[1];
-            } else {
-                label = cells[0];
-            }
-
-            label = this.stripMarkdownSyntax(label);
-            if (!label) {
-                return;
-            }
-
-            result.push({ label, value, rawValue });
-        });
-
-        return result;
-    }
-
-    isTotalLikeLabel(label) {
-        const normalized = String(label || '')
-            .toLowerCase()
-            .replace(/[\s_\-:：]/g, '');
-        return /(合计|总计|汇总|小计|total|sum|grandtotal)/i.test(normalized);
-    }
-
-    splitDisplayAndTotalPairs(pairs) {
-        const sourcePairs = Array.isArray(pairs) ? pairs : [];
-        const displayPairs = sourcePairs.filter(pair => !this.isTotalLikeLabel(pair.label));
-        const totalPairs = sourcePairs.filter(pair => this.isTotalLikeLabel(pair.label));
-
-        let percentBase = null;
-        for (const pair of totalPairs) {
-            const value = Number(pair.value);
-            if (Number.isFinite(value) && value > 0) {
-                percentBase = value;
-                break;
-            }
-        }
-
-        if (!Number.isFinite(percentBase)) {
-            const sum = displayPairs.reduce((acc, pair) => acc + (Number(pair.value) || 0), 0);
-            percentBase = sum > 0 ? sum : null;
-        }
-
-        return { displayPairs, percentBase };
-    }
-
     shouldGenerateChartForQuestion(question) {
         const source = String(question || '').toLowerCase();
         if (!source) {
@@ -1000,365 +1379,300 @@ class ChatBot {
         return null;
     }
 
-    extractTableChartConfig(messageDiv, content) {
-        const text = String(content || '').trim();
-        if (!text && !messageDiv) {
-            return null;
-        }
-
-        // 优先解析 markdown 表格
-        const markdownPairs = this.extractPairsFromMarkdownTable(text);
-        const markdownResult = this.splitDisplayAndTotalPairs(markdownPairs);
-        if (markdownResult.displayPairs.length >= 2) {
-            const data = markdownResult.displayPairs.slice(0, 12);
-            return {
-                chartType: this.inferChartType(text, data.map(pair => pair.label), data),
-                labels: data.map(pair => pair.label),
-                values: data.map(pair => pair.value),
-                percentBase: markdownResult.percentBase
-            };
-        }
-
-        // 解析已渲染的 HTML 表格
-        const renderedTablePairs = this.extractPairsFromRenderedTable(messageDiv);
-        const renderedResult = this.splitDisplayAndTotalPairs(renderedTablePairs);
-        if (renderedResult.displayPairs.length >= 2) {
-            const data = renderedResult.displayPairs.slice(0, 12);
-            return {
-                chartType: this.inferChartType(text, data.map(pair => pair.label), data),
-                labels: data.map(pair => pair.label),
-                values: data.map(pair => pair.value),
-                percentBase: renderedResult.percentBase
-            };
-        }
-
-        // 解析制表符/多空格列（视作纯文本表格）
-        const structuredPairs = this.extractPairsFromStructuredRows(text);
-        const structuredResult = this.splitDisplayAndTotalPairs(structuredPairs);
-        if (structuredResult.displayPairs.length >= 2) {
-            const data = structuredResult.displayPairs.slice(0, 12);
-            return {
-                chartType: this.inferChartType(text, data.map(pair => pair.label), data),
-                labels: data.map(pair => pair.label),
-                values: data.map(pair => pair.value),
-                percentBase: structuredResult.percentBase
-            };
-        }
-
-        return null;
-    }
-
-    renderFallbackBarChart(chartWrapper, chartConfig) {
-        const maxValue = Math.max(...chartConfig.values, 0);
-        if (maxValue <= 0) {
+    cleanupChartForMessage(messageId) {
+        if (!messageId) {
             return;
         }
-
-        const list = document.createElement('div');
-        list.className = 'fallback-chart-list';
-
-        chartConfig.labels.forEach((label, index) => {
-            const value = chartConfig.values[index];
-            const widthPercent = Math.max(4, Math.round((value / maxValue) * 100));
-
-            const item = document.createElement('div');
-            item.className = 'fallback-chart-item';
-
-            const labelEl = document.createElement('div');
-            labelEl.className = 'fallback-chart-label';
-            labelEl.textContent = label;
-
-            const track = document.createElement('div');
-            track.className = 'fallback-chart-track';
-
-            const bar = document.createElement('div');
-            bar.className = 'fallback-chart-bar';
-            bar.style.width = `${widthPercent}%`;
-
-            const valueEl = document.createElement('span');
-            valueEl.className = 'fallback-chart-value';
-            valueEl.textContent = String(value);
-
-            bar.appendChild(valueEl);
-            track.appendChild(bar);
-            item.appendChild(labelEl);
-            item.appendChild(track);
-            list.appendChild(item);
-        });
-
-        chartWrapper.appendChild(list);
-    }
-
-    inferChartType(content, labels, pairs) {
-        const source = String(content || '');
-        const hasTrendKeyword = /(趋势|走势|变化|按月|按周|按日|同比|环比|trend|timeline|over\s*time|time\s*series|month|week|day)/i.test(source);
-        const hasRatioKeyword = /(占比|比例|构成|份额|百分比|distribution|ratio|share|composition)/i.test(source);
-        const timeLikeCount = labels.filter(label => this.isTimeLikeLabel(label)).length;
-        const hasPercentValue = pairs.some(pair => /%/.test(pair.rawValue));
-        const total = pairs.reduce((sum, pair) => sum + pair.value, 0);
-        const isNearHundred = Math.abs(total - 100) <= 2;
-
-        if (hasTrendKeyword || timeLikeCount >= Math.max(2, Math.ceil(labels.length * 0.6))) {
-            return 'line';
-        }
-        if (hasRatioKeyword || hasPercentValue || isNearHundred) {
-            return 'pie';
+        const existingChart = this.chartInstances.get(messageId);
+        if (existingChart) {
+            existingChart.destroy();
+            this.chartInstances.delete(messageId);
         }
-        return 'bar';
     }
 
-    extractChartConfigFromContent(content) {
-        const text = String(content || '').trim();
-        if (!text) {
-            return null;
-        }
-
-        let pairs = this.extractPairsFromMarkdownTable(text);
-        if (pairs.length < 2) {
-            pairs = this.extractPairsFromLines(text);
-        }
-        if (pairs.length < 2) {
-            pairs = this.extractPairsFromStructuredRows(text);
+    getChartWorker() {
+        if (this.chartWorker || this.chartWorkerDisabled) {
+            return this.chartWorker;
         }
-        if (pairs.length < 2) {
+        if (typeof Worker === 'undefined') {
+            this.chartWorkerDisabled = true;
             return null;
         }
 
-        const splitResult = this.splitDisplayAndTotalPairs(pairs);
-        const maxPoints = 12;
-        const normalized = splitResult.displayPairs
-            .filter(pair => pair.label && Number.isFinite(pair.value))
-            .slice(0, maxPoints);
-
-        if (normalized.length < 2) {
-            return null;
+        try {
+            const worker = new Worker('/static-debug/chart-worker.js?v=1');
+            worker.onmessage = (event) => {
+                const { id, config } = event.data || {};
+                const pending = this.chartWorkerRequests.get(id);
+                if (pending) {
+                    this.chartWorkerRequests.delete(id);
+                    pending.resolve(config || null);
+                }
+            };
+            worker.onerror = (error) => {
+                console.warn('[Chart] Worker failed, falling back to main thread:', error);
+                this.chartWorkerDisabled = true;
+                this.chartWorker = null;
+                worker.terminate();
+                this.chartWorkerRequests.forEach((pending) => pending.fallback());
+                this.chartWorkerRequests.clear();
+            };
+            this.chartWorker = worker;
+        } catch (error) {
+            console.warn('[Chart] Worker unavailable, using main thread:', error);
+            this.chartWorkerDisabled = true;
         }
 
-        const labels = normalized.map(pair => pair.label);
-        const values = normalized.map(pair => pair.value);
-        const chartType = this.inferChartType(text, labels, normalized);
-
-        return {
-            chartType,
-            labels,
-            values,
-            percentBase: splitResult.percentBase
-        };
+        return this.chartWorker;
     }
 
-    cleanupChartForMessage(messageId) {
-        if (!messageId) {
-            return;
+    // 按消息 ID + 内容哈希缓存图表配置，解析在 Worker 中完成
+    requestChartConfig(cacheKey, content, requestedType = null) {
+        const extractor = window.ChartExtract;
+        if (!extractor) {
+            return Promise.resolve(null);
         }
-        const existingChart = this.chartInstances.get(messageId);
-        if (existingChart) {
-            existingChart.destroy();
-            this.chartInstances.delete(messageId);
+
+        const cacheId = `${cacheKey}:${extractor.hashContent(content)}:${requestedType || ''}`;
+        const cached = this.chartConfigCache.get(cacheId);
+        if (cached) {
+            // 刷新 LRU 顺序
+            this.chartConfigCache.delete(cacheId);
+            this.chartConfigCache.set(cacheId, cached);
+            return cached;
         }
-    }
 
-    createSvgElement(tag, attrs = {}) {
-        const element = document.createElementNS('http://www.w3.org/2000/svg', tag);
-        Object.entries(attrs).forEach(([key, value]) => {
-            element.setAttribute(key, String(value));
-        });
-        return element;
+        const computeOnMainThread = () => extractor.extractTableChartConfig(content, requestedType);
+        const worker = this.getChartWorker();
+        const pending = worker
+            ? new Promise((resolve) => {
+                this.chartWorkerSeq += 1;
+                const id = this.chartWorkerSeq;
+                this.chartWorkerRequests.set(id, {
+                    resolve,
+                    fallback: () => resolve(computeOnMainThread())
+                });
+                worker.postMessage({ id, content, requestedType });
+            })
+            : Promise.resolve().then(computeOnMainThread);
+
+        this.chartConfigCache.set(cacheId, pending);
+        while (this.chartConfigCache.size > this.chartConfigCacheLimit) {
+            const oldestKey = this.chartConfigCache.keys().next().value;
+            this.chartConfigCache.delete(oldestKey);
+        }
+        return pending;
     }
 
-    createSvgText(x, y, text, options = {}) {
-        const textNode = this.createSvgElement('text', {
-            x,
-            y,
-            fill: options.fill || '#4b5563',
-            'font-size': options.fontSize || '10',
-            'text-anchor': options.anchor || 'middle',
-            'dominant-baseline': options.baseline || 'middle'
-        });
-        textNode.textContent = String(text ?? '');
-        return textNode;
+    truncateChartLabel(label, maxLength) {
+        const text = String(label ?? '');
+        return text.length > maxLength ? `${text.slice(0, maxLength)}…` : text;
     }
 
-    renderNativeBarChart(svg, labels, values, colors) {
-        const width = 360;
-        const height = 180;
-        const margin = { top: 12, right: 10, bottom: 36, left: 34 };
+    drawCanvasBarChart(ctx, width, height, labels, values, colors) {
+        const margin = { top: 14, right: 10, bottom: 30, left: 12 };
         const plotWidth = width - margin.left - margin.right;
         const plotHeight = height - margin.top - margin.bottom;
-        const maxValue = Math.max(...values, 1);
+        const maxValue = values.reduce((max, value) => Math.max(max, value), 1);
+        const baseline = margin.top + plotHeight;
 
-        svg.appendChild(this.createSvgElement('line', {
-            x1: margin.left,
-            y1: margin.top + plotHeight,
-            x2: width - margin.right,
-            y2: margin.top + plotHeight,
-            stroke: '#d1d5db',
-            'stroke-width': 1
-        }));
+        ctx.strokeStyle = '#d1d5db';
+        ctx.lineWidth = 1;
+        ctx.beginPath();
+        ctx.moveTo(margin.left, baseline + 0.5);
+        ctx.lineTo(width - margin.right, baseline + 0.5);
+        ctx.stroke();
 
         const slotWidth = plotWidth / values.length;
-        const barWidth = Math.max(8, Math.min(26, slotWidth * 0.62));
+        const barWidth = Math.max(8, Math.min(26 * (width / 360), slotWidth * 0.62));
+        ctx.font = '9px sans-serif';
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
 
         values.forEach((value, index) => {
-            const barHeight = (value / maxValue) * plotHeight;
+            const barHeight = Math.max(1, (Math.max(value, 0) / maxValue) * plotHeight);
             const x = margin.left + index * slotWidth + (slotWidth - barWidth) / 2;
-            const y = margin.top + plotHeight - barHeight;
-
-            svg.appendChild(this.createSvgElement('rect', {
-                x,
-                y,
-                width: barWidth,
-                height: Math.max(1, barHeight),
-                rx: 3,
-                fill: colors[index % colors.length]
-            }));
-
-            svg.appendChild(this.createSvgText(
-                x + barWidth / 2,
-                Math.max(6, y - 6),
-                value,
-                { fontSize: 9, fill: '#6b7280' }
-            ));
-
-            const label = labels[index].length > 6 ? `${labels[index].slice(0, 6)}…` : labels[index];
-            svg.appendChild(this.createSvgText(
-                x + barWidth / 2,
-                height - 14,
-                label,
-                { fontSize: 9, fill: '#6b7280' }
-            ));
+            const y = baseline - barHeight;
+
+            ctx.fillStyle = colors[index % colors.length];
+            ctx.fillRect(x, y, barWidth, barHeight);
+
+            ctx.fillStyle = '#6b7280';
+            ctx.fillText(String(value), x + barWidth / 2, Math.max(6, y - 6));
+            ctx.fillText(this.truncateChartLabel(labels[index], 6), x + barWidth / 2, height - 14);
         });
     }
 
-    renderNativeLineChart(svg, labels, values, colors) {
-        const width = 360;
-        const height = 180;
-        const margin = { top: 14, right: 10, bottom: 28, left: 34 };
+    drawCanvasLineChart(ctx, width, height, labels, values, colors) {
+        const margin = { top: 14, right: 10, bottom: 24, left: 12 };
         const plotWidth = width - margin.left - margin.right;
         const plotHeight = height - margin.top - margin.bottom;
-        const maxValue = Math.max(...values, 1);
-
-        svg.appendChild(this.createSvgElement('line', {
-            x1: margin.left,
-            y1: margin.top + plotHeight,
-            x2: width - margin.right,
-            y2: margin.top + plotHeight,
-            stroke: '#d1d5db',
-            'stroke-width': 1
-        }));
-
-        const points = values.map((value, index) => {
-            const x = margin.left + (index * plotWidth) / Math.max(values.length - 1, 1);
-            const y = margin.top + plotHeight - (value / maxValue) * plotHeight;
-            return { x, y, value, label: labels[index] };
-        });
 
-        const polyline = this.createSvgElement('polyline', {
-            points: points.map(point => `${point.x},${point.y}`).join(' '),
-            fill: 'none',
-            stroke: '#ff000f',
-            'stroke-width': 2
+        // 数据点多于像素列时按 LTTB 降采样，绘制成本与数据量无关
+        const sampled = window.ChartExtract.downsampleLttb(labels, values, Math.max(3, Math.floor(plotWidth)));
+        const sampledValues = sampled.values;
+        const maxValue = sampledValues.reduce((max, value) => Math.max(max, value), 1);
+        const minValue = sampledValues.reduce((min, value) => Math.min(min, value), 0);
+        const range = maxValue - minValue || 1;
+        const baseline = margin.top + plotHeight;
+        const pointX = (index) => margin.left + (index * plotWidth) / Math.max(sampledValues.length - 1, 1);
+        const pointY = (value) => baseline - ((value - minValue) / range) * plotHeight;
+
+        ctx.strokeStyle = '#d1d5db';
+        ctx.lineWidth = 1;
+        ctx.beginPath();
+        ctx.moveTo(margin.left, baseline + 0.5);
+        ctx.lineTo(width - margin.right, baseline + 0.5);
+        ctx.stroke();
+
+        ctx.strokeStyle = '#ff000f';
+        ctx.lineWidth = 2;
+        ctx.lineJoin = 'round';
+        ctx.beginPath();
+        sampledValues.forEach((value, index) => {
+            if (index === 0) {
+                ctx.moveTo(pointX(index), pointY(value));
+            } else {
+                ctx.lineTo(pointX(index), pointY(value));
+            }
         });
-        svg.appendChild(polyline);
-
-        points.forEach((point, index) => {
-            svg.appendChild(this.createSvgElement('circle', {
-                cx: point.x,
-                cy: point.y,
-                r: 2.5,
-                fill: colors[index % colors.length]
-            }));
+        ctx.stroke();
+
+        if (sampledValues.length <= 60) {
+            sampledValues.forEach((value, index) => {
+                ctx.fillStyle = colors[index % colors.length];
+                ctx.beginPath();
+                ctx.arc(pointX(index), pointY(value), 2.5, 0, Math.PI * 2);
+                ctx.fill();
+            });
+        }
 
-            if (index % Math.ceil(points.length / 6) === 0 || index === points.length - 1) {
-                const label = point.label.length > 6 ? `${point.label.slice(0, 6)}…` : point.label;
-                svg.appendChild(this.createSvgText(point.x, height - 10, label, { fontSize: 9 }));
+        ctx.font = '9px sans-serif';
+        ctx.fillStyle = '#4b5563';
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
+        const labelStep = Math.ceil(sampledValues.length / 6);
+        sampled.labels.forEach((label, index) => {
+            if (index % labelStep === 0 || index === sampled.labels.length - 1) {
+                ctx.fillText(this.truncateChartLabel(label, 6), pointX(index), height - 10);
             }
         });
     }
 
-    renderNativePieChart(svg, labels, values, colors, percentBase = null) {
-        const width = 360;
-        const height = 180;
-        const cx = 84;
-        const cy = 90;
-        const radius = 52;
+    drawCanvasPieChart(ctx, width, height, labels, values, colors, percentBase = null) {
         const displayTotal = values.reduce((sum, value) => sum + value, 0);
         if (displayTotal <= 0) {
-            this.renderFallbackBarChart({ appendChild: (node) => svg.appendChild(node) }, { labels, values });
+            this.drawCanvasBarChart(ctx, width, height, labels, values, colors);
             return;
         }
 
         const safePercentBase = Number.isFinite(percentBase) && percentBase > 0
             ? Math.max(percentBase, displayTotal)
             : displayTotal;
+        const scale = Math.min(width / 360, height / 180);
+        const cx = 84 * scale;
+        const cy = height / 2;
+        const radius = 52 * scale;
 
         let startAngle = -Math.PI / 2;
         values.forEach((value, index) => {
-            const angle = (value / displayTotal) * Math.PI * 2;
-            const endAngle = startAngle + angle;
-            const largeArc = angle > Math.PI ? 1 : 0;
-            const x1 = cx + radius * Math.cos(startAngle);
-            const y1 = cy + radius * Math.sin(startAngle);
-            const x2 = cx + radius * Math.cos(endAngle);
-            const y2 = cy + radius * Math.sin(endAngle);
-
-            const pathData = [
-                `M ${cx} ${cy}`,
-                `L ${x1} ${y1}`,
-                `A ${radius} ${radius} 0 ${largeArc} 1 ${x2} ${y2}`,
-                'Z'
-            ].join(' ');
-
-            svg.appendChild(this.createSvgElement('path', {
-                d: pathData,
-                fill: colors[index % colors.length]
-            }));
-
+            const endAngle = startAngle + (value / displayTotal) * Math.PI * 2;
+            ctx.fillStyle = colors[index % colors.length];
+            ctx.beginPath();
+            ctx.moveTo(cx, cy);
+            ctx.arc(cx, cy, radius, startAngle, endAngle);
+            ctx.closePath();
+            ctx.fill();
             startAngle = endAngle;
         });
 
-        const legendStartX = 160;
+        const legendStartX = 160 * scale;
+        ctx.font = `${Math.round(10 * Math.max(scale, 1))}px sans-serif`;
+        ctx.textAlign = 'start';
+        ctx.textBaseline = 'middle';
         labels.slice(0, 6).forEach((label, index) => {
-            const y = 28 + index * 24;
-            svg.appendChild(this.createSvgElement('rect', {
-                x: legendStartX,
-                y: y - 7,
-                width: 10,
-                height: 10,
-                rx: 2,
-                fill: colors[index % colors.length]
-            }));
+            const y = (28 + index * 24) * scale;
+            ctx.fillStyle = colors[index % colors.length];
+            ctx.fillRect(legendStartX, y - 7 * scale, 10 * scale, 10 * scale);
             const percent = Math.round((values[index] / safePercentBase) * 100);
-            const legendText = `${label.length > 8 ? `${label.slice(0, 8)}…` : label} ${percent}%`;
-            svg.appendChild(this.createSvgText(legendStartX + 16, y - 1, legendText, {
-                fontSize: 10,
-                fill: '#4b5563',
-                anchor: 'start'
-            }));
+            ctx.fillStyle = '#4b5563';
+            ctx.fillText(`${this.truncateChartLabel(label, 8)} ${percent}%`, legendStartX + 16 * scale, y - 2 * scale);
         });
     }
 
-    renderNativeChart(chartWrapper, chartConfig, options = {}) {
-        const expanded = !!options.expanded;
-        const chartBody = document.createElement('div');
-        chartBody.className = expanded ? 'message-chart-body chart-modal-body' : 'message-chart-body';
+    drawCanvasChart(canvas, chartConfig) {
+        const width = canvas.clientWidth;
+        const height = canvas.clientHeight;
+        if (!width || !height) {
+            return;
+        }
 
-        const svg = this.createSvgElement('svg', {
-            class: expanded ? 'message-chart-svg chart-modal-svg' : 'message-chart-svg',
-            viewBox: '0 0 360 180',
-            preserveAspectRatio: 'none'
-        });
+        const ratio = window.devicePixelRatio || 1;
+        canvas.width = Math.round(width * ratio);
+        canvas.height = Math.round(height * ratio);
+        const ctx = canvas.getContext('2d');
+        if (!ctx) {
+            return;
+        }
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+        ctx.clearRect(0, 0, width, height);
 
         const colors = ['#FF000F', '#FF4D5A', '#FF7A84', '#FCA5A5', '#FECACA', '#D1D5DB', '#9CA3AF', '#6B7280'];
         if (chartConfig.chartType === 'pie') {
-            this.renderNativePieChart(svg, chartConfig.labels, chartConfig.values, colors, chartConfig.percentBase);
+            this.drawCanvasPieChart(ctx, width, height, chartConfig.labels, chartConfig.values, colors, chartConfig.percentBase);
         } else if (chartConfig.chartType === 'line') {
-            this.renderNativeLineChart(svg, chartConfig.labels, chartConfig.values, colors);
+            this.drawCanvasLineChart(ctx, width, height, chartConfig.labels, chartConfig.values, colors);
         } else {
-            this.renderNativeBarChart(svg, chartConfig.labels, chartConfig.values, colors);
+            this.drawCanvasBarChart(ctx, width, height, chartConfig.labels, chartConfig.values, colors);
         }
+    }
+
+    renderNativeChart(chartWrapper, chartConfig, options = {}) {
+        const expanded = !!options.expanded;
+        const chartBody = document.createElement('div');
+        chartBody.className = expanded ? 'message-chart-body chart-modal-body' : 'message-chart-body';
 
-        chartBody.appendChild(svg);
+        const canvas = document.createElement('canvas');
+        canvas.className = 'message-chart-canvas';
+        canvas.setAttribute('role', 'img');
+        canvas.setAttribute('aria-label', '数据图表');
+
+        chartBody.appendChild(canvas);
         chartWrapper.appendChild(chartBody);
+
+        let frameId = null;
+        const scheduleDraw = () => {
+            if (frameId !== null) {
+                return;
+            }
+            frameId = requestAnimationFrame(() => {
+                frameId = null;
+                this.drawCanvasChart(canvas, chartConfig);
+            });
+        };
+
+        let resizeObserver = null;
+        if (typeof ResizeObserver !== 'undefined') {
+            resizeObserver = new ResizeObserver(scheduleDraw);
+            resizeObserver.observe(chartBody);
+        }
+        scheduleDraw();
+
+        return {
+            destroy: () => {
+                if (frameId !== null) {
+                    cancelAnimationFrame(frameId);
+                    frameId = null;
+                }
+                if (resizeObserver) {
+                    resizeObserver.disconnect();
+                }
+                // 释放画布位图内存
+                canvas.width = 0;
+                canvas.height = 0;
+                chartBody.remove();
+            }
+        };
     }
 
     ensureChartModal() {
@@ -1419,14 +1733,19 @@ class ChatBot {
         }
 
         this.chartModal.overlay.classList.add('hidden');
+        if (this.chartModalInstance) {
+            this.chartModalInstance.destroy();
+            this.chartModalInstance = null;
+        }
         this.chartModal.body.innerHTML = '';
     }
 
     renderChartSummary(container, chartConfig) {
         const summary = document.createElement('div');
         summary.className = 'chart-modal-summary';
+        const maxSummaryItems = 100;
 
-        chartConfig.labels.forEach((label, index) => {
+        chartConfig.labels.slice(0, maxSummaryItems).forEach((label, index) => {
             const item = document.createElement('div');
             item.className = 'chart-modal-summary-item';
 
@@ -1443,6 +1762,13 @@ class ChatBot {
             summary.appendChild(item);
         });
 
+        if (chartConfig.labels.length > maxSummaryItems) {
+            const more = document.createElement('div');
+            more.className = 'chart-modal-summary-item';
+            more.textContent = `仅显示前 ${maxSummaryItems} 项，共 ${chartConfig.labels.length} 项`;
+            summary.appendChild(more);
+        }
+
         container.appendChild(summary);
     }
 
@@ -1453,6 +1779,10 @@ class ChatBot {
 
         const modal = this.ensureChartModal();
         modal.title.textContent = chartTitleText;
+        if (this.chartModalInstance) {
+            this.chartModalInstance.destroy();
+            this.chartModalInstance = null;
+        }
         modal.body.innerHTML = '';
 
         const enlargedChartWrapper = document.createElement('div');
@@ -1463,82 +1793,108 @@ class ChatBot {
         chartTitle.textContent = '放大视图';
 
         enlargedChartWrapper.appendChild(chartTitle);
-        this.renderNativeChart(enlargedChartWrapper, chartConfig, { expanded: true });
         modal.body.appendChild(enlargedChartWrapper);
         this.renderChartSummary(modal.body, chartConfig);
         modal.overlay.classList.remove('hidden');
+        // 弹窗可见后再创建画布，保证能取到实际尺寸
+        this.chartModalInstance = this.renderNativeChart(enlargedChartWrapper, chartConfig, { expanded: true });
     }
 
-    tryRenderChartForMessage(messageDiv, content, userQuestion = '') {
+    // prerendered：服务端随历史消息返回的 { html, chart }，有 chart 字段时直接使用，不再走关键词判断和 Worker
+    async tryRenderChartForMessage(messageDiv, content, userQuestion = '', prerendered = null) {
         try {
             if (!messageDiv || !messageDiv.id) {
                 return;
             }
 
-            if (!this.shouldGenerateChartForQuestion(userQuestion)) {
+            const hasPrerenderedChart = !!prerendered && Object.prototype.hasOwnProperty.call(prerendered, 'chart');
+            if (hasPrerenderedChart && !prerendered.chart) {
+                return;
+            }
+
+            if (!hasPrerenderedChart && !this.shouldGenerateChartForQuestion(userQuestion)) {
                 console.log('[Chart] User question has no chart keyword, skip rendering');
                 return;
             }
 
-        this.cleanupChartForMessage(messageDiv.id);
-        const oldWrapper = messageDiv.querySelector('.message-chart-wrapper');
-        if (oldWrapper) {
-            oldWrapper.remove();
-        }
+            this.cleanupChartForMessage(messageDiv.id);
+            const oldWrapper = messageDiv.querySelector('.message-chart-wrapper');
+            if (oldWrapper) {
+                oldWrapper.remove();
+            }
 
-        const chartConfig = this.extractTableChartConfig(messageDiv, content);
+            const requestedType = this.getRequestedChartTypeFromQuestion(userQuestion);
+            const requestToken = String(Date.now() + Math.random());
+            messageDiv.dataset.chartRequest = requestToken;
+            const cacheKey = messageDiv.dataset.difyMessageId || messageDiv.id;
+            const chartConfig = hasPrerenderedChart
+                ? prerendered.chart
+                : await this.requestChartConfig(cacheKey, content, requestedType);
 
-        if (!chartConfig) {
-            console.log('[Chart] No table-form data detected, skip rendering');
-            return;
-        }
+            // 等待期间消息可能被重新渲染或移除
+            if (messageDiv.dataset.chartRequest !== requestToken || !messageDiv.isConnected) {
+                return;
+            }
 
-        const requestedType = this.getRequestedChartTypeFromQuestion(userQuestion);
-        if (requestedType) {
-            chartConfig.chartType = requestedType;
-            console.log('[Chart] Using requested chart type:', requestedType, 'question:', userQuestion);
-        }
+            if (!chartConfig) {
+                console.log('[Chart] No table-form data detected, skip rendering');
+                return;
+            }
 
-        const contentDiv = messageDiv.querySelector('.message-content');
-        if (!contentDiv) {
-            return;
-        }
+            if (requestedType) {
+                console.log('[Chart] Using requested chart type:', requestedType, 'question:', userQuestion);
+            }
 
-        const chartWrapper = document.createElement('div');
-        chartWrapper.className = 'message-chart-wrapper';
-        chartWrapper.setAttribute('role', 'button');
-        chartWrapper.setAttribute('tabindex', '0');
-        chartWrapper.setAttribute('aria-label', '点击放大图表');
-        chartWrapper.title = '点击放大图表';
+            const contentDiv = messageDiv.querySelector('.message-content');
+            if (!contentDiv) {
+                return;
+            }
 
-        const chartTitle = document.createElement('div');
-        chartTitle.className = 'message-chart-title';
-        chartTitle.textContent = '数据可视化';
+            const chartWrapper = document.createElement('div');
+            chartWrapper.className = 'message-chart-wrapper';
+            chartWrapper.setAttribute('role', 'button');
+            chartWrapper.setAttribute('tabindex', '0');
+            chartWrapper.setAttribute('aria-label', '点击放大图表');
+            chartWrapper.title = '点击放大图表';
 
-        chartWrapper.appendChild(chartTitle);
+            const chartTitle = document.createElement('div');
+            chartTitle.className = 'message-chart-title';
+            chartTitle.textContent = '数据可视化';
 
-        const insertBeforeNode = contentDiv.querySelector('.message-feedback-actions') || contentDiv.querySelector('.message-disclaimer');
-        if (insertBeforeNode) {
-            contentDiv.insertBefore(chartWrapper, insertBeforeNode);
-        } else {
-            contentDiv.appendChild(chartWrapper);
-        }
+            chartWrapper.appendChild(chartTitle);
 
-        this.renderNativeChart(chartWrapper, chartConfig);
-        chartWrapper.addEventListener('click', () => {
-            this.openChartModal({ ...chartConfig, labels: [...chartConfig.labels], values: [...chartConfig.values] }, '图表详情');
-        });
-        chartWrapper.addEventListener('keydown', (event) => {
-            if (event.key === 'Enter' || event.key === ' ') {
-                event.preventDefault();
-                this.openChartModal({ ...chartConfig, labels: [...chartConfig.labels], values: [...chartConfig.values] }, '图表详情');
+            const insertBeforeNode = contentDiv.querySelector('.message-feedback-actions') || contentDiv.querySelector('.message-disclaimer');
+            if (insertBeforeNode) {
+                contentDiv.insertBefore(chartWrapper, insertBeforeNode);
+            } else {
+                contentDiv.appendChild(chartWrapper);
             }
-        });
+
+            this.chartInstances.set(messageDiv.id, this.renderNativeChart(chartWrapper, chartConfig));
+            chartWrapper.addEventListener('click', () => {
+                this.openChartModal(chartConfig, '图表详情');
+            });
+            chartWrapper.addEventListener('keydown', (event) => {
+                if (event.key === 'Enter' || event.key === ' ') {
+                    event.preventDefault();
+                    this.openChartModal(chartConfig, '图表详情');
+                }
+            });
         } catch (error) {
             console.error('[Chart] tryRenderChartForMessage error:', error);
         }
     }
     
+    // 流式回答的增量已由服务端逐块清理（伪影、空行、首尾空白），无需再对累计全文重复清理；
+    // 只有整段 JSON 的回答仍交给 formatMesData 展开
+    formatStreamAnswer(text) {
+        const trimmed = String(text || '').trim();
+        if (trimmed.startsWith('{') && trimmed.endsWith('}')) {
+            return this.formatMesData(text);
+        }
+        return String(text || '');
+    }
+
     // 格式化MES数据输出
     formatMesData(data) {
         console.log('[formatMesData] Input:', data);
@@ -1634,10 +1990,137 @@ class ChatBot {
         console.log('[cleanUpText] Output:', result);
         return result;
     }
-    
-    autoResize() {
-        this.messageInput.style.height = 'auto';
-        this.messageInput.style.height = this.messageInput.scrollHeight + 'px';
+    
+    autoResize() {
+        this.messageInput.style.height = 'auto';
+        this.messageInput.style.height = this.messageInput.scrollHeight + 'px';
+    }
+
+    // ===== 输入联想 =====
+
+    scheduleSuggest() {
+        clearTimeout(this.suggestTimer);
+        if (this.suggestDisabled || (this.serverConfig && this.serverConfig.suggest_enabled === false)) {
+            return;
+        }
+        const prefix = this.messageInput.value.trim();
+        // 太短或多行输入不做联想
+        if (prefix.length < 2 || prefix.includes('\n')) {
+            this.hideSuggestions();
+            return;
+        }
+        this.suggestTimer = setTimeout(() => this.fetchSuggestions(prefix), this.suggestDebounceMs);
+    }
+
+    async fetchSuggestions(prefix) {
+        if (this.suggestController) {
+            this.suggestController.abort();
+        }
+        const controller = new AbortController();
+        this.suggestController = controller;
+        const params = new URLSearchParams({ prefix, user: this.userId, limit: '6' });
+        try {
+            const response = await fetch(`/api/v1/suggest?${params.toString()}`, { signal: controller.signal });
+            if (response.status === 503) {
+                this.suggestDisabled = true;
+                return;
+            }
+            if (!response.ok) {
+                return;
+            }
+            const data = await response.json();
+            // 响应返回前输入已变化或已发送，丢弃过期结果
+            if (controller !== this.suggestController || this.messageInput.value.trim() !== prefix || this.isStreaming) {
+                return;
+            }
+            this.showSuggestions(data.suggestions || []);
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                console.warn('[Suggest] request failed:', error);
+            }
+        } finally {
+            if (controller === this.suggestController) {
+                this.suggestController = null;
+            }
+        }
+    }
+
+    showSuggestions(items) {
+        if (!items.length) {
+            this.hideSuggestions();
+            return;
+        }
+        if (!this.suggestBox) {
+            this.suggestBox = document.createElement('ul');
+            this.suggestBox.className = 'suggest-list';
+            this.suggestBox.setAttribute('role', 'listbox');
+            // mousedown 先于 textarea 的 blur，避免列表在点击前被关闭
+            this.suggestBox.addEventListener('mousedown', (e) => {
+                const item = e.target.closest('.suggest-item');
+                if (item) {
+                    e.preventDefault();
+                    this.applySuggestion(Number(item.dataset.index));
+                }
+            });
+            this.chatForm.parentElement.appendChild(this.suggestBox);
+        }
+        this.suggestItems = items;
+        this.suggestIndex = -1;
+        this.suggestBox.innerHTML = items.map((item, index) => `
+            <li class="suggest-item${item.scope === 'user' ? ' suggest-item-own' : ''}" role="option" data-index="${index}">${this.escapeHtml(item.text)}</li>
+        `).join('');
+        this.suggestBox.classList.add('visible');
+    }
+
+    hideSuggestions() {
+        clearTimeout(this.suggestTimer);
+        if (this.suggestController) {
+            this.suggestController.abort();
+            this.suggestController = null;
+        }
+        this.suggestItems = [];
+        this.suggestIndex = -1;
+        if (this.suggestBox) {
+            this.suggestBox.classList.remove('visible');
+        }
+    }
+
+    // 上下键选择，Enter/Tab 采用，Esc 关闭；返回 true 表示事件已被联想列表处理
+    handleSuggestKeydown(e) {
+        if (!this.suggestItems.length) {
+            return false;
+        }
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            const count = this.suggestItems.length;
+            const step = e.key === 'ArrowDown' ? 1 : -1;
+            this.suggestIndex = (this.suggestIndex + 1 + step + count + 1) % (count + 1) - 1;
+            this.suggestBox.querySelectorAll('.suggest-item').forEach((el, index) => {
+                el.classList.toggle('active', index === this.suggestIndex);
+            });
+            return true;
+        }
+        if ((e.key === 'Enter' || e.key === 'Tab') && !e.shiftKey && this.suggestIndex >= 0) {
+            e.preventDefault();
+            this.applySuggestion(this.suggestIndex);
+            return true;
+        }
+        if (e.key === 'Escape') {
+            this.hideSuggestions();
+            return true;
+        }
+        return false;
+    }
+
+    applySuggestion(index) {
+        const item = this.suggestItems[index];
+        if (!item) {
+            return;
+        }
+        this.messageInput.value = item.text;
+        this.hideSuggestions();
+        this.autoResize();
+        this.messageInput.focus();
     }
     
     async handleSubmit(e) {
@@ -1695,8 +2178,16 @@ class ChatBot {
             return;
         }
 
+        const messageId = this.nextMessageId();
+        const messageDiv = this.createUserFallbackElement(messageId, content);
+        this.messageList.append(messageId, { type: 'user', content, fallback: true }, { node: messageDiv });
+        this.scrollToBottom();
+    }
+
+    createUserFallbackElement(id, content) {
         const messageDiv = document.createElement('div');
         messageDiv.className = 'message user-message';
+        messageDiv.id = id;
         const bubble = document.createElement('div');
         bubble.className = 'message-content';
         const markdownBody = document.createElement('div');
@@ -1707,8 +2198,7 @@ class ChatBot {
         bubble.appendChild(markdownBody);
         messageDiv.appendChild(bubble);
 
-        this.chatMessages.appendChild(messageDiv);
-        this.scrollToBottom();
+        return messageDiv;
     }
 
     setBotMarkdownContent(container, content) {
@@ -1782,15 +2272,22 @@ class ChatBot {
                 this.removeMessage(typingId);
             }
 
-            const formattedAnswer = this.appendAvatarUrlDebug(this.formatMesData(fullAnswer));
+            const formattedAnswer = this.appendAvatarUrlDebug(this.formatStreamAnswer(fullAnswer));
             if (!messageCreated) {
-                const messageId = 'msg_' + Date.now();
+                const messageId = this.nextMessageId();
                 messageDiv = this.createMessageElement(formattedAnswer, 'bot', messageId, difyMessageId);
-                this.chatMessages.appendChild(messageDiv);
+                // 流式输出期间固定挂载，避免滚动时节点被回收
+                this.messageList.append(messageId, {
+                    type: 'bot',
+                    content: formattedAnswer,
+                    difyMessageId,
+                    userQuestion: query
+                }, { node: messageDiv, pinned: true });
                 contentDiv = messageDiv.querySelector('.markdown-body');
                 messageCreated = true;
             } else if (contentDiv) {
                 this.setBotMarkdownContent(contentDiv, formattedAnswer);
+                this.messageList.updateData(messageDiv.id, { content: formattedAnswer });
             }
 
             this.scrollToBottom();
@@ -1830,7 +2327,8 @@ class ChatBot {
                 query: query,
                 user: this.userId,
                 conversation_id: this.conversationId,
-                inputs: {}
+                inputs: {},
+                stream_format: 'compact'
             };
             console.log('Request body:', requestBody);
             
@@ -1843,7 +2341,9 @@ class ChatBot {
                     query: query,
                     conversation_id: this.conversationId,
                     user: this.userId,
-                    inputs: {}
+                    inputs: {},
+                    // 精简流格式：标识只在 meta 事件中发送一次，文本块只带增量 {"d": "..."}
+                    stream_format: 'compact'
                 }),
                 signal: this.abortController.signal
             });
@@ -1879,6 +2379,12 @@ class ChatBot {
                                 continue;
                             }
 
+                            if (typeof json.d === 'string') {
+                                this.updateTypingStatus('正在生成回复');
+                                acceptStreamContent('delta', json.d, false);
+                                continue;
+                            }
+
                             console.log('=== Received event:', json.event, '===');
                             console.log('[FULL JSON]', JSON.stringify(json, null, 2));
 
@@ -1896,7 +2402,33 @@ class ChatBot {
                             }
                                 
                             // Handle chat message events
-                            if (json.event === 'message') {
+                            if (json.event === 'meta') {
+                                if (json.conversation_id) {
+                                    this.conversationId = json.conversation_id;
+                                }
+                                if (json.message_id) {
+                                    difyMessageId = json.message_id;
+                                }
+                            } else if (json.event === 'end') {
+                                // 精简流格式的结束事件：只有与已收增量不一致时才携带完整 answer
+                                if (typeof json.answer === 'string' && json.answer.trim()) {
+                                    acceptStreamContent('workflow', json.answer, true);
+                                }
+                                const extractor = window.ChartExtract;
+                                if (extractor && (fullAnswer.length !== json.length || extractor.hashContent(fullAnswer) !== json.hash)) {
+                                    console.warn('[END EVENT] Accumulated answer does not match server fingerprint', {
+                                        length: fullAnswer.length,
+                                        expectedLength: json.length
+                                    });
+                                }
+                                renderBotStreamAnswer();
+                                if (difyMessageId) {
+                                    this.setBotMessageId(messageDiv, difyMessageId, performance.now() - requestStartedAt);
+                                }
+                                streamShouldTerminate = true;
+                            } else if (json.event === 'progress') {
+                                this.updateTypingStatus('正在处理问题');
+                            } else if (json.event === 'message') {
                                 console.log('[MESSAGE EVENT] Processing...');
                                 if (json.conversation_id) {
                                     this.conversationId = json.conversation_id;
@@ -2027,8 +2559,8 @@ class ChatBot {
                         console.warn('Failed to parse trailing JSON:', data, parseError);
                     }
 
-                    if (json?.event === 'workflow_finished') {
-                        const workflowAnswer = json.data?.outputs?.answer || '';
+                    if (json?.event === 'workflow_finished' || json?.event === 'end') {
+                        const workflowAnswer = json.event === 'end' ? (json.answer || '') : (json.data?.outputs?.answer || '');
                         if (typeof workflowAnswer === 'string' && workflowAnswer.trim()) {
                             acceptStreamContent('workflow', workflowAnswer, true);
                             renderBotStreamAnswer();
@@ -2042,13 +2574,7 @@ class ChatBot {
             await flushUiFrame();
             
             // Remove typing indicator if still present
-            const remainingTyping = document.querySelector('.typing-indicator');
-            if (remainingTyping) {
-                const typingMessage = remainingTyping.closest('.message');
-                if (typingMessage) {
-                    typingMessage.remove();
-                }
-            }
+            this.removeTypingIndicators();
             
             // If no content received, show error
             console.log('[LOOP END] Checking fullAnswer:', fullAnswer ? 'HAS CONTENT' : 'EMPTY');
@@ -2057,17 +2583,18 @@ class ChatBot {
                 console.log('[LOOP END] No content received, creating error message');
                 if (!messageCreated) {
                     // 直接创建带有错误文本的消息，不要先创建空消息
-                    const messageId = 'msg_' + Date.now();
+                    const messageId = this.nextMessageId();
                     messageDiv = this.createMessageElement('抱歉，没有收到响应。', 'bot', messageId);
-                    this.chatMessages.appendChild(messageDiv);
+                    this.messageList.append(messageId, { type: 'bot', content: '抱歉，没有收到响应。' }, { node: messageDiv });
                     console.log('[LOOP END] Created error message element with text');
                 } else if (contentDiv) {
                     contentDiv.textContent = '抱歉，没有收到响应。';
+                    this.messageList.updateData(messageDiv.id, { content: '抱歉，没有收到响应。' });
                 }
             } else {
                 console.log('[LOOP END] Content received, no error message needed');
                 if (messageDiv) {
-                    const formattedAnswer = this.appendAvatarUrlDebug(this.formatMesData(fullAnswer));
+                    const formattedAnswer = this.appendAvatarUrlDebug(this.formatStreamAnswer(fullAnswer));
                     this.tryRenderChartForMessage(messageDiv, formattedAnswer, query);
                     if (!messageDiv.querySelector('.message-duration')) {
                         this.setBotMessageDuration(messageDiv, performance.now() - requestStartedAt);
@@ -2089,23 +2616,17 @@ class ChatBot {
             if (error.name === 'AbortError') {
                 console.log('Request aborted by user');
                 // Remove typing indicator if present
-                const typingElement = document.querySelector('.typing-indicator');
-                if (typingElement) {
-                    const typingMessage = typingElement.closest('.message');
-                    if (typingMessage) {
-                        typingMessage.remove();
-                    }
-                }
+                this.removeTypingIndicators();
                 
                 // 显示停止消息
                 if (this.userStopped) {
-                    const messageId = 'msg_' + Date.now();
+                    const messageId = this.nextMessageId();
                     const stopMessage = this.createMessageElement(
                         '用户停止了回复信息',
                         'bot',
                         messageId
                     );
-                    this.chatMessages.appendChild(stopMessage);
+                    this.messageList.append(messageId, { type: 'bot', content: '用户停止了回复信息' }, { node: stopMessage });
                     this.scrollToBottom();
                     this.addDisclaimerToLatestBotMessage();
                 }
@@ -2113,17 +2634,11 @@ class ChatBot {
                 console.error('Stream error:', error);
                 
                 // Remove typing indicator if present
-                const typingElement = document.querySelector('.typing-indicator');
-                if (typingElement) {
-                    const typingMessage = typingElement.closest('.message');
-                    if (typingMessage) {
-                        typingMessage.remove();
-                    }
-                }
+                this.removeTypingIndicators();
                 
                 // Show error message
                 if (!messageCreated) {
-                    const messageId = 'msg_' + Date.now();
+                    const messageId = this.nextMessageId();
                     const rawMessage = String(error?.message || '');
                     let displayMessage = `抱歉，发生了错误：${rawMessage}`;
 
@@ -2140,7 +2655,7 @@ class ChatBot {
 
                     // 直接创建带有错误文本的消息，不要先创建空消息
                     messageDiv = this.createMessageElement(displayMessage, 'bot', messageId);
-                    this.chatMessages.appendChild(messageDiv);
+                    this.messageList.append(messageId, { type: 'bot', content: displayMessage }, { node: messageDiv });
                 } else if (contentDiv) {
                     const rawMessage = String(error?.message || '');
                     let displayMessage = `抱歉，发生了错误：${rawMessage}`;
@@ -2157,12 +2672,16 @@ class ChatBot {
                     }
 
                     contentDiv.textContent = displayMessage;
+                    this.messageList.updateData(messageDiv.id, { content: displayMessage });
                 }
                 this.addDisclaimerToLatestBotMessage();
             }
         } finally {
             releaseStreamingUi();
             this.abortController = null;
+            if (messageDiv) {
+                this.messageList.setPinned(messageDiv.id, false);
+            }
         }
     }
     
@@ -2172,17 +2691,92 @@ class ChatBot {
             oldDisclaimers.forEach(disclaimer => disclaimer.remove());
         }
 
-        const messageId = 'msg_' + Date.now();
+        const messageId = this.nextMessageId();
         const messageDiv = this.createMessageElement(content, type, messageId, difyMessageId);
-        this.chatMessages.appendChild(messageDiv);
+        this.messageList.append(messageId, { type, content, difyMessageId, userQuestion }, { node: messageDiv });
         if (type === 'bot') {
             this.tryRenderChartForMessage(messageDiv, content, userQuestion);
         }
         this.scrollToBottom();
         return messageId;
     }
+
+    nextMessageId(prefix = 'msg') {
+        // 同一毫秒内可能创建多条消息，追加自增序号保证 id 唯一
+        this.messageSeq += 1;
+        return `${prefix}_${Date.now()}_${this.messageSeq}`;
+    }
+
+    // prerenderedHtml：服务端预渲染的 HTML，缓存未命中时代替本地 markdownToHtml
+    getRenderedMessageHtml(key, content, prerenderedHtml = null) {
+        const cached = this.renderedHtmlCache.get(key);
+        if (cached && cached.content === content) {
+            this.renderedHtmlCache.delete(key);
+            this.renderedHtmlCache.set(key, cached);
+            return cached.html;
+        }
+
+        if (cached) {
+            this.renderedHtmlCache.delete(key);
+            this.renderedHtmlCacheChars -= cached.content.length + cached.html.length;
+        }
+
+        const html = typeof prerenderedHtml === 'string'
+            ? prerenderedHtml
+            : this.markdownToHtml(this.removeArtifactText(content || ''));
+        this.renderedHtmlCache.set(key, { content, html });
+        this.renderedHtmlCacheChars += content.length + html.length;
+
+        while (this.renderedHtmlCacheChars > this.renderedHtmlCacheCharLimit && this.renderedHtmlCache.size > 1) {
+            const [oldestKey, oldest] = this.renderedHtmlCache.entries().next().value;
+            this.renderedHtmlCache.delete(oldestKey);
+            this.renderedHtmlCacheChars -= oldest.content.length + oldest.html.length;
+        }
+
+        return html;
+    }
+
+    // 虚拟列表回调：根据消息记录重建节点（首次挂载或滚动回可视区域时）
+    renderMessageRecord(item) {
+        const record = item.data;
+        let messageDiv;
+        if (record.type === 'typing') {
+            messageDiv = this.createTypingElement(item.key);
+        } else if (record.fallback) {
+            messageDiv = this.createUserFallbackElement(item.key, record.content);
+        } else {
+            const renderedHtml = record.type === 'bot' && record.content
+                ? this.getRenderedMessageHtml(item.key, record.content, record.prerendered?.html)
+                : null;
+            messageDiv = this.createMessageElement(record.content, record.type, item.key, record.difyMessageId, { renderedHtml });
+        }
+
+        if (item.mountCount > 0 || record.restored) {
+            messageDiv.classList.add('message-restored');
+        }
+
+        if (record.type === 'bot') {
+            if (record.feedbackRating) {
+                this.setFeedbackState(messageDiv, record.feedbackRating);
+            }
+            if (record.elapsedMs !== undefined && record.elapsedMs !== null) {
+                this.setBotMessageDuration(messageDiv, record.elapsedMs);
+            }
+            // 免责声明只保留在最新一条机器人消息上
+            if (item.key !== this.getLatestBotMessageKey()) {
+                messageDiv.querySelectorAll('.message-disclaimer').forEach(disclaimer => disclaimer.remove());
+            }
+            this.tryRenderChartForMessage(messageDiv, record.content, record.userQuestion || '', record.prerendered);
+        }
+
+        return messageDiv;
+    }
+
+    getLatestBotMessageKey() {
+        return this.messageList.lastKeyWhere(record => record.type === 'bot');
+    }
     
-    createMessageElement(content, type, id, difyMessageId = null) {
+    createMessageElement(content, type, id, difyMessageId = null, options = {}) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${type}-message`;
         messageDiv.id = id;
@@ -2209,7 +2803,9 @@ class ChatBot {
         markdownBody.className = 'markdown-body';
         
         if (content) {
-            if (type === 'bot') {
+            if (type === 'bot' && typeof options.renderedHtml === 'string') {
+                markdownBody.innerHTML = options.renderedHtml;
+            } else if (type === 'bot') {
                 this.setBotMarkdownContent(markdownBody, content);
             } else {
                 const p = document.createElement('p');
@@ -2439,6 +3035,7 @@ class ChatBot {
         }
 
         messageDiv.dataset.difyMessageId = difyMessageId;
+        this.messageList.updateData(messageDiv.id, { difyMessageId });
         const actionBtns = messageDiv.querySelectorAll('.message-like-btn, .message-dislike-btn');
         actionBtns.forEach((btn) => {
             btn.disabled = false;
@@ -2478,6 +3075,7 @@ class ChatBot {
 
         durationEl.textContent = `总耗时：${this.formatElapsedTime(elapsedMs)}`;
         contentDiv.appendChild(durationEl);
+        this.messageList.updateData(messageDiv.id, { elapsedMs });
     }
 
     setFeedbackState(messageDiv, rating) {
@@ -2490,6 +3088,7 @@ class ChatBot {
         } else {
             delete messageDiv.dataset.feedbackRating;
         }
+        this.messageList.updateData(messageDiv.id, { feedbackRating: rating || null });
 
         const likeBtn = messageDiv.querySelector('.message-like-btn');
         const dislikeBtn = messageDiv.querySelector('.message-dislike-btn');
@@ -2577,7 +3176,15 @@ class ChatBot {
     }
     
     showTypingIndicator() {
-        const typingId = 'typing_' + Date.now();
+        const typingId = this.nextMessageId('typing');
+        const messageDiv = this.createTypingElement(typingId);
+        this.messageList.append(typingId, { type: 'typing' }, { node: messageDiv, pinned: true });
+        this.scrollToBottom();
+        
+        return typingId;
+    }
+
+    createTypingElement(typingId) {
         const messageDiv = document.createElement('div');
         messageDiv.className = 'message bot-message';
         messageDiv.id = typingId;
@@ -2606,10 +3213,16 @@ class ChatBot {
         messageDiv.appendChild(avatar);
         messageDiv.appendChild(contentDiv);
         
-        this.chatMessages.appendChild(messageDiv);
-        this.scrollToBottom();
-        
-        return typingId;
+        return messageDiv;
+    }
+
+    removeTypingIndicators() {
+        this.chatMessages.querySelectorAll('.typing-indicator').forEach((typingElement) => {
+            const typingMessage = typingElement.closest('.message');
+            if (typingMessage) {
+                this.removeMessage(typingMessage.id);
+            }
+        });
     }
 
     updateTypingStatus(text) {
@@ -2623,16 +3236,27 @@ class ChatBot {
     
     removeMessage(messageId) {
         this.cleanupChartForMessage(messageId);
+        if (this.messageList.remove(messageId)) {
+            return;
+        }
         const message = document.getElementById(messageId);
         if (message) {
             message.remove();
         }
     }
-    
-    clearChat() {
+
+    resetMessageList() {
         this.chartInstances.forEach((chart) => chart.destroy());
         this.chartInstances.clear();
-        this.chatMessages.innerHTML = '';
+        this.messageList.reset();
+        this.historyGeneration += 1;
+        this.historyFirstId = null;
+        this.historyHasMore = false;
+        this.historyLoading = false;
+    }
+    
+    clearChat() {
+        this.resetMessageList();
         this.conversationId = null;
         console.log('Started new conversation');
     }
@@ -2661,7 +3285,7 @@ class ChatBot {
             this.closeAllConversationMenus();
         }
         this.updateBulkActionsBar();
-        this.loadConversations();
+        this.refreshConversationRows();
     }
 
     updateBulkActionsBar() {
@@ -2689,6 +3313,7 @@ class ChatBot {
         } else {
             this.selectedConversationIds.delete(conversationId);
         }
+        this.conversationVirtualList.updateData(conversationId, { selected: Boolean(selected) });
         this.updateBulkActionsBar();
     }
 
@@ -2754,6 +3379,8 @@ class ChatBot {
                     return;
                 }
 
+                this.conversationVirtualList.remove(selectedIds[index]);
+                this.conversationCache.delete(this.getMessagesCacheKey(selectedIds[index]));
                 if (this.conversationId === selectedIds[index]) {
                     this.clearChat();
                 }
@@ -2776,125 +3403,288 @@ class ChatBot {
         }
     }
     
+    // 带 If-None-Match 请求；304 时沿用缓存数据，200 时写回缓存
+    async fetchWithCache(cacheKey, url) {
+        const cached = await this.conversationCache.get(cacheKey);
+        const headers = {};
+        if (cached && cached.etag) {
+            headers['If-None-Match'] = cached.etag;
+        }
+
+        const response = await fetch(url, { headers });
+        if (response.status === 304 && cached) {
+            return { data: cached.data, changed: false };
+        }
+        if (!response.ok) {
+            throw new Error(`Request failed: ${response.status}`);
+        }
+
+        const data = await response.json();
+        this.conversationCache.put(cacheKey, data, response.headers.get('ETag'));
+        return { data, changed: true };
+    }
+
+    getConversationListCacheKey() {
+        return `conversations:${this.userId}`;
+    }
+
+    getMessagesCacheKey(conversationId) {
+        return `messages:${this.userId}:${conversationId}`;
+    }
+
+    async fetchConversationPage(lastId = null) {
+        const params = new URLSearchParams({
+            user: this.userId,
+            limit: String(this.conversationPageSize),
+            sort_by: '-updated_at'
+        });
+        if (lastId) {
+            params.set('last_id', lastId);
+        }
+
+        const url = `/api/v1/conversations?${params.toString()}`;
+        if (!lastId) {
+            // 只缓存第一页，后续页按游标实时加载
+            const { data } = await this.fetchWithCache(this.getConversationListCacheKey(), url);
+            return data;
+        }
+
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error('Failed to load conversations');
+        }
+
+        return response.json();
+    }
+
+    // 刷新第一页；已加载的后续页保留，只有显示内容变化的行会被重建
     async loadConversations() {
+        const list = this.conversationVirtualList;
+        const refreshSeq = ++this.conversationRefreshSeq;
+        this.conversationLoadingMore = false;
+        if (!list.size) {
+            this.setConversationListStatus('loading');
+            // 先用缓存渲染，网络结果回来后再按 key 对齐
+            const cached = await this.conversationCache.get(this.getConversationListCacheKey());
+            if (cached && refreshSeq === this.conversationRefreshSeq && !list.size) {
+                this.applyConversationFirstPage(cached.data);
+            }
+        }
+
         try {
-            this.conversationList.innerHTML = '<div class="loading-conversations"><div class="spinner"></div><span>加载中...</span></div>';
-            
-            const response = await fetch(`/api/v1/conversations?user=${this.userId}&limit=80&sort_by=-updated_at`);
-            if (!response.ok) {
-                throw new Error('Failed to load conversations');
+            const data = await this.fetchConversationPage();
+            if (refreshSeq !== this.conversationRefreshSeq) {
+                return;
             }
-            
-            const data = await response.json();
-            this.renderConversations(data.data || []);
+
+            this.applyConversationFirstPage(data);
         } catch (error) {
             console.error('Error loading conversations:', error);
-            this.conversationList.innerHTML = '<div class="no-conversations">加载失败，请重试</div>';
+            if (!list.size) {
+                this.setConversationListStatus('error');
+            }
         }
     }
-    
-    renderConversations(conversations) {
-        if (!conversations || conversations.length === 0) {
-            this.conversationList.innerHTML = '<div class="no-conversations">暂无历史会话</div>';
-            this.selectedConversationIds.clear();
-            this.updateBulkActionsBar();
+
+    // 第一页与已加载的后续页合并，保留后续页顺序并沿用游标
+    applyConversationFirstPage(data) {
+        const list = this.conversationVirtualList;
+        const freshEntries = (data.data || []).map(conv => this.buildConversationEntry(conv));
+        let entries = freshEntries;
+        let hasMore = Boolean(data.has_more);
+        if (hasMore) {
+            const freshKeys = new Set(freshEntries.map(entry => entry.key));
+            const olderEntries = list.keys()
+                .filter(key => !freshKeys.has(key))
+                .map(key => this.buildConversationEntry(list.getData(key).conv));
+            if (olderEntries.length) {
+                entries = freshEntries.concat(olderEntries);
+                hasMore = this.conversationHasMore;
+            }
+        }
+
+        this.conversationHasMore = hasMore;
+        this.conversationLastId = entries.length ? entries[entries.length - 1].key : null;
+        this.renderConversations(entries);
+    }
+
+    // 滚动到列表底部时按 last_id 游标加载下一页
+    async loadMoreConversations() {
+        if (!this.conversationHasMore || this.conversationLoadingMore || !this.conversationLastId) {
             return;
         }
-        
-        this.conversationList.innerHTML = '';
-        // 后端按更新时间倒序返回，前端直接渲染。
-        conversations.forEach(conv => {
-            const item = document.createElement('div');
-            item.className = 'conversation-item';
-            if (this.isMultiSelectMode) {
-                item.classList.add('select-mode');
+
+        const list = this.conversationVirtualList;
+        const refreshSeq = this.conversationRefreshSeq;
+        this.conversationLoadingMore = true;
+        try {
+            const data = await this.fetchConversationPage(this.conversationLastId);
+            if (refreshSeq !== this.conversationRefreshSeq) {
+                return;
+            }
+
+            const conversations = data.data || [];
+            this.conversationHasMore = Boolean(data.has_more) && conversations.length > 0;
+            if (conversations.length) {
+                this.conversationLastId = conversations[conversations.length - 1].id;
+                list.appendMany(conversations.map(conv => this.buildConversationEntry(conv)));
             }
-            if (conv.id === this.conversationId) {
-                item.classList.add('active');
+        } catch (error) {
+            console.error('Error loading more conversations:', error);
+            return;
+        } finally {
+            if (refreshSeq === this.conversationRefreshSeq) {
+                this.conversationLoadingMore = false;
             }
+        }
 
-            if (this.isMultiSelectMode) {
-                const checkbox = document.createElement('input');
-                checkbox.type = 'checkbox';
-                checkbox.className = 'conversation-item-select';
-                checkbox.checked = this.selectedConversationIds.has(conv.id);
-                checkbox.addEventListener('click', (e) => e.stopPropagation());
-                checkbox.addEventListener('change', () => {
-                    this.toggleConversationSelection(conv.id, checkbox.checked);
-                    item.classList.toggle('active', checkbox.checked);
-                });
-                item.appendChild(checkbox);
+        // 列表仍未填满侧边栏时继续加载下一页
+        list.scheduleUpdate();
+    }
+
+    buildConversationEntry(conv) {
+        return {
+            key: conv.id,
+            data: {
+                conv,
+                timeText: this.formatTimestamp(conv.updated_at || conv.created_at),
+                active: conv.id === this.conversationId,
+                selectMode: this.isMultiSelectMode,
+                selected: this.selectedConversationIds.has(conv.id)
             }
+        };
+    }
 
-            const main = document.createElement('div');
-            main.className = 'conversation-main';
-            
-            const name = document.createElement('div');
-            name.className = 'conversation-name';
-            name.textContent = conv.name || '新对话';
-            
-            const time = document.createElement('div');
-            time.className = 'conversation-time';
-            time.textContent = this.formatTimestamp(conv.updated_at || conv.created_at);
+    isSameConversationRow(previous, next) {
+        return previous.conv.name === next.conv.name
+            && previous.timeText === next.timeText
+            && previous.active === next.active
+            && previous.selectMode === next.selectMode
+            && previous.selected === next.selected;
+    }
+
+    setConversationListStatus(status) {
+        this.conversationList.querySelectorAll('.loading-conversations, .no-conversations').forEach(node => node.remove());
+        const markup = {
+            loading: '<div class="loading-conversations"><div class="spinner"></div><span>加载中...</span></div>',
+            empty: '<div class="no-conversations">暂无历史会话</div>',
+            error: '<div class="no-conversations">加载失败，请重试</div>'
+        }[status];
+        if (markup) {
+            this.conversationList.insertAdjacentHTML('afterbegin', markup);
+        }
+    }
+    
+    renderConversations(entries) {
+        this.setConversationListStatus(entries.length ? null : 'empty');
+        // 后端按更新时间倒序返回，前端按 key 对齐已有行
+        this.conversationVirtualList.sync(entries, (previous, next) => this.isSameConversationRow(previous, next));
 
-            const actions = document.createElement('div');
-            actions.className = 'conversation-actions';
+        this.selectedConversationIds.forEach((conversationId) => {
+            if (!this.conversationVirtualList.has(conversationId)) {
+                this.selectedConversationIds.delete(conversationId);
+            }
+        });
+        this.updateBulkActionsBar();
+    }
 
-            const menuBtn = document.createElement('button');
-            menuBtn.className = 'conversation-menu-btn';
-            menuBtn.type = 'button';
-            menuBtn.title = '更多操作';
-            menuBtn.innerHTML = '<svg width="14" height="14" viewBox="0 0 24 24" fill="currentColor"><circle cx="12" cy="5" r="2"/><circle cx="12" cy="12" r="2"/><circle cx="12" cy="19" r="2"/></svg>';
+    // 本地状态（多选模式、选中项）变化时只重建受影响的行，不重新请求
+    refreshConversationRows() {
+        const list = this.conversationVirtualList;
+        const entries = list.keys().map(key => this.buildConversationEntry(list.getData(key).conv));
+        list.sync(entries, (previous, next) => this.isSameConversationRow(previous, next));
+    }
 
-            const menu = document.createElement('div');
-            menu.className = 'conversation-item-menu';
-            menu.innerHTML = '<button type="button" class="conversation-delete-btn" title="删除会话"><svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M3 6h18M8 6V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6"/><path d="M10 11v6M14 11v6"/></svg></button>';
+    renderConversationRow(record) {
+        const conv = record.conv;
+        const item = document.createElement('div');
+        item.className = 'conversation-item';
+        if (record.selectMode) {
+            item.classList.add('select-mode');
+        }
+        if (record.active || (record.selectMode && record.selected)) {
+            item.classList.add('active');
+        }
 
-            menuBtn.addEventListener('click', (e) => {
-                e.stopPropagation();
-                this.toggleConversationMenu(menu);
+        if (record.selectMode) {
+            const checkbox = document.createElement('input');
+            checkbox.type = 'checkbox';
+            checkbox.className = 'conversation-item-select';
+            checkbox.checked = record.selected;
+            checkbox.addEventListener('click', (e) => e.stopPropagation());
+            checkbox.addEventListener('change', () => {
+                this.toggleConversationSelection(conv.id, checkbox.checked);
+                item.classList.toggle('active', checkbox.checked);
             });
+            item.appendChild(checkbox);
+        }
 
-            menu.addEventListener('click', (e) => e.stopPropagation());
+        const main = document.createElement('div');
+        main.className = 'conversation-main';
+        
+        const name = document.createElement('div');
+        name.className = 'conversation-name';
+        name.textContent = conv.name || '新对话';
+        
+        const time = document.createElement('div');
+        time.className = 'conversation-time';
+        time.textContent = record.timeText;
 
-            const deleteBtn = menu.querySelector('.conversation-delete-btn');
-            deleteBtn.addEventListener('click', async (e) => {
-                e.stopPropagation();
-                this.closeAllConversationMenus();
-                await this.handleDeleteConversation(conv.id, conv.name || '新对话');
-            });
+        const actions = document.createElement('div');
+        actions.className = 'conversation-actions';
 
-            if (!this.isMultiSelectMode) {
-                actions.appendChild(menuBtn);
-                actions.appendChild(menu);
-            }
+        const menuBtn = document.createElement('button');
+        menuBtn.className = 'conversation-menu-btn';
+        menuBtn.type = 'button';
+        menuBtn.title = '更多操作';
+        menuBtn.innerHTML = '<svg width="14" height="14" viewBox="0 0 24 24" fill="currentColor"><circle cx="12" cy="5" r="2"/><circle cx="12" cy="12" r="2"/><circle cx="12" cy="19" r="2"/></svg>';
 
-            main.appendChild(name);
-            main.appendChild(time);
-            
-            item.appendChild(main);
-            if (!this.isMultiSelectMode) {
-                item.appendChild(actions);
-            }
-            
-            item.addEventListener('click', () => {
-                if (this.isMultiSelectMode) {
-                    const nextChecked = !this.selectedConversationIds.has(conv.id);
-                    this.toggleConversationSelection(conv.id, nextChecked);
-                    const checkbox = item.querySelector('.conversation-item-select');
-                    if (checkbox) {
-                        checkbox.checked = nextChecked;
-                    }
-                    item.classList.toggle('active', nextChecked);
-                    return;
+        const menu = document.createElement('div');
+        menu.className = 'conversation-item-menu';
+        menu.innerHTML = '<button type="button" class="conversation-delete-btn" title="删除会话"><svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M3 6h18M8 6V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6"/><path d="M10 11v6M14 11v6"/></svg></button>';
+
+        menuBtn.addEventListener('click', (e) => {
+            e.stopPropagation();
+            this.toggleConversationMenu(menu);
+        });
+
+        menu.addEventListener('click', (e) => e.stopPropagation());
+
+        const deleteBtn = menu.querySelector('.conversation-delete-btn');
+        deleteBtn.addEventListener('click', async (e) => {
+            e.stopPropagation();
+            this.closeAllConversationMenus();
+            await this.handleDeleteConversation(conv.id, conv.name || '新对话');
+        });
+
+        if (!record.selectMode) {
+            actions.appendChild(menuBtn);
+            actions.appendChild(menu);
+        }
+
+        main.appendChild(name);
+        main.appendChild(time);
+        
+        item.appendChild(main);
+        if (!record.selectMode) {
+            item.appendChild(actions);
+        }
+        
+        item.addEventListener('click', () => {
+            if (this.isMultiSelectMode) {
+                const nextChecked = !this.selectedConversationIds.has(conv.id);
+                this.toggleConversationSelection(conv.id, nextChecked);
+                const checkbox = item.querySelector('.conversation-item-select');
+                if (checkbox) {
+                    checkbox.checked = nextChecked;
                 }
-                this.loadConversation(conv.id);
-            });
-            
-            this.conversationList.appendChild(item);
+                item.classList.toggle('active', nextChecked);
+                return;
+            }
+            this.loadConversation(conv.id);
         });
 
-        this.updateBulkActionsBar();
+        return item;
     }
 
     toggleConversationMenu(menuElement) {
@@ -2940,6 +3730,8 @@ class ChatBot {
                 throw new Error('Failed to delete conversation');
             }
 
+            this.conversationVirtualList.remove(conversationId);
+            this.conversationCache.delete(this.getMessagesCacheKey(conversationId));
             if (this.conversationId === conversationId) {
                 this.clearChat();
             }
@@ -2988,44 +3780,160 @@ class ChatBot {
             this.closeSidebarPanel();
             
             // 清空当前聊天
-            this.chatMessages.innerHTML = '';
+            this.resetMessageList();
             this.conversationId = conversationId;
-            
-            // 显示加载提示
-            const loadingId = this.showTypingIndicator();
-            
-            // 加载会话消息
-            const response = await fetch(`/api/v1/conversations/${conversationId}/messages?user=${this.userId}`);
-            if (!response.ok) {
-                throw new Error('Failed to load messages');
+            const generation = this.historyGeneration;
+            const cacheKey = this.getMessagesCacheKey(conversationId);
+
+            // 有缓存时立即渲染，否则显示加载提示
+            const cached = await this.conversationCache.get(cacheKey);
+            if (generation !== this.historyGeneration) {
+                return;
+            }
+            let loadingId = null;
+            if (cached) {
+                this.renderConversationPage(cached.data);
+            } else {
+                loadingId = this.showTypingIndicator();
             }
             
-            const data = await response.json();
-            this.removeMessage(loadingId);
-            
-            // 渲染消息
-            if (data.data && data.data.length > 0) {
-                // 按后端返回的顺序显示消息
-                const messages = data.data;
-                messages.forEach(msg => {
-                    // 显示用户消息
-                    if (msg.query) {
-                        this.addMessage(msg.query, 'user');
-                    }
-                    // 显示机器人回复
-                    if (msg.answer) {
-                        this.addMessage(msg.answer, 'bot', this.getDifyMessageId(msg), msg.query || '');
-                    }
-                });
+            // 加载会话消息（最新一页），带 ETag 后台校验
+            const { data, changed } = await this.fetchWithCache(
+                cacheKey,
+                this.buildConversationMessagesUrl(conversationId)
+            );
+            if (loadingId) {
+                this.removeMessage(loadingId);
+            }
+            if (generation !== this.historyGeneration) {
+                return;
             }
             
-            this.scrollToBottom();
+            if (!cached) {
+                this.renderConversationPage(data);
+            } else if (changed) {
+                this.mergeConversationPage(data);
+            }
         } catch (error) {
             console.error('Error loading conversation:', error);
             alert('加载会话失败，请重试');
         }
     }
     
+    buildConversationMessagesUrl(conversationId, firstId = null) {
+        const params = new URLSearchParams({ user: this.userId, limit: '20' });
+        if (firstId) {
+            params.set('first_id', firstId);
+        }
+        return `/api/v1/conversations/${conversationId}/messages?${params.toString()}`;
+    }
+
+    async fetchConversationMessages(conversationId, firstId = null) {
+        const response = await fetch(this.buildConversationMessagesUrl(conversationId, firstId));
+        if (!response.ok) {
+            throw new Error('Failed to load messages');
+        }
+
+        return response.json();
+    }
+
+    // 渲染消息：只登记记录，节点由虚拟列表按需创建
+    renderConversationPage(data) {
+        const messages = Array.isArray(data.data) ? data.data : [];
+        this.messageList.appendMany(this.buildHistoryEntries(messages));
+        this.historyFirstId = messages.length > 0 ? messages[0].id : null;
+        this.historyHasMore = Boolean(data.has_more);
+
+        this.addDisclaimerToLatestBotMessage();
+        this.scrollToBottom();
+    }
+
+    // 缓存已渲染后拿到新数据：按 key 对齐，只重建内容有变化的消息
+    mergeConversationPage(data) {
+        const list = this.messageList;
+        if (list.keys().some(key => !key.startsWith('hist_'))) {
+            // 用户已在此会话中继续提问，新的回合已在页面上
+            return;
+        }
+
+        const messages = Array.isArray(data.data) ? data.data : [];
+        const freshEntries = this.buildHistoryEntries(messages);
+        const freshKeys = new Set(freshEntries.map(entry => entry.key));
+        // 不在最新一页中的消息（向上翻页加载的、或被新回合挤到上一页的）保持原有顺序
+        const olderEntries = list.keys()
+            .filter(key => !freshKeys.has(key))
+            .map(key => ({ key, data: list.getData(key) }));
+
+        list.sync(olderEntries.concat(freshEntries), (previous, next) =>
+            previous.content === next.content
+            && (previous.feedbackRating || null) === (next.feedbackRating || null)
+            && previous.difyMessageId === next.difyMessageId
+        );
+        if (!olderEntries.length) {
+            this.historyFirstId = messages.length > 0 ? messages[0].id : null;
+            this.historyHasMore = Boolean(data.has_more);
+        }
+        this.addDisclaimerToLatestBotMessage();
+    }
+
+    // Dify 消息按时间正序返回，每条包含用户问题和机器人回复
+    buildHistoryEntries(messages, extra = {}) {
+        const entries = [];
+        messages.forEach((msg) => {
+            if (msg.query) {
+                entries.push({
+                    key: `hist_${msg.id}_q`,
+                    data: { type: 'user', content: msg.query, ...extra }
+                });
+            }
+            if (msg.answer) {
+                entries.push({
+                    key: `hist_${msg.id}_a`,
+                    data: {
+                        type: 'bot',
+                        content: msg.answer,
+                        difyMessageId: this.getDifyMessageId(msg),
+                        userQuestion: msg.query || '',
+                        feedbackRating: msg.feedback?.rating || null,
+                        prerendered: msg.rendered || null,
+                        ...extra
+                    }
+                });
+            }
+        });
+        return entries;
+    }
+
+    // 滚动接近顶部时加载更早的一页历史消息
+    async loadOlderMessages() {
+        if (!this.conversationId || !this.historyHasMore || !this.historyFirstId || this.historyLoading) {
+            return;
+        }
+
+        const conversationId = this.conversationId;
+        const generation = this.historyGeneration;
+        this.historyLoading = true;
+        try {
+            const data = await this.fetchConversationMessages(conversationId, this.historyFirstId);
+            if (generation !== this.historyGeneration) {
+                return;
+            }
+
+            const messages = Array.isArray(data.data) ? data.data : [];
+            this.historyHasMore = Boolean(data.has_more) && messages.length > 0;
+            if (messages.length > 0) {
+                this.historyFirstId = messages[0].id;
+                this.messageList.prepend(this.buildHistoryEntries(messages, { restored: true }));
+            }
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        } finally {
+            if (generation === this.historyGeneration) {
+                this.historyLoading = false;
+            }
+        }
+    }
+    
     formatTimestamp(timestamp) {
         if (!timestamp) return '';
         
@@ -3055,7 +3963,7 @@ class ChatBot {
     }
     
     scrollToBottom() {
-        this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+        this.messageList.scrollToBottom();
     }
     
     addDisclaimerToLatestBotMessage() {
@@ -3063,10 +3971,9 @@ class ChatBot {
         const oldDisclaimers = this.chatMessages.querySelectorAll('.message-disclaimer');
         oldDisclaimers.forEach(disclaimer => disclaimer.remove());
         
-        // 找到最后一条机器人消息
-        const botMessages = this.chatMessages.querySelectorAll('.bot-message');
-        if (botMessages.length > 0) {
-            const latestBotMessage = botMessages[botMessages.length - 1];
+        // 找到最后一条机器人消息（未挂载时由 renderMessageRecord 在重建时补上）
+        const latestBotMessage = this.messageList.getNode(this.getLatestBotMessageKey());
+        if (latestBotMessage) {
             const contentDiv = latestBotMessage.querySelector('.message-content');
             
             if (contentDiv && !contentDiv.querySelector('.message-disclaimer')) {
@@ -0,0 +1,137 @@
+// Embed loader for host pages, served at /embed.js with the shell manifest filled in by the server
+// 宿主页面只加载本脚本（几 KB）并渲染启动按钮；聊天 iframe（index.html、chat.js、chat.css、头像、会话列表）在首次打开时才加载
+// 用法：<script src="https://<chat-host>/embed.js" data-employee-id="CN123456" async></script>
+// 可选属性：data-prefetch="idle"（空闲时预取外壳）、data-position="left"、data-width、data-height、data-title
+(function () {
+    'use strict';
+    if (window.EasyMesChat) {
+        return;
+    }
+
+    const SHELL = __SHELL_MANIFEST__;
+    const script = document.currentScript;
+    const origin = new URL(script ? script.src : '/', location.href).origin;
+    const options = (script && script.dataset) || {};
+    const side = options.position === 'left' ? 'left' : 'right';
+    const width = parseInt(options.width, 10) || 400;
+    const height = parseInt(options.height, 10) || 600;
+    const title = options.title || 'AI 助手';
+
+    let frameUrl = origin + '/';
+    if (options.employeeId) {
+        frameUrl += '?EmployeeId=' + encodeURIComponent(options.employeeId);
+    }
+
+    const style = document.createElement('style');
+    style.textContent = `
+.emc-launcher{position:fixed;bottom:24px;${side}:24px;z-index:2147483000;width:56px;height:56px;border:none;border-radius:50%;
+background:#ff000f;color:#fff;cursor:pointer;box-shadow:0 6px 20px rgba(0,0,0,.2);
+display:flex;align-items:center;justify-content:center;padding:0}
+.emc-launcher:focus-visible{outline:3px solid rgba(255,0,15,.35);outline-offset:2px}
+.emc-panel{position:fixed;bottom:92px;${side}:24px;z-index:2147483000;width:${width}px;height:${height}px;
+max-width:calc(100vw - 32px);max-height:calc(100vh - 116px);border-radius:12px;overflow:hidden;background:#fff;
+box-shadow:0 12px 40px rgba(0,0,0,.2);display:none}
+.emc-panel.emc-open{display:block}
+.emc-panel iframe{width:100%;height:100%;border:0}
+@media (max-width:600px){.emc-panel{inset:0;width:auto;height:auto;max-width:none;max-height:none;border-radius:0}
+.emc-panel.emc-open+.emc-launcher{bottom:auto;top:12px;width:40px;height:40px}}`;
+
+    const panel = document.createElement('div');
+    panel.className = 'emc-panel';
+    const launcher = document.createElement('button');
+    launcher.type = 'button';
+    launcher.className = 'emc-launcher';
+    launcher.setAttribute('aria-label', title);
+    launcher.setAttribute('aria-expanded', 'false');
+    launcher.title = title;
+    const chatIcon = '<svg width="28" height="28" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M21 15a2 2 0 0 1-2 2H7l-4 4V5a2 2 0 0 1 2-2h14a2 2 0 0 1 2 2z"/></svg>';
+    const closeIcon = '<svg width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M18 6L6 18M6 6l12 12"/></svg>';
+    launcher.innerHTML = chatIcon;
+
+    const hinted = new Set();
+    function addHint(rel, href) {
+        const key = rel + ' ' + href;
+        if (hinted.has(key)) {
+            return;
+        }
+        hinted.add(key);
+        const link = document.createElement('link');
+        link.rel = rel;
+        link.href = href;
+        document.head.appendChild(link);
+    }
+
+    // 悬停/聚焦时提前建立连接（DNS + TCP + TLS），点击时省去握手
+    function preconnect() {
+        addHint('preconnect', origin);
+    }
+
+    // 空闲时把外壳文件预取进 HTTP 缓存，首次打开只剩接口请求
+    function prefetchShell() {
+        preconnect();
+        addHint('prefetch', frameUrl);
+        SHELL.assets.forEach((asset) => {
+            if (asset !== '/') {
+                addHint('prefetch', origin + asset);
+            }
+        });
+    }
+
+    let frame = null;
+    function open() {
+        if (!frame) {
+            // 首次打开才创建 iframe，聊天页面及其数据请求从这里开始
+            frame = document.createElement('iframe');
+            frame.src = frameUrl;
+            frame.title = title;
+            frame.allow = 'clipboard-write';
+            panel.appendChild(frame);
+        }
+        panel.classList.add('emc-open');
+        launcher.setAttribute('aria-expanded', 'true');
+        launcher.innerHTML = closeIcon;
+    }
+
+    function close() {
+        panel.classList.remove('emc-open');
+        launcher.setAttribute('aria-expanded', 'false');
+        launcher.innerHTML = chatIcon;
+    }
+
+    function toggle() {
+        if (panel.classList.contains('emc-open')) {
+            close();
+        } else {
+            open();
+        }
+    }
+
+    launcher.addEventListener('pointerenter', preconnect, { once: true });
+    launcher.addEventListener('focus', preconnect, { once: true });
+    launcher.addEventListener('touchstart', preconnect, { once: true, passive: true });
+    launcher.addEventListener('click', toggle);
+
+    function mount() {
+        document.head.appendChild(style);
+        document.body.appendChild(panel);
+        document.body.appendChild(launcher);
+        if (options.prefetch === 'idle') {
+            const idle = window.requestIdleCallback || ((callback) => setTimeout(callback, 2000));
+            const schedule = () => idle(prefetchShell, { timeout: 10000 });
+            // 等宿主页面加载完成后再预取，不与宿主页面抢带宽
+            if (document.readyState === 'complete') {
+                schedule();
+            } else {
+                window.addEventListener('load', schedule, { once: true });
+            }
+        }
+    }
+
+    if (document.body) {
+        mount();
+    } else {
+        document.addEventListener('DOMContentLoaded', mount, { once: true });
+    }
+
+    window.EasyMesChat = { open, close, toggle, version: SHELL.version };
+})();
@@ -0,0 +1,110 @@
+// Service worker for the chat UI, served at /sw.js with the manifest filled in by the server
+// 应用外壳（index.html、css、js、图标）按版本预缓存并优先从缓存返回，iframe 打开时不再等网络
+// 外壳内容变化后 sw.js 随之变化，浏览器在后台安装新版本，下次打开生效
+// 头像按 avatar_ttl_seconds 缓存；聊天、SSE 流及其他接口一律直连网络
+const SHELL = __SHELL_MANIFEST__;
+const SHELL_CACHE = `shell-${SHELL.version}`;
+const AVATAR_CACHE = 'avatars-v1';
+const AVATAR_CACHE_MAX_ENTRIES = 200;
+const CACHED_AT_HEADER = 'X-SW-Cached-At';
+
+self.addEventListener('install', (event) => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(SHELL_CACHE);
+        // cache: 'reload' 跳过 HTTP 缓存，保证拿到与版本号一致的文件
+        await cache.addAll(SHELL.assets.map((url) => new Request(url, { cache: 'reload' })));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter((name) => name.startsWith('shell-') && name !== SHELL_CACHE)
+            .map((name) => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+// 版本握手：页面对比 bootstrap 返回的 shell_version，不一致时触发 registration.update()
+self.addEventListener('message', (event) => {
+    if (event.data && event.data.type === 'get-shell-version' && event.ports[0]) {
+        event.ports[0].postMessage({ version: SHELL.version });
+    }
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (request.mode === 'navigate') {
+        if (url.pathname === '/') {
+            // URL 上的 EmployeeId 等参数不影响页面内容
+            event.respondWith(shellFirst(request, { ignoreSearch: true }));
+        }
+        return;
+    }
+    if (SHELL.assets.includes(url.pathname + url.search)) {
+        event.respondWith(shellFirst(request));
+        return;
+    }
+    if (url.pathname === '/api/v1/avatar') {
+        event.respondWith(avatarWithTtl(request));
+    }
+});
+
+async function shellFirst(request, options = {}) {
+    const cache = await caches.open(SHELL_CACHE);
+    const cached = await cache.match(request, options);
+    if (cached) {
+        return cached;
+    }
+    return fetch(request);
+}
+
+async function avatarWithTtl(request) {
+    const cache = await caches.open(AVATAR_CACHE);
+    const cached = await cache.match(request);
+    const cachedAt = cached ? Number(cached.headers.get(CACHED_AT_HEADER) || 0) : 0;
+    if (cached && Date.now() - cachedAt < SHELL.avatar_ttl_seconds * 1000) {
+        return cached;
+    }
+
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            await storeAvatar(cache, request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        // 网络不可用时过期头像也比占位图好
+        if (cached) {
+            return cached;
+        }
+        throw error;
+    }
+}
+
+async function storeAvatar(cache, request, response) {
+    const headers = new Headers(response.headers);
+    headers.set(CACHED_AT_HEADER, String(Date.now()));
+    const body = await response.blob();
+    await cache.put(request, new Response(body, {
+        status: response.status,
+        statusText: response.statusText,
+        headers
+    }));
+
+    // 超出上限时按写入顺序淘汰最早的条目
+    const keys = await cache.keys();
+    if (keys.length > AVATAR_CACHE_MAX_ENTRIES) {
+        await Promise.all(keys.slice(0, keys.length - AVATAR_CACHE_MAX_ENTRIES).map((key) => cache.delete(key)));
+    }
+}
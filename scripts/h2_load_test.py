@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Open many concurrent chat streams and report how many connections carried them.
+
+Over HTTP/2 all streams share one connection; over HTTP/1.1 (--http1) they
+are capped at --max-connections, like a browser's six per origin, and
+later streams wait for a free connection before their first event.
+
+Examples:
+    # App started with APP_SERVER=hypercorn (cleartext h2c)
+    python scripts/h2_load_test.py --url http://localhost:8010 --streams 50
+    # Same load over HTTP/1.1 with a browser-like connection cap
+    python scripts/h2_load_test.py --url http://localhost:8010 --streams 50 --http1
+    # TLS with a self-signed certificate
+    python scripts/h2_load_test.py --url https://localhost:8010 --insecure
+
+Requires httpx with HTTP/2 support (the h2 package, installed with hypercorn).
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+
+async def run_stream(client: httpx.AsyncClient, base_url: str, index: int, args, started_at: float) -> dict:
+    payload = {
+        # Distinct users per stream and per run, so in-flight deduplication
+        # neither merges the streams nor replays a previous run
+        "user": f"{args.user_prefix}-{args.run_id}-{index}",
+        "query": args.query,
+        "conversation_id": "",
+        "inputs": {},
+    }
+    result = {"index": index, "first_event": None, "events": 0, "error": None}
+    try:
+        async with client.stream("POST", f"{base_url}/api/v1/chat/stream", json=payload) as response:
+            result["http_version"] = response.http_version
+            network_stream = response.extensions.get("network_stream")
+            result["connection"] = network_stream.get_extra_info("client_addr") if network_stream else None
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                if result["first_event"] is None:
+                    result["first_event"] = time.perf_counter() - started_at
+                result["events"] += 1
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["finished"] = time.perf_counter() - started_at
+    return result
+
+
+async def main(args) -> int:
+    base_url = args.url.rstrip("/")
+    args.run_id = int(time.time())
+    cleartext = base_url.startswith("http://")
+    client = httpx.AsyncClient(
+        # Cleartext HTTP/2 needs prior knowledge (h2c), so HTTP/1.1 is disabled for it.
+        http1=args.http1 or not cleartext,
+        http2=not args.http1,
+        verify=not args.insecure,
+        limits=httpx.Limits(max_connections=args.max_connections),
+        timeout=httpx.Timeout(args.timeout, connect=10.0),
+    )
+    started_at = time.perf_counter()
+    async with client:
+        results = await asyncio.gather(*(
+            run_stream(client, base_url, index, args, started_at) for index in range(args.streams)
+        ))
+    elapsed = time.perf_counter() - started_at
+
+    failed = [r for r in results if r["error"]]
+    first_events = sorted(r["first_event"] for r in results if r["first_event"] is not None)
+    connections = {r.get("connection") for r in results if r.get("connection")}
+    versions = sorted({r.get("http_version") for r in results if r.get("http_version")})
+
+    print(f"Streams:        {args.streams} ({len(failed)} failed) in {elapsed:.2f}s")
+    print(f"HTTP versions:  {', '.join(versions) or '-'}")
+    print(f"Connections:    {len(connections)}")
+    print(f"Events:         {sum(r['events'] for r in results)}")
+    if first_events:
+        p95 = first_events[min(len(first_events) - 1, int(len(first_events) * 0.95))]
+        print(
+            f"First event:    min {first_events[0] * 1000:.0f}ms, "
+            f"median {statistics.median(first_events) * 1000:.0f}ms, "
+            f"p95 {p95 * 1000:.0f}ms, max {first_events[-1] * 1000:.0f}ms"
+        )
+    for r in failed[:5]:
+        print(f"  stream {r['index']}: {r['error']}")
+    return 1 if failed else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent chat stream load test (HTTP/2 vs HTTP/1.1)")
+    parser.add_argument("--url", default="http://localhost:8010", help="App base URL")
+    parser.add_argument("--streams", type=int, default=50, help="Concurrent chat streams")
+    parser.add_argument("--query", default="你好", help="Query sent on every stream")
+    parser.add_argument("--user-prefix", default="loadtest", help="Streams use users <prefix>-<run>-<n>")
+    parser.add_argument("--http1", action="store_true", help="Use HTTP/1.1 instead of HTTP/2")
+    parser.add_argument("--max-connections", type=int, default=6, help="Connection cap (browsers use 6 per origin)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Read timeout per stream in seconds")
+    parser.add_argument("--insecure", action="store_true", help="Skip TLS certificate verification")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+Replay captured Dify sessions through the proxy from a local stand-in upstream.
+
+Sessions come from CAPTURE_DIR (see app/services/traffic_capture.py). The
+stand-in upstream answers POST /v1/chat-messages with the captured status,
+time to headers and SSE lines, sleeping the captured gaps divided by
+--speed. Sessions are started at their captured spacing (also divided by
+--speed, idle gaps capped by --max-gap), or all at once with --burst.
+
+For every session the report compares the time to the first forwarded
+event and the total duration against what the upstream alone accounts
+for, so the difference is the proxy's own overhead under that load.
+
+Examples:
+    # Start the proxy against the stand-in and replay at 4x
+    python scripts/replay_capture.py data/capture/capture-20261019.jsonl.gz --start-proxy --speed 4
+    # Proxy already running with DIFY_API_URL=http://127.0.0.1:18999/v1
+    python scripts/replay_capture.py data/capture/*.jsonl.gz --proxy http://localhost:8010 --burst
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Carried in Dify inputs so the stand-in knows which session a request replays;
+# it also keeps in-flight deduplication from merging identical captured queries.
+REPLAY_INPUT_KEY = "_replay_session"
+
+
+def load_sessions(paths: List[str], limit: Optional[int]) -> List[Dict[str, Any]]:
+    sessions = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    sessions.append(json.loads(line))
+    sessions.sort(key=lambda session: session["captured_at"])
+    return sessions[:limit] if limit else sessions
+
+
+def build_upstream(sessions: List[Dict[str, Any]], speed: float) -> Starlette:
+    async def chat_messages(request: Request):
+        payload = await request.json()
+        index = (payload.get("inputs") or {}).get(REPLAY_INPUT_KEY)
+        if not isinstance(index, int) or not 0 <= index < len(sessions):
+            return JSONResponse({"message": "unknown replay session"}, status_code=404)
+        session = sessions[index]
+
+        await asyncio.sleep((session.get("headers_ms") or 0) / 1000 / speed)
+        status = session.get("status") or 200
+        if status != 200:
+            return JSONResponse({"message": session.get("error", "replayed error")}, status_code=status)
+
+        async def events():
+            previous_ms = session.get("headers_ms") or 0
+            for offset_ms, line in session["events"]:
+                await asyncio.sleep(max(offset_ms - previous_ms, 0) / 1000 / speed)
+                previous_ms = offset_ms
+                yield line + "\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def not_captured(request: Request):
+        return Response(status_code=404)
+
+    return Starlette(routes=[
+        Route("/v1/chat-messages", chat_messages, methods=["POST"]),
+        Route("/v1/{path:path}", not_captured, methods=["GET", "POST", "DELETE"]),
+    ])
+
+
+def upstream_expectation(session: Dict[str, Any], speed: float) -> Dict[str, Optional[float]]:
+    """Time to first event and total duration the replayed upstream alone accounts for."""
+    events = session["events"]
+    first_ms = events[0][0] if events else None
+    last_ms = events[-1][0] if events else session.get("headers_ms") or 0
+    return {
+        "first_event": first_ms / 1000 / speed if first_ms is not None else None,
+        "duration": last_ms / 1000 / speed,
+    }
+
+
+async def replay_session(client: httpx.AsyncClient, proxy: str, index: int, session: Dict[str, Any]) -> Dict[str, Any]:
+    payload = {
+        "query": session.get("query") or "replay",
+        "user": session.get("user") or "replay",
+        "conversation_id": "",
+        "inputs": {**(session.get("inputs") or {}), REPLAY_INPUT_KEY: index},
+    }
+    started_at = time.perf_counter()
+    result = {"index": index, "first_event": None, "events": 0, "error": None}
+    try:
+        async with client.stream("POST", f"{proxy}/api/v1/chat/stream", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                # The proxy's own trace_context and heartbeats are not upstream events
+                if event.get("event") in ("trace_context", "ping"):
+                    continue
+                if result["first_event"] is None:
+                    result["first_event"] = time.perf_counter() - started_at
+                result["events"] += 1
+                if event.get("event") == "error":
+                    result["error"] = event.get("error") or "error event"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["duration"] = time.perf_counter() - started_at
+    return result
+
+
+async def wait_for_proxy(proxy: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(f"{proxy}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Proxy at {proxy} did not become healthy")
+            await asyncio.sleep(0.5)
+
+
+def summarize(label: str, values: List[float]) -> str:
+    if not values:
+        return f"{label}: -"
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return (
+        f"{label}: median {statistics.median(values) * 1000:.0f}ms, "
+        f"p95 {p95 * 1000:.0f}ms, max {values[-1] * 1000:.0f}ms"
+    )
+
+
+async def main(args) -> int:
+    sessions = load_sessions(args.files, args.limit)
+    if not sessions:
+        print("No captured sessions found")
+        return 1
+    print(f"Loaded {len(sessions)} session(s), replaying at {args.speed}x")
+
+    server = uvicorn.Server(uvicorn.Config(
+        build_upstream(sessions, args.speed), host="127.0.0.1", port=args.upstream_port, log_level="warning"
+    ))
+    upstream_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if upstream_task.done():
+            print(f"Stand-in upstream could not start on port {args.upstream_port}")
+            return 1
+        await asyncio.sleep(0.05)
+
+    proxy_process = None
+    data_dir = None
+    if args.start_proxy:
+        # Replayed turns must not reach the real history mirror, suggestion index or other data/ state
+        data_dir = tempfile.mkdtemp(prefix="replay-proxy-")
+        env = {
+            **os.environ,
+            "DIFY_API_URL": f"http://127.0.0.1:{args.upstream_port}/v1",
+            "DIFY_UPSTREAMS": "",
+            # Replays must not be captured again
+            "CAPTURE_DIR": "",
+            "HISTORY_STORE_ENABLED": "false",
+            "SUGGEST_ENABLED": "false",
+            "HISTORY_DB_PATH": os.path.join(data_dir, "history.db"),
+            "SUGGEST_SNAPSHOT_PATH": os.path.join(data_dir, "suggestions.json"),
+            "RENDER_CACHE_SPILL_DIR": os.path.join(data_dir, "render_cache"),
+            "FEEDBACK_SPOOL_PATH": os.path.join(data_dir, "feedback_spool.json"),
+            "AVATAR_CACHE_DIR": os.path.join(data_dir, "avatars"),
+            "TRACE_EXPORT_PATH": "",
+        }
+        env.setdefault("DIFY_API_KEY", "replay")
+        proxy_process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.proxy_port)],
+            env=env,
+            cwd=pathlib.Path(__file__).resolve().parent.parent,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        proxy = f"http://127.0.0.1:{args.proxy_port}"
+    else:
+        proxy = args.proxy.rstrip("/")
+        print(f"Stand-in upstream on http://127.0.0.1:{args.upstream_port}/v1 (the proxy's DIFY_API_URL)")
+
+    try:
+        await wait_for_proxy(proxy)
+        started = [datetime.fromisoformat(session["captured_at"]) for session in sessions]
+        async with httpx.AsyncClient(timeout=httpx.Timeout(600.0, connect=10.0), limits=httpx.Limits(max_connections=None)) as client:
+            tasks = []
+            for index, session in enumerate(sessions):
+                if not args.burst and index > 0:
+                    gap = (started[index] - started[index - 1]).total_seconds()
+                    await asyncio.sleep(min(gap, args.max_gap) / args.speed)
+                tasks.append(asyncio.create_task(replay_session(client, proxy, index, session)))
+            results = await asyncio.gather(*tasks)
+    finally:
+        if proxy_process is not None:
+            proxy_process.terminate()
+            proxy_process.wait(timeout=10)
+        if data_dir is not None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        server.should_exit = True
+        await upstream_task
+
+    first_event_overhead = []
+    duration_overhead = []
+    failed = []
+    for result in results:
+        session = sessions[result["index"]]
+        expected = upstream_expectation(session, args.speed)
+        if result["error"] and session.get("outcome") == "completed":
+            failed.append(result)
+        if result["first_event"] is not None and expected["first_event"] is not None:
+            first_event_overhead.append(result["first_event"] - expected["first_event"])
+        duration_overhead.append(result["duration"] - expected["duration"])
+
+    print(f"Sessions:   {len(results)} ({len(failed)} failed that completed in production)")
+    print(f"Events:     {sum(r['events'] for r in results)} forwarded")
+    print(summarize("Proxy overhead to first event", first_event_overhead))
+    print(summarize("Proxy overhead to end of stream", duration_overhead))
+    for result in failed[:5]:
+        print(f"  session {result['index']} ({sessions[result['index']]['trace_id']}): {result['error']}")
+    return 1 if failed else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay captured Dify sessions through the proxy")
+    parser.add_argument("files", nargs="+", help="capture-*.jsonl.gz files")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time scale: 1 = real time, 4 = four times faster")
+    parser.add_argument("--burst", action="store_true", help="Start all sessions at once instead of at their captured spacing")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="Cap in seconds on idle time between captured sessions")
+    parser.add_argument("--limit", type=int, help="Replay only the first N sessions")
+    parser.add_argument("--upstream-port", type=int, default=18999, help="Port of the stand-in upstream")
+    parser.add_argument("--proxy", default="http://localhost:8010", help="Running proxy to replay through")
+    parser.add_argument("--start-proxy", action="store_true", help="Start the proxy (uvicorn) against the stand-in")
+    parser.add_argument("--proxy-port", type=int, default=18010, help="Port for --start-proxy")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,5 @@
+"""Test configuration: the settings module needs a Dify endpoint to import."""
+import os
+
+os.environ.setdefault("DIFY_API_URL", "http://127.0.0.1:9/v1")
+os.environ.setdefault("DIFY_API_KEY", "test")
@@ -0,0 +1,69 @@
+"""Regression tests for in-flight stream deduplication."""
+import asyncio
+
+from app.services.inflight import InflightRegistry
+
+
+async def _stream(started: asyncio.Event, teardown: asyncio.Event):
+    started.set()
+    try:
+        yield "first"
+        await asyncio.Event().wait()
+    finally:
+        # Like the httpx teardown in stream_message: cancellation reaches the pump only after this
+        await teardown.wait()
+
+
+async def _next(queue: asyncio.Queue):
+    return await asyncio.wait_for(queue.get(), timeout=1.0)
+
+
+def test_leaving_before_the_pump_runs_forgets_the_stream():
+    async def scenario():
+        registry = InflightRegistry()
+        teardown = asyncio.Event()
+        teardown.set()
+        queue, stream, _ = registry.subscribe("key", "t1", lambda: _stream(asyncio.Event(), teardown))
+        # The pump task has not run yet, so cancel() stops it before its body
+        registry.unsubscribe(stream, queue)
+        await asyncio.gather(stream.task, return_exceptions=True)
+        assert registry.stats()["streams"] == 0
+
+        queue, stream, attached = registry.subscribe("key", "t2", lambda: _stream(asyncio.Event(), teardown))
+        assert not attached
+        assert await _next(queue) == ("chunk", "first")
+        registry.unsubscribe(stream, queue)
+        await asyncio.gather(stream.task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_arriving_during_cancellation_is_not_left_hanging():
+    async def scenario():
+        registry = InflightRegistry()
+        started, teardown = asyncio.Event(), asyncio.Event()
+        queue, stream, _ = registry.subscribe("key", "t1", lambda: _stream(started, teardown))
+        await started.wait()
+        assert await _next(queue) == ("chunk", "first")
+        registry.unsubscribe(stream, queue)
+        await asyncio.sleep(0)
+        assert not stream.task.done()
+
+        # Arrives while the cancelled upstream is still tearing down: starts its own stream
+        late_queue, late_stream, attached = registry.subscribe(
+            "key", "t2", lambda: _stream(asyncio.Event(), teardown)
+        )
+        assert not attached
+        assert late_stream is not stream
+        assert await _next(late_queue) == ("chunk", "first")
+
+        # Subscribers still attached when a cancellation lands get a terminal event
+        late_stream.task.cancel()
+        teardown.set()
+        await asyncio.gather(stream.task, late_stream.task, return_exceptions=True)
+        kind, _ = await _next(late_queue)
+        assert kind == "error"
+        assert not late_stream.subscribers
+        assert registry.stats()["streams"] == 0
+
+    asyncio.run(scenario())